@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Circuit breaker for redis connections
+
+A circuit breaker stops calls to a dependency after repeated connection
+failures or timeouts, so requests fail immediately instead of each waiting on
+a socket timeout while the dependency is unavailable. Once `reset_timeout_sec`
+has passed a single probe call is let through: the breaker closes again if it
+succeeds and stays open otherwise.
+
+The breaker is attached to the connections of a redis client, so every token
+manager and rate limit counter manager sharing the client shares its breaker.
+Whether callers admit requests (fail open) or reject them (fail closed) while
+the dependency is unavailable is configured per breaker with `fail_open`.
+
+Example usage:
+```
+breaker = CircuitBreaker("session-store", fail_open=True)
+redis_client = connect_to_redis(circuit_breaker=breaker)
+```
+
+"""
+import time
+import threading
+from enum import Enum
+from redis.connection import Connection, UnixDomainSocketConnection
+from redis import exceptions
+from bottle_utils.src.monitoring.logging import LogMixin
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SEC = 10
+
+
+class CircuitState(Enum):
+    """State of a circuit breaker"""
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitOpenException(exceptions.ConnectionError):
+    """Call rejected without reaching the dependency as the circuit is open"""
+
+
+class CircuitBreaker(LogMixin):
+    """Thread-safe circuit breaker for one dependency
+
+    Args:
+        name (str): name of the dependency, used in logs and errors
+        failure_threshold (int): consecutive failures opening the circuit
+        reset_timeout_sec (float): time the circuit stays open before a probe
+        fail_open (bool): whether callers should admit requests while the
+            dependency is unavailable
+        clock (Callable): monotonic clock in seconds
+
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout_sec=DEFAULT_RESET_TIMEOUT_SEC,
+        fail_open=False,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.fail_open = fail_open
+        self.clock = clock
+        self.failures = 0
+        self.rejections = 0
+        self.trips = 0
+        self._opened_at = None
+        self._probe_owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Current CircuitState"""
+        with self._lock:
+            return self._get_state()
+
+    def allow_request(self, owner=None):
+        """Checks whether a call may reach the dependency
+
+        Args:
+            owner: object making the call. Only the owner of the half-open probe
+                may make further calls until the probe completes
+
+        Returns:
+            Bool
+
+        """
+        with self._lock:
+            state = self._get_state()
+            if state == CircuitState.CLOSED:
+                return True
+
+            if state == CircuitState.HALF_OPEN:
+                if self._probe_owner is None:
+                    self._probe_owner = owner if owner is not None else object()
+                    return True
+
+                if owner is not None and self._probe_owner is owner:
+                    return True
+
+            self.rejections += 1
+            return False
+
+    def record_success(self):
+        """Records a successful call, closing the circuit"""
+        with self._lock:
+            if self._opened_at is not None:
+                self.log.info("Circuit closed", dependency=self.name)
+
+            self.failures = 0
+            self._opened_at = None
+            self._probe_owner = None
+
+    def record_failure(self):
+        """Records a failed call, opening the circuit past the failure threshold"""
+        with self._lock:
+            self.failures += 1
+            probe_failed = self._probe_owner is not None
+            if probe_failed or (
+                self._opened_at is None and self.failures >= self.failure_threshold
+            ):
+                if not probe_failed:
+                    self.trips += 1
+                    self.log.error(
+                        "Circuit opened", dependency=self.name, failures=self.failures
+                    )
+
+                self._opened_at = self.clock()
+                self._probe_owner = None
+
+    def check(self, owner=None):
+        """Raises if a call may not reach the dependency
+
+        Raises:
+            CircuitOpenException: circuit is open
+
+        """
+        if not self.allow_request(owner):
+            raise CircuitOpenException(f"Circuit open for {self.name}")
+
+    def stats(self):
+        """State along with failure, rejection and trip counters
+
+        Returns:
+            Dict
+
+        """
+        with self._lock:
+            return {
+                "state": self._get_state().name,
+                "failures": self.failures,
+                "rejections": self.rejections,
+                "trips": self.trips,
+            }
+
+    def _get_state(self):
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+
+        if self.clock() - self._opened_at >= self.reset_timeout_sec:
+            return CircuitState.HALF_OPEN
+
+        return CircuitState.OPEN
+
+
+class CircuitBreakerConnectionMixin:
+    """Redis connection reporting connection failures and timeouts to a breaker
+
+    Only connection errors and timeouts count as failures, errors returned by
+    redis for a command (such as WRONGTYPE) do not
+
+    """
+
+    def __init__(self, circuit_breaker=None, **kwargs):
+        super().__init__(**kwargs)
+        self.circuit_breaker = circuit_breaker
+
+    def connect(self):
+        if self._sock or self.circuit_breaker is None:
+            return super().connect()
+
+        self.circuit_breaker.check(self)
+        try:
+            return super().connect()
+
+        except (exceptions.ConnectionError, exceptions.TimeoutError):
+            self.circuit_breaker.record_failure()
+            raise
+
+    def send_packed_command(self, command, check_health=True):
+        if self.circuit_breaker is None:
+            return super().send_packed_command(command, check_health)
+
+        self.circuit_breaker.check(self)
+        try:
+            return super().send_packed_command(command, check_health)
+
+        except (exceptions.ConnectionError, exceptions.TimeoutError):
+            self.circuit_breaker.record_failure()
+            raise
+
+    def read_response(self, *args, **kwargs):
+        if self.circuit_breaker is None:
+            return super().read_response(*args, **kwargs)
+
+        try:
+            response = super().read_response(*args, **kwargs)
+
+        except (exceptions.ConnectionError, exceptions.TimeoutError):
+            self.circuit_breaker.record_failure()
+            raise
+
+        except exceptions.ResponseError:
+            self.circuit_breaker.record_success()
+            raise
+
+        self.circuit_breaker.record_success()
+        return response
+
+
+class CircuitBreakerConnection(CircuitBreakerConnectionMixin, Connection):
+    """TCP redis connection guarded by a circuit breaker"""
+
+
+class CircuitBreakerUnixDomainSocketConnection(
+    CircuitBreakerConnectionMixin, UnixDomainSocketConnection
+):
+    """Unix socket redis connection guarded by a circuit breaker"""
+
+
+def get_circuit_breaker(redis_client):
+    """Gets the circuit breaker guarding the connections of a redis client
+
+    Args:
+        redis_client (redis.StrictRedis): client to get the breaker of
+
+    Returns:
+        CircuitBreaker or None if the client is not guarded
+
+    """
+    pool = getattr(redis_client, "connection_pool", None)
+    if pool is None:
+        return None
+
+    return pool.connection_kwargs.get("circuit_breaker")
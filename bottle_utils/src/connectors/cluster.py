@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Redis Cluster connectors
+
+Token and counter managers detect cluster clients and build keys with hash
+tags so that keys used together (a session and its user/session mapping, the
+windows of a multi window rate limit) always map to the same cluster slot.
+
+"""
+import sys
+import time
+import structlog
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
+from bottle_utils.src.connectors.pool import (
+    DEFAULT_HEALTH_CHECK_INTERVAL_SEC,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_REDIS_PORT,
+    DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC,
+    DEFAULT_SOCKET_TIMEOUT_SEC,
+)
+
+log = structlog.get_logger(__name__)
+
+
+def is_cluster_client(redis_client):
+    """Checks whether a redis client talks to a Redis Cluster
+
+    Args:
+        redis_client: blocking or asyncio redis client
+
+    Returns:
+        Bool
+
+    """
+    if isinstance(redis_client, RedisCluster):
+        return True
+
+    # Only asyncio services load redis.asyncio, so the check must not import it
+    async_cluster = sys.modules.get("redis.asyncio.cluster")
+    return async_cluster is not None and isinstance(
+        redis_client, async_cluster.RedisCluster
+    )
+
+
+def group_keys_by_slot(keys):
+    """Groups keys by the cluster slot they map to
+
+    Args:
+        keys (List[str]): keys to group
+
+    Returns:
+        Dict[int, List[int]]: positions in `keys` of the keys of each slot
+
+    """
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key_slot(key.encode("utf8")), []).append(index)
+
+    return groups
+
+
+def apply_health_check_interval(health_check_interval_sec):
+    """Builds a connect callback setting the health check interval of connections
+
+    RedisCluster drops `health_check_interval` from the arguments it passes to
+    its node clients, so the interval is set on each node connection when the
+    connection is opened instead
+
+    Args:
+        health_check_interval_sec (int): idle time after which a connection is
+            checked with a PING before use
+
+    Returns:
+        Callable: callback taking the connection that was just opened
+
+    """
+
+    def on_connect(connection):
+        connection.health_check_interval = health_check_interval_sec
+        # The connection was just opened, so it needs no check before its first use
+        connection.next_health_check = time.time() + health_check_interval_sec
+
+    return on_connect
+
+
+def create_redis_cluster(
+    host,
+    port=DEFAULT_REDIS_PORT,
+    password=None,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    socket_timeout_sec=DEFAULT_SOCKET_TIMEOUT_SEC,
+    socket_connect_timeout_sec=DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC,
+    health_check_interval_sec=DEFAULT_HEALTH_CHECK_INTERVAL_SEC,
+):
+    """Creates a client of a Redis Cluster
+
+    Args:
+        host (str): host of any node of the cluster
+        port (int): port of the node
+        password (str): redis password
+        max_connections (int): maximum number of open connections per node
+        socket_timeout_sec (float): timeout of commands
+        socket_connect_timeout_sec (float): timeout of new connections
+        health_check_interval_sec (int): idle time after which a connection is
+            checked with a PING before use
+
+    Returns:
+        redis.cluster.RedisCluster
+
+    Notes:
+        - The rest of the cluster is discovered from the given node
+        - Circuit breakers are not supported on cluster connections
+
+    """
+    log.info("Connecting to redis cluster...")
+    return RedisCluster(
+        host=host,
+        port=port,
+        password=password,
+        max_connections=max_connections,
+        socket_timeout=socket_timeout_sec,
+        socket_connect_timeout=socket_connect_timeout_sec,
+        redis_connect_func=apply_health_check_interval(health_check_interval_sec),
+    )
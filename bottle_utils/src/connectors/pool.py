@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Managed redis connection pools
+
+Blocking connection pools with bounded size, socket timeouts, health checks and
+keepalive, which drop connections inherited from the parent process right
+after a fork so that preforked workers (e.g. gunicorn) never share sockets.
+Pools keep utilization counters so they can be sized from observed usage.
+
+Example usage:
+```
+pool = create_redis_pool(host="redis", max_connections=20)
+redis_client = StrictRedis(connection_pool=pool)
+pool.stats()
+```
+
+"""
+import os
+import time
+import weakref
+import threading
+from redis import BlockingConnectionPool
+from redis import exceptions
+from bottle_utils.src.connectors.breaker import (
+    CircuitBreakerConnection,
+    CircuitBreakerUnixDomainSocketConnection,
+)
+
+DEFAULT_REDIS_PORT = 6379
+DEFAULT_MAX_CONNECTIONS = 50
+DEFAULT_POOL_TIMEOUT_SEC = 1
+DEFAULT_SOCKET_TIMEOUT_SEC = 1
+DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC = 1
+DEFAULT_HEALTH_CHECK_INTERVAL_SEC = 30
+
+
+# Pools of the process, held weakly so tracking them does not keep them alive
+_pools = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class ManagedConnectionPool(BlockingConnectionPool):
+    """Blocking connection pool tracking utilization and reset after fork
+
+    Accepts the arguments of redis.BlockingConnectionPool
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def reset(self):
+        super().reset()
+        with self._stats_lock:
+            self.peak_in_use = 0
+            self.waits = 0
+            self.wait_time_sec = 0.0
+            self.timeouts = 0
+
+    def reset_after_fork(self):
+        """Closes connections inherited from the parent process and resets"""
+        for connection in self._connections:
+            # Only closes the file descriptors of the child, as the connections
+            # were created by the parent process
+            connection.disconnect()
+
+        self.reset()
+
+    def get_connection(self, command_name, *keys, **options):
+        waited = self.pool.empty()
+        started_at = time.monotonic()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+
+        except exceptions.ConnectionError:
+            waited_sec = time.monotonic() - started_at
+            with self._stats_lock:
+                self.waits += waited
+                self.wait_time_sec += waited_sec
+                if waited and self.timeout is not None and waited_sec >= self.timeout:
+                    self.timeouts += 1
+            raise
+
+        with self._stats_lock:
+            self.waits += waited
+            if waited:
+                self.wait_time_sec += time.monotonic() - started_at
+
+            self.peak_in_use = max(self.peak_in_use, self.get_in_use())
+
+        return connection
+
+    def get_in_use(self):
+        """Number of connections currently checked out of the pool"""
+        return self.max_connections - self.pool.qsize()
+
+    def stats(self):
+        """Utilization of the pool
+
+        Returns:
+            Dict: max connections, connections created, in use and idle, peak in
+                use, number and total time of waits for a free connection, and
+                number of waits that timed out
+
+        """
+        with self._stats_lock:
+            in_use = self.get_in_use()
+            return {
+                "max_connections": self.max_connections,
+                "created": len(self._connections),
+                "in_use": in_use,
+                "idle": len(self._connections) - in_use,
+                "peak_in_use": self.peak_in_use,
+                "waits": self.waits,
+                "wait_time_sec": self.wait_time_sec,
+                "timeouts": self.timeouts,
+            }
+
+
+def create_redis_pool(
+    host=None,
+    port=DEFAULT_REDIS_PORT,
+    password=None,
+    unix_socket_path=None,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    pool_timeout_sec=DEFAULT_POOL_TIMEOUT_SEC,
+    socket_timeout_sec=DEFAULT_SOCKET_TIMEOUT_SEC,
+    socket_connect_timeout_sec=DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC,
+    health_check_interval_sec=DEFAULT_HEALTH_CHECK_INTERVAL_SEC,
+    socket_keepalive=True,
+    circuit_breaker=None,
+):
+    """Creates a managed pool of redis connections
+
+    Args:
+        host (str): redis host, ignored if unix_socket_path is set
+        port (int): redis port
+        password (str): redis password
+        unix_socket_path (str): path of the redis unix socket
+        max_connections (int): maximum number of open connections
+        pool_timeout_sec (float): time to wait for a free connection before
+            raising redis.ConnectionError
+        socket_timeout_sec (float): timeout of commands
+        socket_connect_timeout_sec (float): timeout of new TCP connections
+        health_check_interval_sec (int): idle time after which a connection is
+            checked with a PING before use
+        socket_keepalive (bool): enable TCP keepalive
+        circuit_breaker (CircuitBreaker): breaker guarding the connections
+
+    Returns:
+        ManagedConnectionPool
+
+    """
+    connection_kwargs = {
+        "password": password,
+        "socket_timeout": socket_timeout_sec,
+        "health_check_interval": health_check_interval_sec,
+        "circuit_breaker": circuit_breaker,
+    }
+    if unix_socket_path is not None:
+        connection_class = CircuitBreakerUnixDomainSocketConnection
+        connection_kwargs["path"] = unix_socket_path
+    else:
+        connection_class = CircuitBreakerConnection
+        connection_kwargs.update(
+            host=host,
+            port=port,
+            socket_connect_timeout=socket_connect_timeout_sec,
+            socket_keepalive=socket_keepalive,
+        )
+
+    return ManagedConnectionPool(
+        max_connections=max_connections,
+        timeout=pool_timeout_sec,
+        connection_class=connection_class,
+        **connection_kwargs,
+    )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Startup readiness checks for backing services
+
+Connectors wait for their backend with exponential backoff and jitter. The first
+retries come within a fraction of a second, so a worker starting alongside its
+database is ready as soon as the database is, while workers of a replica set
+retrying against a backend that is still down spread their attempts out
+instead of retrying in lockstep.
+
+Example usage:
+```
+database = wait_until_ready(
+    lambda: SqliteDatabase("test.db"), ping=ping_database, name="database"
+)
+```
+
+"""
+import time
+import random
+import structlog
+
+log = structlog.get_logger(__name__)
+
+DEFAULT_READY_TIMEOUT_SEC = 100
+DEFAULT_INITIAL_DELAY_SEC = 0.05
+DEFAULT_MAX_DELAY_SEC = 5
+
+
+def get_backoff_delay(
+    attempt,
+    initial_delay_sec=DEFAULT_INITIAL_DELAY_SEC,
+    max_delay_sec=DEFAULT_MAX_DELAY_SEC,
+):
+    """Delay before a retry, doubling with each attempt up to a maximum
+
+    Args:
+        attempt (int): number of failed attempts so far, starting at 1
+        initial_delay_sec (float): delay after the first failed attempt
+        max_delay_sec (float): maximum delay between attempts
+
+    Returns:
+        float: delay in seconds, drawn between half and all of the backoff
+
+    """
+    delay = min(initial_delay_sec * 2 ** (attempt - 1), max_delay_sec)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def wait_until_ready(
+    connect,
+    ping=None,
+    name="backend",
+    timeout_sec=DEFAULT_READY_TIMEOUT_SEC,
+    retry_exceptions=(Exception,),
+    initial_delay_sec=DEFAULT_INITIAL_DELAY_SEC,
+    max_delay_sec=DEFAULT_MAX_DELAY_SEC,
+    sleep=time.sleep,
+    clock=time.monotonic,
+):
+    """Connects to a backend, retrying until it answers a ping
+
+    Args:
+        connect (Callable): returns a client of the backend
+        ping (Callable): called with the client, raises if the backend is not
+            ready. The client is only checked by `connect` if not set
+        name (str): name of the backend in logs
+        timeout_sec (float): time to wait for the backend to be ready
+        retry_exceptions (Tuple): exceptions of `connect` and `ping` signalling
+            that the backend is not ready yet. Other exceptions are raised
+        initial_delay_sec (float): delay after the first failed attempt
+        max_delay_sec (float): maximum delay between attempts
+        sleep (Callable): sleeps for a number of seconds
+        clock (Callable): monotonic clock in seconds
+
+    Returns:
+        the client returned by `connect`
+
+    Raises:
+        TimeoutError: backend not ready after `timeout_sec` seconds
+
+    """
+    deadline = clock() + timeout_sec
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            client = connect()
+            if ping is not None:
+                ping(client)
+
+            if attempt > 1:
+                log.info("Backend ready", backend=name, attempts=attempt)
+
+            return client
+
+        except retry_exceptions as exc:
+            remaining_sec = deadline - clock()
+            if remaining_sec <= 0:
+                log.error("Backend not ready", backend=name, attempts=attempt)
+                raise TimeoutError(f"{name} connection attempts timed out") from exc
+
+            delay_sec = min(
+                get_backoff_delay(attempt, initial_delay_sec, max_delay_sec),
+                remaining_sec,
+            )
+            log.info("Waiting for backend", backend=name, error=str(exc))
+            sleep(delay_sec)
@@ -9,19 +9,35 @@ import os
 import structlog
 
 from redis import StrictRedis
-from redislite import Redis
+from redis import exceptions
+from bottle_utils.src.connectors.pool import (
+    DEFAULT_HEALTH_CHECK_INTERVAL_SEC,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_POOL_TIMEOUT_SEC,
+    DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC,
+    DEFAULT_SOCKET_TIMEOUT_SEC,
+    create_redis_pool,
+)
+from bottle_utils.src.connectors.cluster import create_redis_cluster
+from bottle_utils.src.connectors.readiness import (
+    DEFAULT_READY_TIMEOUT_SEC,
+    wait_until_ready,
+)
 
 log = structlog.get_logger(__name__)
 
 LOCAL_REDIS_FILENAME = "redis.db"
 
 
-def connect_to_redis():
+def connect_to_redis(circuit_breaker=None):
     """
     Establishes a connection to the redis session store
 
+    Args:
+        circuit_breaker (CircuitBreaker): breaker guarding the connections
+
     Returns:
-        redis.StrictRedis
+        redis.StrictRedis or redis.cluster.RedisCluster
 
     Notes:
         Edits application in place
@@ -29,15 +45,76 @@ def connect_to_redis():
             SESSION_STORE_HOST (name of contiainer with redis)
             SESSION_STORE_PORT (open port for redis connection)
             SESSION_PASS (password for redis database)
+        Optional Environment variables:
+            SESSION_STORE_SOCKET_TIMEOUT_SEC (timeout of commands)
+            SESSION_STORE_CONNECT_TIMEOUT_SEC (timeout of new connections)
+            SESSION_STORE_MAX_CONNECTIONS (connections per worker process)
+            SESSION_STORE_POOL_TIMEOUT_SEC (wait for a free connection)
+            SESSION_STORE_HEALTH_CHECK_INTERVAL_SEC (idle time before a PING)
+            SESSION_STORE_CLUSTER (set to "true" to connect to a Redis Cluster
+                through the SESSION_STORE_HOST node)
+            SESSION_STORE_READY_TIMEOUT_SEC (wait for redis to answer a PING)
+        The connection pool is reset in forked worker processes
+        Startup pings do not go through `circuit_breaker`
     """
-    log.info("Connecting to redis...")
-    redis_conn = StrictRedis(
+    settings = dict(
         host=os.environ.get("SESSION_STORE_HOST"),
         port=int(os.environ.get("SESSION_STORE_PORT")),
         password=os.environ.get("SESSION_PASS"),
+        max_connections=int(
+            os.environ.get("SESSION_STORE_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+        ),
+        socket_timeout_sec=float(
+            os.environ.get(
+                "SESSION_STORE_SOCKET_TIMEOUT_SEC", DEFAULT_SOCKET_TIMEOUT_SEC
+            )
+        ),
+        socket_connect_timeout_sec=float(
+            os.environ.get(
+                "SESSION_STORE_CONNECT_TIMEOUT_SEC", DEFAULT_SOCKET_CONNECT_TIMEOUT_SEC
+            )
+        ),
+        health_check_interval_sec=int(
+            os.environ.get(
+                "SESSION_STORE_HEALTH_CHECK_INTERVAL_SEC",
+                DEFAULT_HEALTH_CHECK_INTERVAL_SEC,
+            )
+        ),
+    )
+    ready_settings = dict(
+        ping=lambda redis_conn: redis_conn.ping(),
+        name="redis",
+        timeout_sec=float(
+            os.environ.get("SESSION_STORE_READY_TIMEOUT_SEC", DEFAULT_READY_TIMEOUT_SEC)
+        ),
+        retry_exceptions=(
+            exceptions.ConnectionError,
+            exceptions.TimeoutError,
+            exceptions.RedisClusterException,
+        ),
+    )
+    if os.environ.get("SESSION_STORE_CLUSTER", "").lower() == "true":
+        # Cluster clients read the slot map of the cluster when created
+        return wait_until_ready(
+            lambda: create_redis_cluster(**settings), **ready_settings
+        )
+
+    log.info("Connecting to redis...")
+    # Pings bypass the circuit breaker, so failures while redis starts do not
+    # leave the circuit open once it is ready
+    ready_pool = create_redis_pool(**dict(settings, max_connections=1))
+    wait_until_ready(lambda: StrictRedis(connection_pool=ready_pool), **ready_settings)
+    ready_pool.disconnect()
+
+    pool = create_redis_pool(
+        pool_timeout_sec=float(
+            os.environ.get("SESSION_STORE_POOL_TIMEOUT_SEC", DEFAULT_POOL_TIMEOUT_SEC)
+        ),
+        circuit_breaker=circuit_breaker,
+        **settings,
     )
     log.info("Connected to redis!")
-    return redis_conn
+    return StrictRedis(connection_pool=pool)
 
 
 def connect_to_redislite_local():
@@ -50,8 +127,12 @@ def connect_to_redislite_local():
 
     Notes:
         Creates a file locally to act as a local redis database
+        redislite is imported on first use, as it bundles a redis server and
+        is not installed in production
 
     """
+    from redislite import Redis
+
     log.info("Connecting to redislite (local)...")
     redis_conn = Redis(LOCAL_REDIS_FILENAME)
     log.info("Connected to redis!")
@@ -6,17 +6,32 @@ Connectors for both remote and local SQL based databases
 
 Currently Supported: 
     Local: 
-        - SQLite
+        - SQLite (optionally tuned or shared in-memory)
     Remote: 
-        - Postgres
+        - Postgres (optionally pooled)
+
+Pooled databases hand out one connection per thread from a bounded pool, and
+the DatabaseConnectionPlugin checks a connection out for the duration of each
+request so threaded servers reuse connections instead of opening new ones.
+
+Example usage:
+```
+database = connect_to_db(pooled=True)
+app.install(DatabaseConnectionPlugin(database))
+```
 
 """
 import os
 import time
+import functools
+import threading
 import structlog
 
+from bottle import abort
 from peewee import OperationalError, SqliteDatabase
 from playhouse.db_url import connect
+from playhouse.pool import MaxConnectionsExceeded
+from bottle_utils.src.connectors.readiness import wait_until_ready
 
 
 log = structlog.get_logger(__name__)
@@ -24,12 +39,41 @@ log = structlog.get_logger(__name__)
 LOCAL_SQLITE_FILENAME = "test.db"
 TEST_TIMEOUT = 100
 
+DEFAULT_DB_MAX_CONNECTIONS = 20
+DEFAULT_DB_STALE_TIMEOUT_SEC = 300
+DEFAULT_DB_WAIT_TIMEOUT_SEC = 5
+
+DATABASE_CONFIG_KEY = "database"
+
+# Write-ahead logging lets readers run alongside the single writer, and with
+# synchronous=NORMAL commits only sync the log at checkpoints. Durable against
+# application crashes, the last commits may be lost on power loss
+SQLITE_PERFORMANCE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "memory",
+}
+# Journaling and memory mapping do not apply to in-memory databases
+SQLITE_MEMORY_PRAGMAS = {
+    "cache_size": -64 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "memory",
+}
 
-def connect_to_db():
+
+def connect_to_db(pooled=None):
     """Established a connection to a Postgresql database
 
+    Args:
+        pooled (bool): connect through a pool of connections shared by the
+            threads of the process. Defaults to the DB_POOLED environment
+            variable being set to "true"
+
     Returns:
-        peewee.PostgresqlDatabase
+        peewee.PostgresqlDatabase or playhouse.pool.PooledPostgresqlDatabase
 
     Raises:
         TimeoutError: couldnt connect to database after ${DB_TIMEOUT} seconds
@@ -37,65 +81,239 @@ def connect_to_db():
     Note:
         Requires a number of environment variables to be set
         [DB_TIMEOUT, DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME]
+        Optional Environment variables of pooled databases:
+            DB_MAX_CONNECTIONS (connections per worker process)
+            DB_STALE_TIMEOUT_SEC (age after which idle connections are closed)
+            DB_WAIT_TIMEOUT_SEC (whole seconds to wait for a free connection,
+                peewee 3.14 and later wait forever on 0)
     """
-    log.debug("CONNECTING TO DATABASE")
-    wait_time = 0
-    timeout = int(os.environ.get("DB_TIMEOUT", 100))
-    while wait_time < timeout:
-        try:
-            database = connect(
-                "postgresql://{}:{}@{}:{}/{}".format(
-                    os.environ.get("DB_USER"),
-                    os.environ.get("DB_PASS"),
-                    os.environ.get("DB_HOST"),
-                    os.environ.get("DB_PORT"),
-                    os.environ.get("DB_NAME"),
-                )
-            )
-            break
+    if pooled is None:
+        pooled = os.environ.get("DB_POOLED", "").lower() == "true"
 
-        except OperationalError:
-            log.info("Waiting for database")
-            time.sleep(5)
-            wait_time += 5
+    scheme, pool_settings = "postgresql", {}
+    if pooled:
+        scheme = "postgresql+pool"
+        pool_settings = dict(
+            max_connections=int(
+                os.environ.get("DB_MAX_CONNECTIONS", DEFAULT_DB_MAX_CONNECTIONS)
+            ),
+            stale_timeout=int(
+                os.environ.get("DB_STALE_TIMEOUT_SEC", DEFAULT_DB_STALE_TIMEOUT_SEC)
+            ),
+            timeout=int(
+                os.environ.get("DB_WAIT_TIMEOUT_SEC", DEFAULT_DB_WAIT_TIMEOUT_SEC)
+            ),
+        )
 
-    if wait_time > timeout:
-        log.error("Failed to connect to database")
-        raise TimeoutError("Database connection attempts timed out")
+    database = connect(
+        "{}://{}:{}@{}:{}/{}".format(
+            scheme,
+            os.environ.get("DB_USER"),
+            os.environ.get("DB_PASS"),
+            os.environ.get("DB_HOST"),
+            os.environ.get("DB_PORT"),
+            os.environ.get("DB_NAME"),
+        ),
+        **pool_settings,
+    )
 
+    log.debug("CONNECTING TO DATABASE", pooled=pooled)
+    wait_until_ready(
+        lambda: database,
+        ping=ping_database,
+        name="database",
+        timeout_sec=int(os.environ.get("DB_TIMEOUT", 100)),
+        retry_exceptions=(OperationalError,),
+    )
     log.info("CONNECTED TO DATABASE")
 
     return database
 
 
-def connect_to_sqlite_local_db():
+def connect_to_sqlite_local_db(
+    filename=LOCAL_SQLITE_FILENAME, tuned=None, shared_memory_name=None
+):
     """
     Established a connection to a local SQLite database for testing
 
+    Args:
+        filename (str): path of the database file
+        tuned (bool): apply SQLITE_PERFORMANCE_PRAGMAS. Defaults to the
+            SQLITE_TUNED environment variable being set to "true"
+        shared_memory_name (str): open a named in-memory database shared by
+            all connections of the process instead of `filename`
+
     Returns:
         peewee.SqliteDatabase
 
     Raises:
         TimeoutError: couldnt connect to database after 100 seconds
 
+    Notes:
+        - Pragmas are applied to every new connection
+        - A shared in-memory database is dropped once its last connection is
+          closed, so keep one connection open for as long as it is needed
+
     """
-    log.debug("CONNECTING TO DATABASE (LOCAL TEST)")
-    wait_time = 0
-    timeout = TEST_TIMEOUT
-    while wait_time < timeout:
-        try:
-            database = SqliteDatabase(LOCAL_SQLITE_FILENAME)
-            break
+    if tuned is None:
+        tuned = os.environ.get("SQLITE_TUNED", "").lower() == "true"
+
+    settings = {}
+    if shared_memory_name is not None:
+        filename = f"file:{shared_memory_name}?mode=memory&cache=shared"
+        settings["uri"] = True
 
-        except OperationalError:
-            log.info("Waiting for database")
-            time.sleep(5)
-            wait_time += 5
+    if tuned:
+        settings["pragmas"] = (
+            SQLITE_MEMORY_PRAGMAS
+            if shared_memory_name is not None
+            else SQLITE_PERFORMANCE_PRAGMAS
+        )
 
-    if wait_time > timeout:
-        log.error("Failed to connect to (local) database")
-        raise TimeoutError("Database connection attempts timed out")
+    database = SqliteDatabase(filename, **settings)
 
+    log.debug("CONNECTING TO DATABASE (LOCAL TEST)", tuned=tuned)
+    wait_until_ready(
+        lambda: database,
+        ping=ping_database,
+        name="database (local)",
+        timeout_sec=TEST_TIMEOUT,
+        retry_exceptions=(OperationalError,),
+    )
     log.info("CONNECTED TO DATABASE (LOCAL TEST)")
 
     return database
+
+
+def ping_database(database):
+    """Runs a trivial query to check that the database accepts connections
+
+    Args:
+        database (peewee.Database): database to check
+
+    Raises:
+        peewee.OperationalError: database not reachable
+
+    Notes:
+        - Connections opened for the check are closed (or returned to the pool)
+          afterwards
+
+    """
+    opened = database.is_closed()
+    database.connect(reuse_if_open=True)
+    try:
+        database.execute_sql("SELECT 1")
+
+    finally:
+        if opened:
+            database.close()
+
+
+class DatabaseConnectionPlugin:
+    """Bottle plugin holding a database connection for the duration of requests
+
+    A connection is opened (or checked out of the pool) before the route
+    callback runs and closed (or returned to the pool) once it returns, so
+    connections are never held by idle threads. Requests that can not get a
+    pooled connection within the wait timeout get a 503 response.
+
+    Args:
+        database (peewee.Database): database to connect to, usually pooled
+
+    Notes:
+        - Routes not using the database opt out with `database=False` route
+          config
+        - Transactions left open by a route are rolled back before its
+          connection is closed
+
+    """
+
+    name = "database"
+    api = 2
+
+    def __init__(self, database):
+        self.database = database
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.wait_time_sec = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def apply(self, callback, route):
+        """Wraps a route callback in a database connection"""
+        if route.config.get(DATABASE_CONFIG_KEY, True) is False:
+            return callback
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            started_at = time.monotonic()
+            try:
+                self.database.connect(reuse_if_open=True)
+
+            except MaxConnectionsExceeded:
+                with self._stats_lock:
+                    self.timeouts += 1
+
+                log.error("No free database connection", route=route.rule)
+                return abort(503, "Database unavailable")
+
+            with self._stats_lock:
+                self.requests += 1
+                self.wait_time_sec += time.monotonic() - started_at
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+            try:
+                return callback(*args, **kwargs)
+
+            finally:
+                self._close(route)
+                with self._stats_lock:
+                    self.in_use -= 1
+
+        return wrapper
+
+    def _close(self, route):
+        """Closes the connection of a request, rolling back open transactions
+
+        Errors are logged rather than raised so they never replace the error
+        of the route
+        """
+        try:
+            if self.database.in_transaction():
+                log.error("Rolling back transaction left open", route=route.rule)
+                if not self.database.is_closed():
+                    self.database.rollback()
+
+                while self.database.in_transaction():
+                    self.database.pop_transaction()
+
+            if not self.database.is_closed():
+                self.database.close()
+
+        except Exception as exc:
+            log.error(
+                "Could not close database connection", route=route.rule, error=exc
+            )
+
+    def stats(self):
+        """Requests served and connections held by them
+
+        Only state kept by the plugin is reported, as peewee pools do not
+        expose their utilization publicly.
+
+        Returns:
+            Dict: requests served, total time spent getting a connection,
+                number of requests rejected for lack of a connection, and
+                connections currently and at peak held by requests
+
+        """
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "wait_time_sec": self.wait_time_sec,
+                "timeouts": self.timeouts,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+            }
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lua scripts implementing the rate limiting algorithms
+
+Each script checks and updates the state of one counter key in a single round
+trip and stores a constant amount of state per key. Scripts read the time from
+the redis server so that all workers share the same clock.
+
+All single window scripts take:
+    KEYS: counter key
+    ARGV: limit, period in milliseconds
+and return {allowed, remaining, retry after ms, reset after ms}
+
+"""
+from bottle_utils.src.counters.policies import RateLimitAlgorithm
+
+FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl < 0 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    ttl = tonumber(ARGV[2])
+end
+if count > limit then
+    return {0, 0, ttl, ttl}
+end
+return {1, limit - count, 0, ttl}
+"""
+
+# State: hash of the current window index and the counts of the current and
+# previous windows. The previous count is weighted by how much of it overlaps a
+# sliding window ending now.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local window = math.floor(now / period)
+
+local state = redis.call('HMGET', KEYS[1], 'window', 'current', 'previous')
+local last_window = tonumber(state[1]) or window
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if last_window < window then
+    if last_window == window - 1 then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+
+local elapsed = now - window * period
+local reset_after = period - elapsed
+local count = previous * (period - elapsed) / period + current
+if count + 1 > limit then
+    local retry_after = reset_after
+    if current + 1 <= limit and previous > 0 then
+        retry_after = math.ceil(period - (limit - current - 1) * period / previous)
+        retry_after = retry_after - elapsed
+    end
+    return {0, 0, retry_after, reset_after}
+end
+
+redis.call('HSET', KEYS[1], 'window', window, 'current', current + 1,
+    'previous', previous)
+redis.call('PEXPIRE', KEYS[1], period * 2)
+return {1, math.floor(limit - count - 1), 0, reset_after}
+"""
+
+# State: theoretical arrival time (TAT) of the next request in milliseconds.
+# Each request moves the TAT forward by one emission interval (period / rate)
+# and is admitted if the TAT stays within the burst tolerance of now.
+GCRA_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2]) / tonumber(ARGV[3])
+local tolerance = interval * burst
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - tolerance
+if now < allow_at then
+    return {0, 0, math.ceil(allow_at - now), math.ceil(tat - now)}
+end
+
+redis.call('SET', KEYS[1], string.format('%.3f', new_tat),
+    'PX', math.ceil(new_tat - now))
+return {1, math.floor((tolerance - (new_tat - now)) / interval), 0,
+    math.ceil(new_tat - now)}
+"""
+
+# Checks several fixed or sliding windows and counts the request against all of
+# them only if every window admits it
+#   KEYS: counter key of each window
+#   ARGV: 'fixed' or 'sliding', then limit and period in milliseconds per window
+# Returns: {allowed, index of the window that rejected the request or has the
+#   fewest remaining requests, remaining, retry after ms, reset after ms}
+MULTI_WINDOW_SCRIPT = """
+local sliding = ARGV[1] == 'sliding'
+local now = 0
+if sliding then
+    local time = redis.call('TIME')
+    now = time[1] * 1000 + math.floor(time[2] / 1000)
+end
+
+local states = {}
+local tripped = nil
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i])
+    local period = tonumber(ARGV[2 * i + 1])
+    local state = {limit = limit, period = period}
+    if sliding then
+        local stored = redis.call('HMGET', key, 'window', 'current', 'previous')
+        local window = math.floor(now / period)
+        local last_window = tonumber(stored[1]) or window
+        local current = tonumber(stored[2]) or 0
+        local previous = tonumber(stored[3]) or 0
+        if last_window < window then
+            if last_window == window - 1 then
+                previous = current
+            else
+                previous = 0
+            end
+            current = 0
+        end
+        local elapsed = now - window * period
+        state.window = window
+        state.current = current
+        state.previous = previous
+        state.count = previous * (period - elapsed) / period + current
+        state.reset = period - elapsed
+        state.retry = state.reset
+        if current + 1 <= limit and previous > 0 then
+            state.retry = math.ceil(period - (limit - current - 1) * period / previous)
+            state.retry = state.retry - elapsed
+        end
+    else
+        state.count = tonumber(redis.call('GET', key)) or 0
+        state.reset = redis.call('PTTL', key)
+        if state.reset < 0 then
+            state.count = 0
+            state.reset = period
+        end
+        state.retry = state.reset
+    end
+    if state.count + 1 > limit then
+        if tripped == nil or state.retry > states[tripped].retry then
+            tripped = i
+        end
+    end
+    states[i] = state
+end
+
+if tripped ~= nil then
+    return {0, tripped, 0, states[tripped].retry, states[tripped].reset}
+end
+
+local fewest = 1
+local fewest_remaining = nil
+for i, key in ipairs(KEYS) do
+    local state = states[i]
+    if sliding then
+        redis.call('HSET', key, 'window', state.window, 'current', state.current + 1,
+            'previous', state.previous)
+        redis.call('PEXPIRE', key, state.period * 2)
+    elseif state.count == 0 then
+        redis.call('SET', key, 1, 'PX', state.period)
+    else
+        redis.call('INCR', key)
+    end
+    local remaining = math.floor(state.limit - state.count - 1)
+    if fewest_remaining == nil or remaining < fewest_remaining then
+        fewest = i
+        fewest_remaining = remaining
+    end
+end
+return {1, fewest, fewest_remaining, 0, states[fewest].reset}
+"""
+
+ALGORITHM_SCRIPTS = {
+    RateLimitAlgorithm.FIXED_WINDOW: FIXED_WINDOW_SCRIPT,
+    RateLimitAlgorithm.SLIDING_WINDOW: SLIDING_WINDOW_SCRIPT,
+    RateLimitAlgorithm.GCRA: GCRA_SCRIPT,
+}
+
+
+def get_script_args(policy):
+    """Arguments of the script enforcing a policy
+
+    Args:
+        policy (RateLimitPolicy): policy to enforce
+
+    Returns:
+        List
+
+    """
+    args = [policy.limit, policy.period_ms]
+    if policy.algorithm == RateLimitAlgorithm.GCRA:
+        args.append(policy.rate)
+
+    return args
+
+
+def get_multi_window_script_args(policy):
+    """Arguments of the script enforcing a multi window policy
+
+    Args:
+        policy (MultiWindowPolicy): policy to enforce
+
+    Returns:
+        List
+
+    """
+    args = [
+        "sliding" if policy.algorithm == RateLimitAlgorithm.SLIDING_WINDOW else "fixed"
+    ]
+    for window in policy.windows:
+        args.extend(get_script_args(window))
+
+    return args
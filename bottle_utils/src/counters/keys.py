@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Key functions for rate limit counters
+
+A key function takes the bottle request and returns the part of the counter key
+identifying who or what is being limited. Keys are built from raw request
+values rather than hashes so they are cheap to compute and easy to inspect in
+redis, and they ignore the query string so clients can not bypass a limit by
+varying it.
+
+Example usage:
+```
+mgr = RateLimitCounterManager(
+    redis_client, key_func=combine_keys(key_by_subnet(ipv4_prefix=24), key_by_route)
+)
+```
+
+"""
+import functools
+import hashlib
+import ipaddress
+from bottle_utils.src.tokens.session import (
+    SESSION_COOKIE_NAME,
+    SESSION_ENVIRON_KEY,
+    InvalidSessionException,
+)
+from bottle_utils.src.tokens.token_manager import TokenException
+
+API_KEY_HEADER = "X-API-Key"
+KEY_SEPARATOR = "|"
+UNKNOWN_CLIENT = "-"
+
+
+def key_by_ip(request):
+    """Keys requests by client address"""
+    return request.remote_addr or UNKNOWN_CLIENT
+
+
+def key_by_route(request):
+    """Keys requests by method and route rule, e.g. `GET /users/<user_id>`
+
+    Falls back to the request path for requests not matched to a route
+    """
+    route = request.environ.get("bottle.route")
+    if route is None:
+        return f"{request.method} {request.path}"
+
+    return f"{route.method} {route.rule}"
+
+
+def key_by_subnet(ipv4_prefix=24, ipv6_prefix=64):
+    """Builds a key function keying requests by client subnet
+
+    Args:
+        ipv4_prefix (int): prefix length of IPv4 subnets
+        ipv6_prefix (int): prefix length of IPv6 subnets
+
+    Returns:
+        Callable
+
+    """
+
+    @functools.lru_cache(maxsize=4096)
+    def get_subnet(remote_addr):
+        try:
+            address = ipaddress.ip_address(remote_addr)
+
+        except ValueError:
+            return remote_addr
+
+        prefix = ipv4_prefix if address.version == 4 else ipv6_prefix
+        return str(ipaddress.ip_network((address, prefix), strict=False))
+
+    def key_func(request):
+        remote_addr = request.remote_addr
+        if not remote_addr:
+            return UNKNOWN_CLIENT
+
+        return get_subnet(remote_addr)
+
+    return key_func
+
+
+def key_by_session_user(request):
+    """Keys requests by the uuid of the session user, or by address without one
+
+    Notes:
+        - Rate limits are checked before the route callback, so this loads the
+          session from the session store. The session is kept in the request
+          environ for `session_auth` to reuse, so the request still reads the
+          store once, but routes without `session_auth` pay an extra read
+    """
+    session = request.environ.get(SESSION_ENVIRON_KEY)
+    if session is None:
+        token = request.get_cookie(SESSION_COOKIE_NAME, default=None)
+        if token is None:
+            return key_by_ip(request)
+
+        try:
+            # pylint: disable=no-member
+            session = request.app.session_mgr.get_session_from_token(token)
+
+        except (InvalidSessionException, TokenException):
+            return key_by_ip(request)
+
+        request.environ[SESSION_ENVIRON_KEY] = session
+
+    return f"user:{session.user_uuid}"
+
+
+def key_by_api_key(header_name=API_KEY_HEADER, is_known_key=None):
+    """Builds a key function keying requests by API key, or by address without one
+
+    API keys are hashed so that they are not stored in redis in the clear. Keys
+    must be authenticated, as a client sending a new made-up key with each
+    request would otherwise get a fresh counter each time. Pass `is_known_key`
+    unless keys are already checked before rate limiting, e.g. by a gateway
+
+    Args:
+        header_name (str): request header holding the API key
+        is_known_key (Callable): returns whether an API key is valid. Requests
+            with unknown keys are keyed by address
+
+    Returns:
+        Callable
+
+    """
+
+    def key_func(request):
+        api_key = request.get_header(header_name)
+        if not api_key or (is_known_key is not None and not is_known_key(api_key)):
+            return key_by_ip(request)
+
+        digest = hashlib.blake2b(api_key.encode("utf8"), digest_size=8).hexdigest()
+        return f"api:{digest}"
+
+    return key_func
+
+
+def combine_keys(*key_funcs):
+    """Builds a key function joining the keys of several key functions
+
+    Args:
+        key_funcs (Callable): key functions to combine
+
+    Returns:
+        Callable
+
+    """
+
+    def key_func(request):
+        return KEY_SEPARATOR.join(func(request) for func in key_funcs)
+
+    return key_func
+
+
+DEFAULT_KEY_FUNC = combine_keys(key_by_ip, key_by_route)
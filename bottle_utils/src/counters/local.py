@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""In-process rate limiting tier
+
+Token buckets kept in worker memory reject clearly abusive clients without a
+round trip to redis. Requests admitted locally are counted in memory and synced
+to a fixed window counter in redis in batches, so the limit stays roughly
+global across workers while most requests never wait on redis.
+
+Example usage:
+```
+limiter = HybridRateLimiter(
+    RateLimitCounterManager(redis_client),
+    RateLimitPolicy(100, period_sec=60),
+    max_unsynced=10,
+)
+result = limiter.check()
+```
+
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from bottle_utils.src.monitoring.logging import LogMixin
+from bottle_utils.src.connectors.cluster import group_keys_by_slot, is_cluster_client
+from bottle_utils.src.counters.policies import (
+    RateLimitAlgorithm,
+    RateLimitPolicy,
+    RateLimitResult,
+)
+
+DEFAULT_MAX_KEYS = 65536
+DEFAULT_MAX_UNSYNCED = 10
+DEFAULT_SYNC_INTERVAL_SEC = 0.1
+
+# Adds batched local counts to fixed window counters
+#   KEYS: counter keys
+#   ARGV: window length in milliseconds, then one increment per key
+# Returns: post-increment count and remaining window length in milliseconds of
+#   each key, flattened
+SYNC_COUNTERS_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local count = redis.call('INCRBY', key, ARGV[i + 1])
+    local ttl = redis.call('PTTL', key)
+    if ttl < 0 then
+        redis.call('PEXPIRE', key, ARGV[1])
+        ttl = tonumber(ARGV[1])
+    end
+    result[2 * i - 1] = count
+    result[2 * i] = ttl
+end
+return result
+"""
+
+
+class _KeyState:
+    """Local bucket and sync state of one counter key"""
+
+    __slots__ = ("tokens", "updated_at", "pending", "global_count", "window_ends_at")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated_at = now
+        self.pending = 0
+        self.global_count = 0
+        self.window_ends_at = 0
+
+
+class HybridRateLimiter(LogMixin):
+    """Rate limiter checking a local token bucket before a global redis counter
+
+    Args:
+        counter_mgr (RateLimitCounterManager): manager building counter keys and
+            holding the redis client
+        policy (RateLimitPolicy): fixed window limit to enforce across all
+            workers
+        local_burst (int): capacity of each local bucket. Defaults to the policy
+            limit, as a single worker admitting more would exceed the global limit
+        max_unsynced (int): requests admitted per key before counts are synced
+        sync_interval_sec (float): longest time between syncs while requests
+            are being admitted
+        max_keys (int): keys tracked locally, least recently used keys are
+            dropped along with their unsynced counts
+        background_sync (bool): sync counts from a daemon thread instead of
+            the request that triggers the sync
+        clock (Callable): monotonic clock in seconds
+
+    Notes:
+        - Each worker admits at most `max_unsynced` requests per key that redis
+          has not seen yet, so the global limit can be exceeded by up to
+          `max_unsynced` requests per worker and window. With `background_sync`
+          this bound is best-effort: requests keep being admitted while a sync
+          is waiting for the thread or in flight
+        - Keys found over the global limit are rejected locally until their
+          window resets
+        - Sync failures are logged and the counts retried on the next sync,
+          while requests keep being checked against the local buckets
+        - With a Redis Cluster client counts are synced with one call per slot
+        - Without `background_sync` the request triggering a sync waits for
+          the redis round trip, about one request per `max_unsynced` per key
+        - The background sync thread is started on the first sync, and again
+          in forked worker processes
+
+    """
+
+    def __init__(
+        self,
+        counter_mgr,
+        policy,
+        local_burst=None,
+        max_unsynced=DEFAULT_MAX_UNSYNCED,
+        sync_interval_sec=DEFAULT_SYNC_INTERVAL_SEC,
+        max_keys=DEFAULT_MAX_KEYS,
+        background_sync=False,
+        clock=time.monotonic,
+    ):
+        if max_unsynced < 1:
+            raise ValueError("max_unsynced must be positive")
+
+        if not isinstance(policy, RateLimitPolicy):
+            raise ValueError("policy must be a single window RateLimitPolicy")
+
+        if policy.algorithm != RateLimitAlgorithm.FIXED_WINDOW:
+            raise ValueError("policy must use the fixed window algorithm")
+
+        self.counter_mgr = counter_mgr
+        self.policy = policy
+        self.capacity = local_burst or policy.limit
+        self.refill_rate = policy.rate / policy.period_sec
+        self.max_unsynced = max_unsynced
+        self.sync_interval_sec = sync_interval_sec
+        self.max_keys = max_keys
+        self.background_sync = background_sync
+        self.clock = clock
+        self.local_rejections = 0
+        self.global_rejections = 0
+        self.syncs = 0
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sync = clock()
+        self._sync_requested = threading.Event()
+        self._sync_thread_lock = threading.Lock()
+        self._sync_pid = None
+        self._sync_script = counter_mgr.redis_client.register_script(
+            SYNC_COUNTERS_SCRIPT
+        )
+
+    def check(self, counter_key=None):
+        """Counts a request against the local bucket and the global limit
+
+        Args:
+            counter_key (str): key to count the request under. Defaults to the
+                key built by the counter manager for the current request
+
+        Returns:
+            RateLimitResult
+
+        """
+        if counter_key is None:
+            counter_key = self.counter_mgr.get_counter_key()
+
+        now = self.clock()
+        with self._lock:
+            state = self._get_state(counter_key, now)
+            state.tokens = min(
+                self.capacity,
+                state.tokens + (now - state.updated_at) * self.refill_rate,
+            )
+            state.updated_at = now
+
+            if state.tokens < 1:
+                self.local_rejections += 1
+                return self._rejected((1 - state.tokens) / self.refill_rate)
+
+            if state.window_ends_at <= now:
+                state.global_count = 0
+            elif state.global_count >= self.policy.limit:
+                self.global_rejections += 1
+                return self._rejected(state.window_ends_at - now)
+
+            state.tokens -= 1
+            state.pending += 1
+            remaining = self.policy.limit - state.global_count - state.pending
+            reset_sec = (self.capacity - state.tokens) / self.refill_rate
+            should_sync = (
+                state.pending >= self.max_unsynced
+                or now - self._last_sync >= self.sync_interval_sec
+            )
+
+        if should_sync:
+            if self.background_sync:
+                self._request_sync()
+            else:
+                self.sync()
+
+        return RateLimitResult(
+            allowed=True,
+            limit=self.policy.limit,
+            remaining=max(remaining, 0),
+            retry_after_sec=0,
+            reset_sec=reset_sec,
+        )
+
+    def sync(self):
+        """Adds unsynced local counts to the global counters in one round trip"""
+        with self._lock:
+            self._last_sync = self.clock()
+            pending = {
+                key: state.pending
+                for key, state in self._states.items()
+                if state.pending
+            }
+            for key in pending:
+                self._states[key].pending = 0
+
+        if not pending:
+            return
+
+        keys = [self.get_global_key(key) for key in pending]
+        try:
+            result = self._sync_counts(keys, list(pending.values()))
+
+        except Exception as exc:
+            self.log.error(exc)
+            with self._lock:
+                for key, count in pending.items():
+                    if key in self._states:
+                        self._states[key].pending += count
+            return
+
+        now = self.clock()
+        with self._lock:
+            self.syncs += 1
+            for index, key in enumerate(pending):
+                state = self._states.get(key)
+                if state is None:
+                    continue
+
+                state.global_count = result[2 * index]
+                state.window_ends_at = now + result[2 * index + 1] / 1000
+
+    def _request_sync(self):
+        if self._sync_pid != os.getpid():
+            with self._sync_thread_lock:
+                if self._sync_pid != os.getpid():
+                    self._sync_pid = os.getpid()
+                    threading.Thread(
+                        target=self._sync_forever, name="rate-limit-sync", daemon=True
+                    ).start()
+
+        self._sync_requested.set()
+
+    def _sync_forever(self):
+        while True:
+            self._sync_requested.wait()
+            self._sync_requested.clear()
+            try:
+                self.sync()
+
+            except Exception as exc:
+                self.log.error(exc)
+
+    def _sync_counts(self, keys, counts):
+        period_ms = self.policy.period_ms
+        if not is_cluster_client(self.counter_mgr.redis_client):
+            return self._sync_script(keys=keys, args=[period_ms, *counts])
+
+        result = [None] * (2 * len(keys))
+        for indexes in group_keys_by_slot(keys).values():
+            slot_result = self._sync_script(
+                keys=[keys[index] for index in indexes],
+                args=[period_ms, *[counts[index] for index in indexes]],
+            )
+            for position, index in enumerate(indexes):
+                result[2 * index : 2 * index + 2] = slot_result[
+                    2 * position : 2 * position + 2
+                ]
+
+        return result
+
+    def get_global_key(self, counter_key):
+        """Key of the global counter synced from local counts"""
+        return f"{counter_key}:hybrid"
+
+    def stats(self):
+        """Rejection and sync counters along with the number of tracked keys
+
+        Returns:
+            Dict
+
+        """
+        with self._lock:
+            return {
+                "local_rejections": self.local_rejections,
+                "global_rejections": self.global_rejections,
+                "syncs": self.syncs,
+                "keys": len(self._states),
+            }
+
+    def _get_state(self, counter_key, now):
+        state = self._states.get(counter_key)
+        if state is None:
+            state = self._states[counter_key] = _KeyState(self.capacity, now)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(counter_key)
+
+        return state
+
+    def _rejected(self, retry_after_sec):
+        return RateLimitResult(
+            allowed=False,
+            limit=self.policy.limit,
+            remaining=0,
+            retry_after_sec=retry_after_sec,
+            reset_sec=retry_after_sec,
+        )
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Rate limiting policies
+
+Policies describe how many requests a client may make to a route and which
+algorithm is used to enforce that limit.
+
+Currently supported algorithms:
+- Fixed window: `rate` requests per `period_sec` window, allows bursts of up to
+  twice the rate at window edges
+- Sliding window: weighted count of the current and previous windows, smooths
+  out bursts at window edges
+- GCRA: generic cell rate algorithm (token bucket) allowing bursts of `burst`
+  requests while enforcing an average of `rate` requests per `period_sec`
+
+Several fixed or sliding windows, such as per second, per minute and per day
+limits, can be combined into one MultiWindowPolicy checked in a single call.
+
+"""
+from enum import Enum
+from collections import namedtuple
+
+
+class RateLimitAlgorithm(Enum):
+    """Algorithm used to enforce a rate limit"""
+
+    FIXED_WINDOW = 0
+    SLIDING_WINDOW = 1
+    GCRA = 2
+
+
+class RateLimitPolicy:
+    """Limit on the rate of requests a client can make
+
+    Args:
+        rate (int): number of requests allowed per period
+        period_sec (float): length of the period in seconds
+        burst (int): maximum burst of requests (GCRA only). Defaults to rate
+        algorithm (RateLimitAlgorithm): algorithm enforcing the limit
+
+    """
+
+    def __init__(
+        self,
+        rate,
+        period_sec=1,
+        burst=None,
+        algorithm=RateLimitAlgorithm.FIXED_WINDOW,
+    ):
+        if not isinstance(algorithm, RateLimitAlgorithm):
+            raise ValueError("algorithm must be a valid RateLimitAlgorithm")
+
+        if rate <= 0 or period_sec <= 0 or (burst is not None and burst <= 0):
+            raise ValueError("rate, period_sec and burst must be positive")
+
+        self.rate = rate
+        self.period_sec = period_sec
+        self.burst = burst or rate
+        self.algorithm = algorithm
+
+    @property
+    def limit(self):
+        """Maximum number of requests admitted at once"""
+        if self.algorithm == RateLimitAlgorithm.GCRA:
+            return self.burst
+
+        return self.rate
+
+    @property
+    def period_ms(self):
+        """Length of the period in milliseconds"""
+        return max(int(self.period_sec * 1000), 1)
+
+    def __repr__(self):
+        return (
+            f"RateLimitPolicy(rate={self.rate}, period_sec={self.period_sec}, "
+            f"burst={self.burst}, algorithm={self.algorithm.name})"
+        )
+
+
+class MultiWindowPolicy:
+    """Limits on the rate of requests over several windows at once
+
+    A request is admitted only if every window admits it, and is then counted
+    against all of them
+
+    Args:
+        windows (List[RateLimitPolicy]): limit of each window, all using the same
+            fixed or sliding window algorithm
+
+    """
+
+    def __init__(self, windows):
+        windows = list(windows)
+        if not windows:
+            raise ValueError("windows must not be empty")
+
+        algorithms = {window.algorithm for window in windows}
+        if len(algorithms) > 1 or RateLimitAlgorithm.GCRA in algorithms:
+            raise ValueError("windows must all use the same window algorithm")
+
+        if len({window.period_ms for window in windows}) < len(windows):
+            raise ValueError("windows must have distinct periods")
+
+        self.windows = windows
+        self.algorithm = windows[0].algorithm
+
+    @property
+    def limit(self):
+        """Maximum number of requests admitted at once by the shortest window"""
+        return min(self.windows, key=lambda window: window.period_ms).limit
+
+    def __repr__(self):
+        return f"MultiWindowPolicy(windows={self.windows})"
+
+
+RateLimitResult = namedtuple(
+    "RateLimitResult",
+    ["allowed", "limit", "remaining", "retry_after_sec", "reset_sec", "window"],
+    defaults=(None,),
+)
+RateLimitResult.__doc__ = """Outcome of checking a request against a rate limit
+
+Fields:
+    allowed (bool): whether the request is admitted
+    limit (int): maximum number of requests admitted at once
+    remaining (int): number of further requests that would be admitted now
+    retry_after_sec (float): seconds until a rejected request would be admitted
+    reset_sec (float): seconds until the limit fully resets
+    window (RateLimitPolicy): window of a MultiWindowPolicy that rejected the
+        request, or with the fewest remaining requests if admitted
+"""
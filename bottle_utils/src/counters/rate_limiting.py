@@ -6,42 +6,231 @@
 """
 from bottle import request
 from bottle_utils.src.monitoring.logging import LogMixin
-import hashlib
+from bottle_utils.src.connectors.breaker import get_circuit_breaker
+from bottle_utils.src.counters.algorithms import (
+    ALGORITHM_SCRIPTS,
+    MULTI_WINDOW_SCRIPT,
+    get_multi_window_script_args,
+    get_script_args,
+)
+from bottle_utils.src.counters.keys import DEFAULT_KEY_FUNC
+from bottle_utils.src.counters.policies import (
+    MultiWindowPolicy,
+    RateLimitAlgorithm,
+    RateLimitResult,
+)
 
 RATE_LIMIT_PREFIX = "rate_limit"
 RATE_LIMIT_COUNTER_EXPIRATION_SEC = 1
+# Request counters are fixed windows that never reject, their count is the
+# limit minus the remaining requests. Lua numbers are doubles, exact up to 2^53
+REQUEST_COUNTER_LIMIT = 2**53
+
+
+class RateLimitException(Exception):
+    """Exception checking a rate limit"""
 
 
 class RateLimitCounterManager(LogMixin):
     """Counter manager for Rate limiting requests for a route
 
+    Args:
+        redis_client (redis.StrictRedis): client of the counter store
+        key_func (Callable): function building the counter key of a request, see
+            `bottle_utils.src.counters.keys`
+        fail_open (bool): admit requests when the counter store is unavailable.
+            Defaults to the policy of the circuit breaker of the client, or to
+            failing closed for clients without one
+        replica_client (redis.StrictRedis): read replica of the counter store
+            used by `peek`. Counting always goes to `redis_client`
+
     Note: Only supports redis as a backend cache
 
     """
 
-    HASHED_FORMAT_STR = "{ip_addr}{url}"
-
-    def __init__(self, redis_client):
+    def __init__(
+        self,
+        redis_client,
+        key_func=DEFAULT_KEY_FUNC,
+        fail_open=None,
+        replica_client=None,
+    ):
         self.redis_client = redis_client
+        self.replica_client = replica_client
+        self.key_func = key_func
+        if fail_open is None:
+            circuit_breaker = get_circuit_breaker(redis_client)
+            fail_open = circuit_breaker is not None and circuit_breaker.fail_open
 
-    def get_or_create_counter(self):
-        """Gets an existing request counter or creates a new one"""
+        self.fail_open = fail_open
+        self._algorithm_scripts = {
+            algorithm: redis_client.register_script(script)
+            for algorithm, script in ALGORITHM_SCRIPTS.items()
+        }
+        self._multi_window_script = redis_client.register_script(MULTI_WINDOW_SCRIPT)
+
+    def check(self, policy, counter_key=None):
+        """Counts a request against a rate limit policy
+
+        Args:
+            policy (RateLimitPolicy|MultiWindowPolicy): policy to enforce
+            counter_key (str): key to count the request under. Defaults to the
+                key of the current request
+
+        Returns:
+            RateLimitResult
+
+        Raises:
+            RateLimitException: counter store unavailable and failing closed
+
+        Notes:
+            - Costs a single round trip to redis
+            - Rejected requests are not counted against sliding window, GCRA
+              and multi window limits, so clients retrying after
+              `retry_after_sec` are admitted
+            - All windows of a multi window policy are checked in the same call
+
+        """
+        if counter_key is None:
+            counter_key = self.get_counter_key()
+
+        counter_key = f"{counter_key}:{policy.algorithm.name.lower()}"
+        window = None
+        try:
+            if isinstance(policy, MultiWindowPolicy):
+                # Windows share a hash tag so they map to the same cluster slot
+                keys = [f"{{{counter_key}}}:{w.period_ms}" for w in policy.windows]
+                result = self._multi_window_script(
+                    keys=keys, args=get_multi_window_script_args(policy)
+                )
+                window = policy.windows[result.pop(1) - 1]
+
+            else:
+                result = self._algorithm_scripts[policy.algorithm](
+                    keys=[counter_key], args=get_script_args(policy)
+                )
+
+            allowed, remaining, retry_after_ms, reset_ms = result
+
+        except Exception as exc:
+            self.log.error(exc)
+            if not self.fail_open:
+                raise RateLimitException("Could not check rate limit")
+
+            return RateLimitResult(
+                allowed=True,
+                limit=policy.limit,
+                remaining=policy.limit,
+                retry_after_sec=0,
+                reset_sec=0,
+            )
+
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=(window or policy).limit,
+            remaining=remaining,
+            retry_after_sec=retry_after_ms / 1000,
+            reset_sec=reset_ms / 1000,
+            window=window,
+        )
+
+    def peek(self, policy, counter_key=None):
+        """Reads the state of a fixed window limit without counting a request
+
+        Args:
+            policy (RateLimitPolicy): fixed window policy to read
+            counter_key (str): key the requests are counted under. Defaults to
+                the key of the current request
+
+        Returns:
+            RateLimitResult: whether a request made now would be allowed
+
+        Raises:
+            ValueError: policy is not a single fixed window
+            RateLimitException: counter store unavailable
+
+        Notes:
+            - Reads from the replica if there is one, so the result may lag
+              behind requests counted in the last few milliseconds. Suited to
+              quota displays and dashboards, not to enforcing the limit
+
+        """
+        if (
+            isinstance(policy, MultiWindowPolicy)
+            or policy.algorithm != RateLimitAlgorithm.FIXED_WINDOW
+        ):
+            raise ValueError("Only single fixed window limits can be peeked")
+
+        if counter_key is None:
+            counter_key = self.get_counter_key()
+
+        counter_key = f"{counter_key}:{policy.algorithm.name.lower()}"
+        try:
+            pipe = (self.replica_client or self.redis_client).pipeline(
+                transaction=False
+            )
+            pipe.get(counter_key)
+            pipe.pttl(counter_key)
+            count, ttl = pipe.execute()
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise RateLimitException("Could not read rate limit")
+
+        count = int(count or 0)
+        reset_ms = ttl if count and ttl > 0 else 0
+        remaining = max(policy.limit - count, 0)
+        return RateLimitResult(
+            allowed=remaining > 0,
+            limit=policy.limit,
+            remaining=remaining,
+            retry_after_sec=0 if remaining else reset_ms / 1000,
+            reset_sec=reset_ms / 1000,
+        )
+
+    def increment_counter(self):
+        """Atomically increments the request counter, creating it if needed
+
+        Returns:
+            RequestCounter: counter holding the post-increment count
+
+        Notes:
+            - Costs a single round trip to redis, so concurrent requests can not
+              read the same count before incrementing it
+
+        """
         counter_key = self.get_counter_key()
-        if self.redis_client.exists(counter_key):
-            value = self.redis_client.get(counter_key)
-            return RequestCounter(self.redis_client, counter_key, value)
+        _, remaining, _, _ = self._algorithm_scripts[RateLimitAlgorithm.FIXED_WINDOW](
+            keys=[counter_key],
+            args=[REQUEST_COUNTER_LIMIT, RATE_LIMIT_COUNTER_EXPIRATION_SEC * 1000],
+        )
+        return RequestCounter(
+            self.redis_client, counter_key, REQUEST_COUNTER_LIMIT - remaining
+        )
 
-        return self.create_counter(counter_key)
+    def get_or_create_counter(self):
+        """Counts the current request, creating its counter if needed
+
+        Returns:
+            RequestCounter: counter holding the post-increment count
 
-    def get_counter_key(self):
-        """Generate a string to use as a request counter key in redis"""
-        hashed_data = hashlib.sha256(
-            self.HASHED_FORMAT_STR.format(
-                ip_addr=request.remote_addr, url=request.url
-            ).encode("utf8")
-        ).hexdigest()
+        Notes:
+            - Kept for callers of the original counter API, see
+              `increment_counter`. Reading then creating the counter in separate
+              calls lost counts when concurrent requests both created it
 
-        return f"{RATE_LIMIT_PREFIX}:{hashed_data}"
+        """
+        return self.increment_counter()
+
+    def get_counter_key(self, key_func=None):
+        """Generate a string to use as a request counter key in redis
+
+        Args:
+            key_func (Callable): function building the key of the current
+                request. Defaults to the key function of the manager
+
+        """
+        return f"{RATE_LIMIT_PREFIX}:{(key_func or self.key_func)(request)}"
 
     def create_counter(self, counter_key):
         """Create a 1-indexed counter in redis
@@ -64,5 +253,4 @@ class RequestCounter:
 
     def increment(self):
         """Increments a redis counter"""
-        self.redis_client.incr(self.counter_key)
-        self.value += 1
+        self.value = self.redis_client.incr(self.counter_key)
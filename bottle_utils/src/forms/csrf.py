@@ -12,12 +12,17 @@ Currently supported session stores:
 from wtforms.csrf.core import CSRF
 from bottle_utils.src.tokens.token_manager import BaseTokenManager
 from bottle_utils.src.tokens.csrf import CSRFInvalidException
+from bottle_utils.src.tokens.session import InvalidSessionException
 
 
 class RedisCacheCSRF(CSRF):
     """
     Generate a CSRF token for form using a token provider based on storing CSRF
     tokens in a redis key-value store
+
+    Forms are bound to a session with either a loaded `session` or a
+    `session_token` and `session_mgr` in the form meta. With a session token only
+    the csrf token of the session is read, a single field with hash storage
     """
 
     def setup_form(self, form):
@@ -31,21 +36,42 @@ class RedisCacheCSRF(CSRF):
         self.csrf_token_mgr = form.meta.csrf_token_mgr
         # pylint: disable=attribute-defined-outside-init
         self.session = form.meta.session
+        # pylint: disable=attribute-defined-outside-init
+        self.session_token = getattr(form.meta, "session_token", None)
+        # pylint: disable=attribute-defined-outside-init
+        self.session_mgr = getattr(form.meta, "session_mgr", None)
 
         return super().setup_form(form)
 
+    def get_session_csrf_token(self):
+        """Gets the csrf token of the bound session, None for sessionless forms"""
+        if self.session is not None:
+            return self.session.csrf_token
+
+        if self.session_token is not None:
+            return self.session_mgr.get_session_csrf_token(self.session_token)
+
+        return None
+
     def generate_csrf_token(self, csrf_token_field):
-        if self.session is None:
+        try:
+            session_csrf_token = self.get_session_csrf_token()
+        except InvalidSessionException:
+            # Stale session cookie, the form is rendered without a session
+            session_csrf_token = None
+
+        if session_csrf_token is None:
             return self.csrf_token_mgr.create_sessionless_csrf_token()
 
-        return self.session.csrf_token
+        return session_csrf_token
 
     def validate_csrf_token(self, form, field):
         token = field.data
         try:
-            if self.session is None:
+            session_csrf_token = self.get_session_csrf_token()
+            if session_csrf_token is None:
                 self.csrf_token_mgr.validate_sessionless_csrf(token)
             else:
-                self.csrf_token_mgr.validate_csrf_session_token(token, self.session)
-        except CSRFInvalidException as exc:
-            raise ValueError from exc
+                self.csrf_token_mgr.validate_csrf_token(token, session_csrf_token)
+        except (CSRFInvalidException, InvalidSessionException) as exc:
+            raise ValueError(str(exc)) from exc
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""asyncio token managers
+
+Counterparts of the token managers built on `redis.asyncio` clients for use in
+asyncio services and background workers. Configuration, key building, encoding
+and validation logic are shared with the blocking token managers through the
+`*Core` classes, whose operations yield the redis calls to make. These managers
+only await the calls, see `bottle_utils.src.tokens.calls`.
+
+Example usage:
+```
+from redis.asyncio import StrictRedis
+
+redis_client = StrictRedis(host="localhost")
+csrf_mgr = AsyncCSRFTokenManager(redis_client)
+session_mgr = AsyncSessionTokenManager(csrf_mgr, redis_client)
+
+session = await session_mgr.get_session_from_token(token)
+```
+
+"""
+from bottle_utils.src.tokens.calls import run_calls_async
+from bottle_utils.src.tokens.csrf import (
+    CSRFTokenManagerCore,
+    SignedCSRFTokenManagerCore,
+)
+from bottle_utils.src.tokens.session import (
+    SessionTokenManagerCore,
+    UserToSessionTokenManagerCore,
+)
+from bottle_utils.src.tokens.token_manager import TokenManagerCore
+from bottle_utils.src.tokens.verification import VerificationTokenManagerCore
+
+
+class AsyncBaseTokenManager(TokenManagerCore):
+    """Base class for managers of tokens stored in redis using asyncio
+
+    See BaseTokenManager for the description of each operation
+
+    """
+
+    async def does_token_exist(self, token):
+        """Checks for token in key-value store"""
+        return await run_calls_async(self.does_token_exist_calls(token))
+
+    async def expire_token(self, token):
+        """Removes a token from the key-value store"""
+        return await run_calls_async(self.expire_token_calls(token))
+
+    async def refresh_token(self, token):
+        """Resets the expiration time of a token"""
+        return await run_calls_async(self.refresh_token_calls(token))
+
+    async def get_token_data(self, token):
+        """Gets data attached to a token `key` in the key-value store"""
+        return await run_calls_async(self.get_token_data_calls(token))
+
+    async def get_and_refresh_token_data(self, token):
+        """Gets data attached to a token and resets its expiration time"""
+        return await run_calls_async(self.get_and_refresh_token_data_calls(token))
+
+    get_and_refresh_token_fields = get_and_refresh_token_data
+
+    async def set_token_data(self, token, data, only_if_exists=False):
+        """Attaches data to the key (token) value in the key-value store"""
+        return await run_calls_async(
+            self.set_token_data_calls(token, data, only_if_exists)
+        )
+
+    async def get_token_fields(self, token, fields):
+        """Gets some fields of the hash attached to a token"""
+        return await run_calls_async(self.get_token_fields_calls(token, fields))
+
+    async def set_token_fields(self, token, fields):
+        """Replaces the hash attached to a token, encoding each field separately"""
+        return await run_calls_async(self.set_token_fields_calls(token, fields))
+
+    async def update_token_fields(self, token, fields):
+        """Updates some fields of an existing hash attached to a token"""
+        return await run_calls_async(self.update_token_fields_calls(token, fields))
+
+    async def exists_many(self, tokens):
+        """Checks for many tokens in the key-value store in one round trip"""
+        return await run_calls_async(self.exists_many_calls(tokens))
+
+    async def get_many(self, tokens):
+        """Gets the data attached to many tokens in one round trip"""
+        return await run_calls_async(self.get_many_calls(tokens))
+
+    async def set_many(self, token_data, expiration_sec=None):
+        """Attaches data to many tokens in one round trip"""
+        return await run_calls_async(self.set_many_calls(token_data, expiration_sec))
+
+    async def expire_many(self, tokens):
+        """Removes many tokens from the key-value store in one round trip"""
+        return await run_calls_async(self.expire_many_calls(tokens))
+
+
+class AsyncCSRFTokenManager(CSRFTokenManagerCore, AsyncBaseTokenManager):
+    """Manager for CSRF tokens stored in a redis-based session store using asyncio"""
+
+    async def create_sessionless_csrf_token(self):
+        """Creates a session token in the session store"""
+        return await run_calls_async(self.create_sessionless_csrf_token_calls())
+
+    async def expire_sessionless_csrf_token(self, token):
+        """Expires a session in the session store"""
+        await run_calls_async(self.expire_sessionless_csrf_token_calls(token))
+
+    async def validate_sessionless_csrf(self, token):
+        """Checks that the csrf token is in the session store"""
+        await run_calls_async(self.validate_sessionless_csrf_calls(token))
+
+
+class AsyncSignedCSRFTokenManager(SignedCSRFTokenManagerCore, AsyncCSRFTokenManager):
+    """Manager for stateless, HMAC-signed sessionless CSRF tokens using asyncio
+
+    Note: Tokens are only read from and written to redis if `single_use` is set,
+    see SignedCSRFTokenManager
+
+    """
+
+
+class AsyncUserToSessionTokenManager(
+    UserToSessionTokenManagerCore, AsyncBaseTokenManager
+):
+    """Manager for token that maps session to user name using asyncio"""
+
+    async def does_user_session_exist(self, user):
+        """Checks for user having a session"""
+        return await run_calls_async(self.does_user_session_exist_calls(user))
+
+    async def get_user_session(self, user):
+        """Gets session data for user"""
+        return await run_calls_async(self.get_user_session_calls(user))
+
+    async def expire_user_session_entry(self, user):
+        """Expires user/session entry"""
+        return await run_calls_async(self.expire_user_session_entry_calls(user))
+
+    async def create_user_to_session_entry(self, user, session):
+        """Creates a new user/session mapping entry"""
+        await run_calls_async(self.create_user_to_session_entry_calls(user, session))
+
+
+class AsyncSessionTokenManager(SessionTokenManagerCore, AsyncBaseTokenManager):
+    """Manager for Session data and tokens stored in redis using asyncio
+
+    Note: Unlike SessionTokenManager no session cookie is set, as there is no
+    bottle response to set it on
+
+    """
+
+    user_to_session_mapper_class = AsyncUserToSessionTokenManager
+
+    async def replace_user_session(self, user):
+        """Creates a session for a user, expiring any existing session"""
+        return await run_calls_async(self.replace_user_session_calls(user))
+
+    async def create_session(self, user):
+        """Creates a session for a user"""
+        return await run_calls_async(self.create_session_calls(user))
+
+    async def get_session_from_token(self, token):
+        """Gets a session object from a session token"""
+        return await run_calls_async(self.get_session_from_token_calls(token))
+
+    async def get_session_fields(self, token, fields):
+        """Gets some fields of a session without reading the whole session"""
+        return await run_calls_async(self.get_session_fields_calls(token, fields))
+
+    async def get_session_csrf_token(self, token):
+        """Gets the csrf token of a session"""
+        return await run_calls_async(self.get_session_csrf_token_calls(token))
+
+    async def update_user_settings(self, session, user_settings):
+        """Replaces the user settings stored on a session"""
+        await run_calls_async(self.update_user_settings_calls(session, user_settings))
+
+    async def expire_session(self, session):
+        """Expires a session"""
+        await run_calls_async(self.expire_session_calls(session))
+
+    async def invalidate_cached_session(self, session_id):
+        """Drops a session from the local cache and notifies other workers"""
+        await run_calls_async(self.invalidate_cached_session_calls(session_id))
+
+
+class AsyncVerificationTokenManager(
+    VerificationTokenManagerCore, AsyncBaseTokenManager
+):
+    """Manager for email verification tokens stored in redis using asyncio"""
+
+    async def is_valid_verification_token(self, token):
+        """Checks if token is in key-value store"""
+        return await run_calls_async(self.is_valid_verification_token_calls(token))
+
+    async def expire_verification_token(self, token):
+        """Expires email verification token in key-value store"""
+        await run_calls_async(self.expire_verification_token_calls(token))
+
+    async def get_verification_token_user_data(self, token):
+        """Gets user associated with the email verification token"""
+        return await run_calls_async(self.get_verification_token_user_data_calls(token))
+
+    async def create_email_verification_token(self, user):
+        """Generates a new email verification token for a user"""
+        return await run_calls_async(self.create_email_verification_token_calls(user))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""In-process cache for session data
+
+Bounded LRU cache with a per-entry time to live that sits in front of a
+SessionTokenManager so hot sessions are served from worker memory. Entries are
+invalidated across workers using redis pub/sub messages published whenever a
+session is expired or replaced.
+
+"""
+import time
+import threading
+from collections import OrderedDict
+from bottle_utils.src.monitoring.logging import LogMixin
+
+SESSION_INVALIDATION_CHANNEL = "session-invalidation"
+DEFAULT_CACHE_MAX_SIZE = 4096
+DEFAULT_CACHE_TTL_SEC = 5
+
+
+class SessionCache(LogMixin):
+    """Thread-safe LRU/TTL cache of sessions keyed by session token
+
+    Note: Entries served from the cache do not refresh the session expiration in
+    the key-value store, so the ttl should be kept small compared to the session
+    expiration time
+
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_CACHE_MAX_SIZE,
+        ttl_sec=DEFAULT_CACHE_TTL_SEC,
+        clock=time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def get(self, token):
+        """Gets a cached value for a token
+
+        Args:
+            token (str): session token
+
+        Returns:
+            cached value or None if missing or expired
+
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[token]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return value
+
+    def set(self, token, value):
+        """Caches a value for a token, evicting the least recently used entry
+
+        Args:
+            token (str): session token
+            value (Session): value to cache
+
+        """
+        with self._lock:
+            self._entries[token] = (value, self.clock() + self.ttl_sec)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        """Removes a token from the cache if present"""
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit, miss and eviction counters along with the current size
+
+        Returns:
+            Dict
+
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def listen(self, redis_client, channel=SESSION_INVALIDATION_CHANNEL):
+        """Subscribes to invalidation messages in a background thread
+
+        Args:
+            redis_client (redis.StrictRedis): client to subscribe with
+            channel (str): pub/sub channel invalidated tokens are published to
+
+        Returns:
+            redis.client.PubSubWorkerThread: thread handling messages
+
+        """
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: self._handle_invalidation})
+        self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        self.log.info("Listening for session invalidations", channel=channel)
+
+        return self._listener
+
+    def stop(self):
+        """Stops the background invalidation listener if running and waits for it"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener.join()
+            self._listener = None
+
+    def _handle_invalidation(self, message):
+        token = message["data"]
+        if isinstance(token, bytes):
+            token = token.decode("utf8")
+
+        self.invalidate(token)
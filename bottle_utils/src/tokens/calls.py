@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Execution of the redis calls of token manager operations
+
+Token manager operations are written once, in the `*Core` classes, as
+generators yielding the redis calls to make. Each call is yielded as a function
+taking no arguments, and its result (or the exception it raised) is sent back
+into the generator, so the operation handles errors as if it made the call
+itself. Blocking token managers run the generators with `run_calls`, asyncio
+token managers with `run_calls_async`, so the two only differ in how calls are
+executed.
+
+Example usage:
+```
+def does_token_exist_calls(self, token):
+    exists = yield functools.partial(self.redis_client.exists, key)
+    return bool(exists)
+
+exists = run_calls(mgr.does_token_exist_calls(token))
+exists = await run_calls_async(async_mgr.does_token_exist_calls(token))
+```
+
+"""
+
+
+def run_calls(calls):
+    """Runs the calls of an operation, blocking on each call
+
+    Args:
+        calls (Generator): operation yielding the calls to make
+
+    Returns:
+        the return value of the operation
+
+    """
+    result, error = None, None
+    while True:
+        try:
+            call = calls.send(result) if error is None else calls.throw(error)
+
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            result, error = call(), None
+
+        except Exception as exc:
+            result, error = None, exc
+
+
+async def run_calls_async(calls):
+    """Runs the calls of an operation, awaiting each call
+
+    Args:
+        calls (Generator): operation yielding the calls to make, each returning
+            an awaitable
+
+    Returns:
+        the return value of the operation
+
+    """
+    result, error = None, None
+    while True:
+        try:
+            call = calls.send(result) if error is None else calls.throw(error)
+
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            result, error = await call(), None
+
+        except Exception as exc:
+            result, error = None, exc
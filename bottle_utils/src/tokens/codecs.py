@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Codecs for serializing token data stored in the key-value store
+
+Every encoded value other than JSON starts with a one byte marker identifying
+the codec that wrote it. Values are always decoded with the codec that wrote
+them, so switching a token manager to a new codec keeps existing values (such
+as JSON sessions written before codecs were introduced) readable until they
+expire.
+
+Currently supported codecs:
+- JSON (default, unmarked for compatibility with existing data)
+- MessagePack (compact binary with 16 byte UUIDs)
+
+"""
+import json
+import msgpack
+from uuid import UUID
+
+MSGPACK_MARKER = b"\x01"
+MSGPACK_UUID_EXT_CODE = 1
+
+
+class TokenCodec:
+    """Base class for codecs converting token data to and from bytes"""
+
+    marker = b""
+
+    def encode(self, data):
+        """Encodes token data
+
+        Args:
+            data: data to encode
+
+        Returns:
+            bytes
+
+        """
+        raise NotImplementedError
+
+    def decode(self, raw):
+        """Decodes token data written by this codec
+
+        Args:
+            raw (bytes): encoded data including the codec marker
+
+        Returns:
+            decoded data
+
+        """
+        raise NotImplementedError
+
+
+def _encode_json_default(o):
+    if isinstance(o, UUID):
+        return o.hex
+
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+
+class JSONCodec(TokenCodec):
+    """Codec writing compact JSON with UUIDs stored as hex strings"""
+
+    # Reusing a single encoder avoids building one for every call to json.dumps
+    _encoder = json.JSONEncoder(separators=(",", ":"), default=_encode_json_default)
+
+    def encode(self, data):
+        return self._encoder.encode(data).encode("utf8")
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+def _encode_msgpack_default(o):
+    if isinstance(o, UUID):
+        return msgpack.ExtType(MSGPACK_UUID_EXT_CODE, o.bytes)
+
+    raise TypeError(f"Object of type {o.__class__.__name__} is not serializable")
+
+
+def _decode_msgpack_ext(code, data):
+    # UUIDs are read back as hex strings, matching values written by JSONCodec
+    if code == MSGPACK_UUID_EXT_CODE:
+        return data.hex()
+
+    return msgpack.ExtType(code, data)
+
+
+class MsgpackCodec(TokenCodec):
+    """Compact binary codec based on MessagePack"""
+
+    marker = MSGPACK_MARKER
+
+    def encode(self, data):
+        return self.marker + msgpack.packb(data, default=_encode_msgpack_default)
+
+    def decode(self, raw):
+        return msgpack.unpackb(raw[1:], ext_hook=_decode_msgpack_ext, raw=False)
+
+
+JSON_CODEC = JSONCodec()
+MSGPACK_CODEC = MsgpackCodec()
+DEFAULT_CODEC = JSON_CODEC
+
+_CODECS_BY_MARKER = {MSGPACK_MARKER: MSGPACK_CODEC}
+
+
+def decode_token_data(raw):
+    """Decodes token data with the codec that wrote it
+
+    Args:
+        raw (bytes): encoded token data or None
+
+    Returns:
+        decoded data or None if raw is None
+
+    """
+    if raw is None:
+        return None
+
+    return _CODECS_BY_MARKER.get(raw[:1], JSON_CODEC).decode(raw)
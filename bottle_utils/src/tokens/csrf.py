@@ -6,39 +6,109 @@ Token manager class and associated settings and exceptions for
 managing CSRF tokens using Redis as the Backend data store
 
 """
-from bottle_utils.src.tokens.token_manager import BaseTokenManager
+import hmac
+import time
+import base64
+import hashlib
+import functools
+from bottle_utils.src.tokens.calls import run_calls
+from bottle_utils.src.tokens.token_manager import (
+    BaseTokenManager,
+    TokenManagerCore,
+    TokenWriteException,
+)
 
 CSRF_FIELD_NAME = "CSRFToken"
 CSRF_TOKEN_LENGTH = 36
 TEMP_CSRF_KEY_PREFIX = "temp-csrf"
 CSRF_SESSIONLESS_EXPIRATION_SEC = 600
+USED_CSRF_KEY_PREFIX = "used-csrf"
+SIGNED_CSRF_SEPARATOR = "."
+SIGNED_CSRF_MAX_CLOCK_SKEW_SEC = 30
 
 
 class CSRFInvalidException(Exception):
     """Invalid or Non-existant CSRF token"""
 
 
-class CSRFTokenManager(BaseTokenManager):
-    """Manager for CSRF tokens stored in a redis-based session store"""
+class CSRFTokenManagerCore(TokenManagerCore):
+    """Key-value store independent logic of CSRF token managers"""
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, replica_client=None):
         super().__init__(
             CSRF_TOKEN_LENGTH,
             CSRF_SESSIONLESS_EXPIRATION_SEC,
             TEMP_CSRF_KEY_PREFIX,
             redis_client,
+            replica_client=replica_client,
         )
 
+    def validate_csrf_session_token(self, token, session):
+        """Checks that the csrf token matches that on a session
+
+        Args:
+            token (str): token to check against user session
+            session (Session): user session
+
+        Raises:
+            CSRFInvalidException: Bad or no csrf token
+
+        """
+        self.validate_csrf_token(token, session.csrf_token)
+
+    @staticmethod
+    def validate_csrf_token(token, session_csrf_token):
+        """Checks that the csrf token matches the csrf token of a session
+
+        Args:
+            token (str): token to check
+            session_csrf_token (str): csrf token stored on the session, e.g. read
+                with SessionTokenManager.get_session_csrf_token
+
+        Raises:
+            CSRFInvalidException: Bad or no csrf token
+
+        """
+        if token is None:
+            raise CSRFInvalidException("No CSRF Token")
+
+        if token != session_csrf_token:
+            raise CSRFInvalidException("Invalid CSRF Token")
+
+    def create_sessionless_csrf_token_calls(self):
+        """Calls creating a sessionless csrf token in the session store"""
+        token = self.generate_token()
+        yield from self.set_token_data_calls(token, "")
+
+        return token
+
+    def expire_sessionless_csrf_token_calls(self, token):
+        """Calls expiring a sessionless csrf token if it is valid"""
+        try:
+            yield from self.validate_sessionless_csrf_calls(token)
+            yield from self.expire_token_calls(token)
+        except CSRFInvalidException:
+            pass
+
+    def validate_sessionless_csrf_calls(self, token):
+        """Calls checking that a sessionless csrf token is in the session store"""
+        if token is None:
+            raise CSRFInvalidException("No CSRF Token")
+
+        if not (yield from self.does_token_exist_calls(token)):
+            raise CSRFInvalidException("Invalid CSRF Token")
+
+
+class CSRFTokenManager(CSRFTokenManagerCore, BaseTokenManager):
+    """Manager for CSRF tokens stored in a redis-based session store"""
+
     def create_sessionless_csrf_token(self):
         """Creates a session token in the session store
 
         Returns:
             String: session token
         """
-        token = self.generate_token()
-        self.set_token_data(token, "")
-
-        return token
+        return run_calls(self.create_sessionless_csrf_token_calls())
 
     def expire_sessionless_csrf_token(self, token):
         """Expires a session in the session store
@@ -47,11 +117,7 @@ class CSRFTokenManager(BaseTokenManager):
             token (str): session token to expire
 
         """
-        try:
-            self.validate_sessionless_csrf(token)
-            self.expire_token(token)
-        except CSRFInvalidException:
-            pass
+        run_calls(self.expire_sessionless_csrf_token_calls(token))
 
     def validate_sessionless_csrf(self, token):
         """Checks that the csrf token is in the session store
@@ -63,25 +129,122 @@ class CSRFTokenManager(BaseTokenManager):
             CSRFInvalidException: Bad or no csrf token
 
         """
-        if token is None:
-            raise CSRFInvalidException("No CSRF Token")
+        run_calls(self.validate_sessionless_csrf_calls(token))
+
+
+class SignedCSRFTokenManagerCore(CSRFTokenManagerCore):
+    """Key-value store independent logic of signed CSRF token managers"""
+
+    def __init__(
+        self,
+        redis_client,
+        signing_keys,
+        active_key_id=None,
+        single_use=False,
+        clock=time.time,
+        replica_client=None,
+    ):
+        super().__init__(redis_client, replica_client)
+        if not signing_keys:
+            raise ValueError("At least one CSRF signing key is required")
+
+        if any(SIGNED_CSRF_SEPARATOR in key_id for key_id in signing_keys):
+            raise ValueError(f"Key ids cannot contain '{SIGNED_CSRF_SEPARATOR}'")
+
+        self.signing_keys = {
+            key_id: key.encode("utf8") if isinstance(key, str) else key
+            for key_id, key in signing_keys.items()
+        }
+        self.active_key_id = active_key_id or next(iter(signing_keys))
+        if self.active_key_id not in self.signing_keys:
+            raise ValueError("Active key id must be one of the signing keys")
+
+        self.single_use = single_use
+        self.clock = clock
+
+    def create_sessionless_csrf_token_calls(self):
+        """Calls creating a signed csrf token, none of which use the session store"""
+        yield from ()
+        payload = SIGNED_CSRF_SEPARATOR.join(
+            (self.active_key_id, str(int(self.clock())), self.generate_token())
+        )
 
-        if not self.does_token_exist(token):
-            raise CSRFInvalidException("Invalid CSRF Token")
+        return SIGNED_CSRF_SEPARATOR.join(
+            (payload, self._sign(self.signing_keys[self.active_key_id], payload))
+        )
 
-    def validate_csrf_session_token(self, token, session):
-        """Checks that the csrf token matches that on a session
+    def expire_sessionless_csrf_token_calls(self, token):
+        """Calls adding a token to the denylist if tokens are single use"""
+        if not self.single_use:
+            return
 
-        Args:
-            token (str): token to check against user session
-            session (Session): user session
+        try:
+            yield from self._consume_calls(*self._verify(token))
+        except CSRFInvalidException:
+            pass
 
-        Raises:
-            CSRFInvalidException: Bad or no csrf token
+    def validate_sessionless_csrf_calls(self, token):
+        """Calls checking the signature, age and, if single use, reuse of a token"""
+        nonce, remaining_sec = self._verify(token)
+        if self.single_use and not (
+            yield from self._consume_calls(nonce, remaining_sec)
+        ):
+            raise CSRFInvalidException("CSRF Token already used")
 
-        """
+    def _verify(self, token):
+        """Checks a token and returns its nonce and remaining lifetime"""
         if token is None:
             raise CSRFInvalidException("No CSRF Token")
 
-        if token != session.csrf_token:
+        try:
+            key_id, timestamp, nonce, signature = token.split(SIGNED_CSRF_SEPARATOR)
+            age_sec = int(self.clock()) - int(timestamp)
+        except ValueError:
+            raise CSRFInvalidException("Invalid CSRF Token")
+
+        key = self.signing_keys.get(key_id)
+        payload = token[: -len(signature) - 1]
+        if key is None or not hmac.compare_digest(
+            self._sign(key, payload).encode("utf8"), signature.encode("utf8")
+        ):
             raise CSRFInvalidException("Invalid CSRF Token")
+
+        if not -SIGNED_CSRF_MAX_CLOCK_SKEW_SEC <= age_sec < self.token_expiration_sec:
+            raise CSRFInvalidException("Expired CSRF Token")
+
+        return nonce, self.token_expiration_sec - max(age_sec, 0)
+
+    def _consume_calls(self, nonce, remaining_sec):
+        """Calls adding a nonce to the denylist, returning False if already present"""
+        try:
+            added = yield functools.partial(
+                self.redis_client.set,
+                f"{USED_CSRF_KEY_PREFIX}:{nonce}",
+                1,
+                ex=remaining_sec,
+                nx=True,
+            )
+            return bool(added)
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write token data to cache")
+
+    @staticmethod
+    def _sign(key, payload):
+        digest = hmac.new(key, payload.encode("utf8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+class SignedCSRFTokenManager(SignedCSRFTokenManagerCore, CSRFTokenManager):
+    """Manager for stateless, HMAC-signed sessionless CSRF tokens
+
+    Tokens have the form `<key id>.<timestamp>.<nonce>.<signature>` and are
+    validated in-process without reading from the key-value store. New tokens are
+    signed with the active key while any key in `signing_keys` is accepted, which
+    allows keys to be rotated without invalidating tokens already handed out.
+
+    Note: If `single_use` is set, validated and expired tokens are added to a
+    denylist in redis that lives for the remaining lifetime of the token
+
+    """
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Random token generation
+
+Generates random tokens by reading entropy from os.urandom in bulk and mapping
+bytes onto the token alphabet with rejection sampling so that every character
+of the alphabet is equally likely. An optional per-thread pool of pre-mapped
+characters amortizes the cost of the urandom call across many tokens.
+
+"""
+
+import os
+import string
+import threading
+
+DEFAULT_TOKEN_ALPHABET = string.ascii_lowercase + string.ascii_uppercase + string.digits
+DEFAULT_POOL_SIZE_BYTES = 4096
+
+
+class TokenGenerator:
+    """Generator of random tokens drawn uniformly from an alphabet
+
+    Note: The pool is discarded in forked processes so that parent and child
+    processes never hand out the same characters
+
+    """
+
+    def __init__(
+        self, alphabet=DEFAULT_TOKEN_ALPHABET, pool_size=DEFAULT_POOL_SIZE_BYTES
+    ):
+        if not 1 < len(set(alphabet)) == len(alphabet) <= 256 or not alphabet.isascii():
+            raise ValueError("alphabet must have 2 to 256 unique ascii characters")
+
+        self.alphabet = alphabet
+        self.pool_size = pool_size
+
+        # Bytes at or above the limit would make the first characters of the
+        # alphabet more likely, so they are dropped instead of wrapped around
+        limit = 256 - (256 % len(alphabet))
+        self._table = bytes(
+            ord(alphabet[byte % len(alphabet)]) if byte < limit else 0
+            for byte in range(256)
+        )
+        self._rejected = bytes(range(limit, 256))
+        self._local = threading.local()
+
+    def generate(self, length):
+        """Generates a random token
+
+        Args:
+            length (int): number of characters in the token
+
+        Returns:
+            String
+
+        """
+        if not self.pool_size:
+            return self._read(length)[:length].decode("ascii")
+
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.pid = os.getpid()
+            local.pool = b""
+
+        pool = local.pool
+        if len(pool) < length:
+            pool += self._read(max(self.pool_size, length))
+
+        local.pool = pool[length:]
+        return pool[:length].decode("ascii")
+
+    def _read(self, length):
+        """Reads at least `length` uniformly distributed alphabet characters"""
+        chars = b""
+        while len(chars) < length:
+            # Request a little extra to cover rejected bytes in one read
+            needed = length - len(chars)
+            raw = os.urandom(needed + needed // 8 + 8)
+            chars += raw.translate(self._table, self._rejected)
+
+        return chars
+
+
+DEFAULT_TOKEN_GENERATOR = TokenGenerator()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Sliding expiration policies for tokens
+
+Policies decide when reading a token should also reset its expiration time.
+Refreshing only once the remaining lifetime drops below a threshold removes
+most of the writes caused by reading tokens while keeping the same effective
+token lifetime.
+
+"""
+
+
+class RefreshPolicy:
+    """Refreshes the expiration time of a token on every read"""
+
+    def refresh_threshold_sec(self, expiration_sec):
+        """Remaining lifetime below which a token is refreshed when read
+
+        Args:
+            expiration_sec (int): full lifetime of the token
+
+        Returns:
+            int: threshold in seconds
+
+        """
+        return expiration_sec
+
+
+class ThresholdRefreshPolicy(RefreshPolicy):
+    """Refreshes the expiration time once the remaining lifetime is low
+
+    Args:
+        fraction (float): fraction of the full token lifetime below which the
+            token is refreshed, e.g. 0.5 refreshes a two hour session at most
+            once per hour of activity
+
+    """
+
+    def __init__(self, fraction=0.5):
+        if not 0 < fraction <= 1:
+            raise ValueError("fraction must be greater than 0 and at most 1")
+
+        self.fraction = fraction
+
+    def refresh_threshold_sec(self, expiration_sec):
+        return int(expiration_sec * self.fraction)
+
+
+DEFAULT_REFRESH_POLICY = RefreshPolicy()
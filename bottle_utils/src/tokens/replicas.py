@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Read replica routing for token managers
+
+Token managers given a replica client send reads that can tolerate replication
+lag to the replica. Tokens written or expired by the current process are read
+from the primary for a short window afterwards, so a worker always reads its
+own writes (e.g. the session it just created) even while replicas catch up.
+
+"""
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_READ_YOUR_WRITES_SEC = 5
+DEFAULT_MAX_RECENT_WRITES = 65536
+
+
+class RecentWrites:
+    """Thread-safe bounded set of tokens written within a time window
+
+    Args:
+        window_sec (float): time a written token is remembered for
+        max_size (int): tokens remembered at most, oldest writes are dropped
+        clock (Callable): monotonic clock in seconds
+
+    """
+
+    def __init__(
+        self,
+        window_sec=DEFAULT_READ_YOUR_WRITES_SEC,
+        max_size=DEFAULT_MAX_RECENT_WRITES,
+        clock=time.monotonic,
+    ):
+        self.window_sec = window_sec
+        self.max_size = max_size
+        self.clock = clock
+        self._written_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, token):
+        """Remembers that a token was just written"""
+        with self._lock:
+            self._written_at[token] = self.clock()
+            self._written_at.move_to_end(token)
+            while len(self._written_at) > self.max_size:
+                self._written_at.popitem(last=False)
+
+    def __contains__(self, token):
+        with self._lock:
+            written_at = self._written_at.get(token)
+            if written_at is None:
+                return False
+
+            if self.clock() - written_at >= self.window_sec:
+                del self._written_at[token]
+                return False
+
+            return True
@@ -6,10 +6,23 @@ Token manager class and associated settings and exceptions for
 managing Session tokens using Redis as the Backend data store
 
 """
+import hmac
 import json
+import hashlib
+import functools
+from uuid import UUID
 from bottle import response
-from bottle_utils.src.tokens.token_manager import BaseTokenManager
+from bottle_utils.src.tokens.token_manager import (
+    BaseTokenManager,
+    TokenManagerCore,
+    TokenTypeException,
+    TokenWriteException,
+)
+from bottle_utils.src.tokens.calls import run_calls
 from bottle_utils.src.tokens.csrf import CSRF_FIELD_NAME
+from bottle_utils.src.tokens.cache import SESSION_INVALIDATION_CHANNEL
+from bottle_utils.src.tokens.codecs import MSGPACK_MARKER
+from bottle_utils.src.tokens.generator import DEFAULT_TOKEN_GENERATOR
 
 
 class InvalidSessionException(Exception):
@@ -21,20 +34,473 @@ SESSION_TOKEN_LENGTH = 36
 SESSION_CACHE_PREFIX = "session"
 SESSION_EXPIRATION_SEC = 7200
 MAX_SESSION_COOKIE_AGE_SEC = 7200
+SESSION_HASH_TAG_LENGTH = 8
+# WSGI environ key holding the session loaded for the current request
+SESSION_ENVIRON_KEY = "bottle_utils.session"
+
+# Replaces a user's session and user/session mapping atomically. The existing
+# mapping value may have been written by any codec, so the old session id is
+# decoded from either MessagePack or JSON before the old session is deleted.
+# The new session is stored as a string or, if field/value pairs are given, as a
+# hash. With cluster hash tags the old session key embeds the first characters
+# of its id as a tag, which is shared by all keys of the user.
+#   KEYS: user/session mapping key, new session key
+#   ARGV: mapping data, expiration, session key prefix, msgpack marker,
+#         hash tag length (0 without tags),
+#         session data | session field/value pairs...
+REPLACE_SESSION_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+local old_session_id = false
+if old then
+    if string.sub(old, 1, 1) == ARGV[4] then
+        old_session_id = cmsgpack.unpack(string.sub(old, 2))
+    else
+        old_session_id = cjson.decode(old)
+    end
+    local tag_length = tonumber(ARGV[5])
+    if tag_length > 0 then
+        local tag = string.sub(old_session_id, 1, tag_length)
+        redis.call('DEL', ARGV[3] .. '{' .. tag .. '}' .. old_session_id)
+    else
+        redis.call('DEL', ARGV[3] .. old_session_id)
+    end
+end
+if #ARGV == 6 then
+    redis.call('SET', KEYS[2], ARGV[6], 'EX', ARGV[2])
+else
+    redis.call('DEL', KEYS[2])
+    redis.call('HSET', KEYS[2], unpack(ARGV, 6))
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return old_session_id
+"""
 
 
-class SessionTokenManager(BaseTokenManager):
-    """Manager for Session data and tokens stored in a redis-based session store"""
+USER_TO_SESSION_CACHE_PREFIX = "user_to_sess"
+
+
+def format_user_uuid(user_uuid):
+    """Canonical form of a user uuid used in keys
+
+    Sessions read back from the session store hold the uuid as a hex string,
+    while users hold UUID objects, so keys are always built from this form
+
+    Args:
+        user_uuid (UUID|str): uuid of the user, as a UUID or any string form
+
+    Returns:
+        String: hyphenated lowercase uuid
+
+    """
+    if not isinstance(user_uuid, UUID):
+        user_uuid = UUID(user_uuid)
+
+    return str(user_uuid)
+
+
+def get_user_hash_tag(user_uuid, hash_tag_key):
+    """Cluster hash tag shared by the session keys of a user
+
+    The tag is a keyed HMAC of the user uuid, so session tokens, which start with
+    the tag, cannot be linked to a user without the server secret
+
+    Args:
+        user_uuid (UUID|str): uuid of the user
+        hash_tag_key (str|bytes): server secret shared by all workers
+
+    Returns:
+        String: SESSION_HASH_TAG_LENGTH hex characters
 
-    def __init__(self, csrf_mgr, redis_client):
+    """
+    if isinstance(hash_tag_key, str):
+        hash_tag_key = hash_tag_key.encode("utf8")
+
+    return hmac.new(
+        hash_tag_key, format_user_uuid(user_uuid).encode("utf8"), hashlib.sha256
+    ).hexdigest()[:SESSION_HASH_TAG_LENGTH]
+
+
+def check_hash_tag_key(token_mgr, hash_tag_key):
+    """Checks that a hash tag key is given to a token manager using a cluster
+
+    Raises:
+        ValueError: raised if the manager uses a cluster client without a key
+
+    """
+    if token_mgr.cluster_mode and not hash_tag_key:
+        raise ValueError("A hash tag key is required with a Redis Cluster client")
+
+
+class UserToSessionTokenManagerCore(TokenManagerCore):
+    """Configuration of managers of tokens that map users to sessions"""
+
+    def __init__(
+        self, redis_client, codec=None, replica_client=None, hash_tag_key=None
+    ):
+        super().__init__(
+            None,
+            SESSION_EXPIRATION_SEC,
+            USER_TO_SESSION_CACHE_PREFIX,
+            redis_client,
+            codec,
+            replica_client=replica_client,
+        )
+        check_hash_tag_key(self, hash_tag_key)
+        self.hash_tag_key = hash_tag_key
+
+    def get_token_key(self, token):
+        return super().get_token_key(format_user_uuid(token))
+
+    def get_hash_tag(self, token):
+        return get_user_hash_tag(token, self.hash_tag_key)
+
+    def does_user_session_exist_calls(self, user):
+        """Calls checking for a user having a session"""
+        return (yield from self.does_token_exist_calls(user.uuid))
+
+    def get_user_session_calls(self, user):
+        """Calls reading the session id of a user"""
+        return (yield from self.get_token_data_calls(user.uuid))
+
+    def expire_user_session_entry_calls(self, user):
+        """Calls expiring the user/session entry of a user"""
+        return (yield from self.expire_token_calls(user.uuid))
+
+    def create_user_to_session_entry_calls(self, user, session):
+        """Calls creating a user/session mapping entry"""
+        yield from self.set_token_data_calls(user.uuid, session.session_id)
+
+
+class UserToSessionTokenManager(UserToSessionTokenManagerCore, BaseTokenManager):
+    """Manager for token that maps session to user name"""
+
+    def does_user_session_exist(self, user):
+        """Checks for user having a session"""
+        return run_calls(self.does_user_session_exist_calls(user))
+
+    def get_user_session(self, user):
+        """Gets session data for user"""
+        return run_calls(self.get_user_session_calls(user))
+
+    def expire_user_session_entry(self, user):
+        """Expires user/session entry"""
+        return run_calls(self.expire_user_session_entry_calls(user))
+
+    def create_user_to_session_entry(self, user, session):
+        """Creates a new user/session mapping entry"""
+        run_calls(self.create_user_to_session_entry_calls(user, session))
+
+
+class SessionTokenManagerCore(TokenManagerCore):
+    """Key-value store independent logic of session token managers
+
+    Note: If a SessionCache is provided, sessions read from the session store are
+    kept in worker memory and invalidated on all workers listening on the
+    invalidation channel when they are expired or replaced
+
+    Note: If `hash_storage` is set, sessions are stored as redis hashes with one
+    encoded value per field so single fields can be read or updated on their
+    own. Sessions written in the other storage mode stay readable and
+    updatable, so the mode can be switched while sessions are live
+
+    Note: With a Redis Cluster client, session tokens start with the hash tag of
+    their user so a session and its user/session mapping share a cluster slot.
+    Tags are keyed with `hash_tag_key`, a secret that must be shared by all
+    workers, so tokens cannot be linked to users
+
+    Note: With a replica client, sessions created, replaced or expired by this
+    worker are read from the primary until replicas are likely to have caught up
+
+    """
+
+    user_to_session_mapper_class = None
+
+    def __init__(
+        self,
+        csrf_mgr,
+        redis_client,
+        session_cache=None,
+        codec=None,
+        hash_storage=False,
+        refresh_policy=None,
+        replica_client=None,
+        hash_tag_key=None,
+    ):
         super().__init__(
             SESSION_TOKEN_LENGTH,
             SESSION_EXPIRATION_SEC,
             SESSION_CACHE_PREFIX,
             redis_client,
+            codec,
+            refresh_policy,
+            replica_client,
         )
         self.csrf_mgr = csrf_mgr
-        self.user_to_session_mapper = UserToSessionTokenManager(redis_client)
+        check_hash_tag_key(self, hash_tag_key)
+        self.hash_tag_key = hash_tag_key
+        self.user_to_session_mapper = self.user_to_session_mapper_class(
+            redis_client, codec, replica_client, hash_tag_key
+        )
+        self.session_cache = session_cache
+        self.hash_storage = hash_storage
+
+    def get_hash_tag(self, token):
+        return token[:SESSION_HASH_TAG_LENGTH]
+
+    def build_session(self, user):
+        """Builds a new session for a user without storing it
+
+        Args:
+            user (User): user to build session for
+
+        Returns:
+            Session
+
+        """
+        csrf_token = self.csrf_mgr.generate_token()
+        if self.cluster_mode:
+            session_token = get_user_hash_tag(
+                user.uuid, self.hash_tag_key
+            ) + DEFAULT_TOKEN_GENERATOR.generate(
+                self.token_length - SESSION_HASH_TAG_LENGTH
+            )
+        else:
+            session_token = self.generate_token()
+
+        # TODO: Add user settings?
+        dummy_settings = {"test": "A"}
+
+        return Session(
+            session_token,
+            user.uuid,
+            user.username,
+            user.email,
+            dummy_settings,
+            csrf_token,
+        )
+
+    def get_replace_session_keys_and_args(self, user, session):
+        """Keys and arguments of the script replacing a user's session"""
+        keys = [
+            self.user_to_session_mapper.get_token_key(user.uuid),
+            self.get_token_key(session.session_id),
+        ]
+        args = [
+            self.user_to_session_mapper.codec.encode(session.session_id),
+            self.token_expiration_sec,
+            f"{self.token_cache_prefix}:",
+            MSGPACK_MARKER,
+            SESSION_HASH_TAG_LENGTH if self.cluster_mode else 0,
+        ]
+        if self.hash_storage:
+            args += self.flatten_fields(session.to_dict())
+        else:
+            args.append(self.codec.encode(session.to_dict()))
+
+        return keys, args
+
+    def record_session_writes(self, user, session):
+        """Records the keys written when replacing a user's session"""
+        self.record_writes(session.session_id)
+        self.user_to_session_mapper.record_writes(user.uuid)
+
+    def get_cached_session(self, token):
+        """Gets a session from the local cache
+
+        Args:
+            token (str): session token
+
+        Returns:
+            Session or None if not cached
+
+        Raises:
+            InvalidSessionException: No session token
+
+        """
+        if token is None:
+            raise InvalidSessionException("No Session data found")
+
+        if self.session_cache is None:
+            return None
+
+        return self.session_cache.get(token)
+
+    def load_session(self, token, session_data):
+        """Builds a session from stored session data and caches it
+
+        Args:
+            token (str): session token
+            session_data (Dict): decoded session data or None
+
+        Returns:
+            Session
+
+        Raises:
+            InvalidSessionException: Session is not valid
+
+        """
+        if session_data is None:
+            raise InvalidSessionException("Invalid Session data")
+
+        session = Session.from_dict(token, session_data)
+        if self.session_cache is not None:
+            self.session_cache.set(token, session)
+
+        return session
+
+    @staticmethod
+    def check_session_fields(session_data, fields):
+        """Selects fields of stored session data
+
+        Args:
+            session_data (Dict): decoded session data or field values
+            fields (List[str]): session fields to select
+
+        Returns:
+            Dict: value per field
+
+        Raises:
+            InvalidSessionException: Session is not valid
+
+        """
+        if session_data is None or all(
+            session_data.get(field) is None for field in fields
+        ):
+            raise InvalidSessionException("Invalid Session data")
+
+        return {field: session_data.get(field) for field in fields}
+
+    def replace_user_session_calls(self, user):
+        """Calls replacing the session of a user in a single script call"""
+        session = self.build_session(user)
+        keys, args = self.get_replace_session_keys_and_args(user, session)
+        self.record_session_writes(user, session)
+        try:
+            old_session_id = yield functools.partial(
+                self.get_script(REPLACE_SESSION_SCRIPT), keys=keys, args=args
+            )
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write session to cache")
+
+        if old_session_id is not None:
+            self.record_writes(old_session_id.decode("utf8"))
+            yield from self.invalidate_cached_session_calls(
+                old_session_id.decode("utf8")
+            )
+
+        return session
+
+    def create_session_calls(self, user):
+        """Calls creating a session for a user"""
+        session = self.build_session(user)
+        if self.hash_storage:
+            yield from self.set_token_fields_calls(
+                session.session_id, session.to_dict()
+            )
+        else:
+            yield from self.set_token_data_calls(session.session_id, session.to_dict())
+
+        return session
+
+    def get_session_from_token_calls(self, token):
+        """Calls reading a session, served from the local cache if cached"""
+        session = self.get_cached_session(token)
+        if session is not None:
+            return session
+
+        session_data = yield from self.get_and_refresh_token_data_calls(token)
+        return self.load_session(token, session_data)
+
+    def get_session_fields_calls(self, token, fields):
+        """Calls reading some fields of a session"""
+        if token is None:
+            raise InvalidSessionException("No Session data found")
+
+        try:
+            if self.hash_storage:
+                session_data = yield from self.get_token_fields_calls(token, fields)
+            else:
+                session_data = yield from self.get_token_data_calls(token)
+
+        except TokenTypeException:
+            # Session written before the storage mode was switched
+            session_data = yield from self.get_and_refresh_token_data_calls(token)
+
+        return self.check_session_fields(session_data, fields)
+
+    def get_session_csrf_token_calls(self, token):
+        """Calls reading the csrf token of a session"""
+        session_data = yield from self.get_session_fields_calls(
+            token, [CSRF_FIELD_NAME]
+        )
+        return session_data[CSRF_FIELD_NAME]
+
+    def update_user_settings_calls(self, session, user_settings):
+        """Calls replacing the user settings stored on a session"""
+        session.user_settings = user_settings
+        updated = False
+        if self.hash_storage:
+            updated = yield from self.update_token_fields_calls(
+                session.session_id, {SETTINGS: user_settings}
+            )
+
+        if not updated:
+            # Also rewrites sessions stored as strings before hash storage was
+            # enabled, but never recreates expired sessions
+            updated = yield from self.set_token_data_calls(
+                session.session_id, session.to_dict(), only_if_exists=True
+            )
+
+        if not updated:
+            raise InvalidSessionException("Invalid Session data")
+
+        yield from self.invalidate_cached_session_calls(session.session_id)
+
+    def expire_token_calls(self, token):
+        """Calls removing a session token and invalidating it on all workers"""
+        yield from super().expire_token_calls(token)
+        yield from self.invalidate_cached_session_calls(token)
+
+    def expire_many_calls(self, tokens):
+        """Calls removing many session tokens and invalidating them on all workers"""
+        tokens = list(tokens)
+        removed = yield from super().expire_many_calls(tokens)
+        for token in tokens:
+            yield from self.invalidate_cached_session_calls(token)
+
+        return removed
+
+    def expire_session_calls(self, session):
+        """Calls expiring a session and its user/session mapping"""
+        yield from self.expire_token_calls(session.session_id)
+        yield from self.user_to_session_mapper.expire_token_calls(session.user_uuid)
+
+    def invalidate_cached_session_calls(self, session_id):
+        """Calls dropping a session from the local cache, notifying other workers
+
+        Note: Invalidations are published even without a local cache, since
+        other workers may be caching the session
+
+        """
+        if self.session_cache is not None:
+            self.session_cache.invalidate(session_id)
+
+        try:
+            yield functools.partial(
+                self.redis_client.publish, SESSION_INVALIDATION_CHANNEL, session_id
+            )
+
+        except Exception as exc:
+            self.log.error(exc)
+
+
+class SessionTokenManager(SessionTokenManagerCore, BaseTokenManager):
+    """Manager for Session data and tokens stored in a redis-based session store"""
+
+    user_to_session_mapper_class = UserToSessionTokenManager
 
     def create_and_set_session(self, user):
         """Create a session in the session store for a given user
@@ -42,18 +508,14 @@ class SessionTokenManager(BaseTokenManager):
         Args:
             user (User): user to set session for
 
+        Raises:
+            TokenWriteException: error writing to key-value store
+
         Notes:
             - Sets the session token as a cookie in the bottle route response
 
         """
-        # Delete any existing sessions if they exist
-        if self.user_to_session_mapper.does_user_session_exist(user):
-            session = self.user_to_session_mapper.get_user_session(user)
-            self.expire_session(session)
-            self.user_to_session_mapper.expire_user_session_entry(user)
-
-        session = self.create_session(user)
-        self.user_to_session_mapper.create_user_to_session_entry(user, session)
+        session = self.replace_user_session(user)
 
         # TODO: Add Secure once HTTPS supported
         response.set_cookie(
@@ -64,8 +526,8 @@ class SessionTokenManager(BaseTokenManager):
             samesite="Strict",
         )
 
-    def create_session(self, user):
-        """Creates a session for a user
+    def replace_user_session(self, user):
+        """Creates a session for a user, expiring any existing session
 
         Args:
             user (User): user to create session for
@@ -73,25 +535,27 @@ class SessionTokenManager(BaseTokenManager):
         Returns:
             Session
 
+        Raises:
+            TokenWriteException: error writing to key-value store
+
+        Notes:
+            - The existing session is expired and replaced in a single atomic
+              script call
+
         """
-        csrf_token = self.csrf_mgr.generate_token()
-        session_token = self.generate_token()
+        return run_calls(self.replace_user_session_calls(user))
 
-        # TODO: Add user settings?
-        dummy_settings = {"test": "A"}
+    def create_session(self, user):
+        """Creates a session for a user
 
-        session = Session(
-            session_token,
-            user.uuid,
-            user.username,
-            user.email,
-            dummy_settings,
-            csrf_token,
-        )
+        Args:
+            user (User): user to create session for
 
-        self.set_token_data(session_token, session.to_dict())
+        Returns:
+            Session
 
-        return session
+        """
+        return run_calls(self.create_session_calls(user))
 
     def get_session_from_token(self, token):
         """Gets a session object from a session token
@@ -106,54 +570,75 @@ class SessionTokenManager(BaseTokenManager):
             InvalidSessionException: Session is not valid
 
         """
-        if token is None:
-            raise InvalidSessionException("No Session data found")
+        return run_calls(self.get_session_from_token_calls(token))
 
-        if not self.does_token_exist(token):
-            raise InvalidSessionException("Invalid Session data")
+    def get_session_fields(self, token, fields):
+        """Gets some fields of a session without reading the whole session
+
+        Args:
+            token (str): session token
+            fields (List[str]): session fields to read, e.g. CSRF_FIELD_NAME
 
-        session_data = self.get_token_data(token)
-        self.refresh_token(token)
+        Returns:
+            Dict: value per field
 
-        return Session.from_jsons(token, session_data)
+        Raises:
+            InvalidSessionException: Session is not valid
 
-    def expire_session(self, session):
-        """Expires a session
+        Notes:
+            - Only the requested fields are read if sessions use hash storage
+
+        """
+        return run_calls(self.get_session_fields_calls(token, fields))
+
+    def get_session_csrf_token(self, token):
+        """Gets the csrf token of a session
 
         Args:
-            session (Session): session to expire
+            token (str): session token
+
+        Returns:
+            String: csrf token
+
+        Raises:
+            InvalidSessionException: Session is not valid
 
         """
-        self.expire_token(session.session_id)
-        self.user_to_session_mapper.expire_user_session_entry(session.user_uuid)
+        return run_calls(self.get_session_csrf_token_calls(token))
 
+    def update_user_settings(self, session, user_settings):
+        """Replaces the user settings stored on a session
 
-USER_TO_SESSION_CACHE_PREFIX = "user_to_sess"
+        Args:
+            session (Session): session to update
+            user_settings (Dict): new user settings
 
+        Raises:
+            InvalidSessionException: Session is not valid
 
-class UserToSessionTokenManager(BaseTokenManager):
-    """Manager for token that maps session to user name"""
+        Notes:
+            - Only the settings field is written if sessions use hash storage
 
-    def __init__(self, redis_client):
-        super().__init__(
-            None, SESSION_EXPIRATION_SEC, USER_TO_SESSION_CACHE_PREFIX, redis_client
-        )
+        """
+        run_calls(self.update_user_settings_calls(session, user_settings))
 
-    def does_user_session_exist(self, user):
-        """Checks for user having a session"""
-        return self.does_token_exist(user.uuid)
+    def expire_session(self, session):
+        """Expires a session
 
-    def get_user_session(self, user):
-        """Gets session data for user"""
-        return self.get_token_data(user.uuid)
+        Args:
+            session (Session): session to expire
 
-    def expire_user_session_entry(self, user):
-        """Expires user/session entry"""
-        return self.expire_token(user.uuid)
+        """
+        run_calls(self.expire_session_calls(session))
 
-    def create_user_to_session_entry(self, user, session):
-        """Creates a new user/session mapping entry"""
-        self.set_token_data(user.uuid, session.session_id)
+    def invalidate_cached_session(self, session_id):
+        """Drops a session from the local cache and notifies other workers
+
+        Args:
+            session_id (str): token of the session to invalidate
+
+        """
+        run_calls(self.invalidate_cached_session_calls(session_id))
 
 
 USER_ID_KEY = "user_uuidd"
@@ -165,6 +650,15 @@ SETTINGS = "settings"
 class Session:
     """Container Class for sessions"""
 
+    __slots__ = (
+        "session_id",
+        "user_uuid",
+        "username",
+        "email",
+        "user_settings",
+        "csrf_token",
+    )
+
     # TODO: Session id's should be encrypted when read
     def __init__(
         self, session_id, user_uuid, username, email, user_settings, csrf_token
@@ -190,7 +684,7 @@ class Session:
     @classmethod
     def from_dict(cls, session_id, data):
         """Gets a session from a dictionary object"""
-        return Session(
+        return cls(
             session_id,
             data[USER_ID_KEY],
             data[USERNAME_KEY],
@@ -7,10 +7,16 @@ managing tokens using Redis as the Backend data store
 
 """
 import json
-import random
-import string
+import functools
 from uuid import UUID
+from redis.exceptions import ResponseError
 from bottle_utils.src.monitoring.logging import LogMixin
+from bottle_utils.src.connectors.cluster import is_cluster_client
+from bottle_utils.src.tokens.calls import run_calls
+from bottle_utils.src.tokens.generator import DEFAULT_TOKEN_GENERATOR
+from bottle_utils.src.tokens.codecs import DEFAULT_CODEC, decode_token_data
+from bottle_utils.src.tokens.refresh import DEFAULT_REFRESH_POLICY
+from bottle_utils.src.tokens.replicas import DEFAULT_READ_YOUR_WRITES_SEC, RecentWrites
 
 
 class TokenException(Exception):
@@ -21,6 +27,10 @@ class TokenReadException(TokenException):
     """Thrown when token cannot be read from db"""
 
 
+class TokenTypeException(TokenReadException):
+    """Thrown when a token is stored as a string where a hash is read or vice versa"""
+
+
 class TokenWriteException(TokenException):
     """Thrown when token cannot be written to db"""
 
@@ -33,16 +43,534 @@ class TokenRefreshException(TokenException):
     """Exception thrown when token expiration refresh fails"""
 
 
-class BaseTokenManager(LogMixin):
-    """Base class for managers of tokens stored in redis"""
+# Sets hash fields only if the hash already exists so partial updates never
+# create a partial entry without an expiration time. Returns 0 for tokens
+# stored as strings
+#   KEYS: token key
+#   ARGV: field/value pairs
+UPDATE_TOKEN_FIELDS_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+
+# Replaces a hash and sets its expiration time. Used instead of a MULTI/EXEC
+# transaction, which cluster clients do not support
+#   KEYS: token key
+#   ARGV: expiration, field/value pairs
+SET_TOKEN_FIELDS_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+
+# Reads a string or hash, whichever the token is stored as, and resets its
+# expiration time if the remaining lifetime is below a threshold
+#   KEYS: token key
+#   ARGV: expiration, refresh threshold
+# Returns: raw string, flat field/value list for hashes, or nil if missing
+READ_AND_REFRESH_SCRIPT = """
+local data_type = redis.call('TYPE', KEYS[1]).ok
+local value
+if data_type == 'hash' then
+    value = redis.call('HGETALL', KEYS[1])
+elseif data_type == 'string' then
+    value = redis.call('GET', KEYS[1])
+else
+    return false
+end
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return value
+"""
+
+
+class TokenManagerCore(LogMixin):
+    """Configuration and key-value store independent logic of token managers
+
+    Shared by the blocking and asyncio token managers. Each operation is a
+    `*_calls` generator yielding its redis calls, which the blocking managers
+    run with `run_calls` and the asyncio managers with `run_calls_async`
+
+    Note: Token data is written with `codec` and read back with whichever codec
+    wrote it, so the codec can be changed without invalidating existing tokens
+
+    Note: `refresh_policy` decides when reading a token with one of the
+    `get_and_refresh_*` methods also resets its expiration time
+
+    Note: With a Redis Cluster client, keys of managers defining a hash tag for
+    their tokens embed the tag, so that keys sharing a tag map to the same slot
+    and can be used together in scripts. Keys written by a single node client
+    are not readable by a cluster client and vice versa
+
+    Note: If `replica_client` is provided, reads that can tolerate replication
+    lag go to the replica, except for tokens this process wrote or expired in
+    the last `read_your_writes_sec` seconds. Tokens missing on the replica are
+    read again from the primary, as they may have just been written by another
+    process. Writes always go to `redis_client`
+
+    """
+
+    read_your_writes_sec = DEFAULT_READ_YOUR_WRITES_SEC
 
     def __init__(
-        self, token_length, token_expiration_sec, token_cache_prefix, redis_client
+        self,
+        token_length,
+        token_expiration_sec,
+        token_cache_prefix,
+        redis_client,
+        codec=None,
+        refresh_policy=None,
+        replica_client=None,
     ):
         self.token_length = token_length
         self.token_expiration_sec = token_expiration_sec
         self.token_cache_prefix = token_cache_prefix
         self.redis_client = redis_client
+        self.codec = codec or DEFAULT_CODEC
+        self.refresh_policy = refresh_policy or DEFAULT_REFRESH_POLICY
+        self.cluster_mode = is_cluster_client(redis_client)
+        self.replica_client = replica_client
+        self.recent_writes = None
+        if replica_client is not None:
+            self.recent_writes = RecentWrites(self.read_your_writes_sec)
+
+        self._scripts = {}
+
+    def get_script(self, source):
+        """Gets a registered lua script, registering it on first use
+
+        Args:
+            source (str): lua source of the script
+
+        Returns:
+            redis.client.Script
+
+        """
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.redis_client.register_script(source)
+
+        return script
+
+    def get_token_key(self, token):
+        """Builds the key-value store key for a token
+
+        Args:
+            token (str): token to build key for
+
+        Returns:
+            String: prefixed key for the token
+
+        """
+        if self.cluster_mode:
+            hash_tag = self.get_hash_tag(token)
+            if hash_tag is not None:
+                return f"{self.token_cache_prefix}:{{{hash_tag}}}{token}"
+
+        return f"{self.token_cache_prefix}:{token}"
+
+    def get_hash_tag(self, token):
+        """Gets the cluster hash tag of a token
+
+        Args:
+            token (str): token to get the hash tag of
+
+        Returns:
+            String or None to place the key by its full name
+
+        """
+        return None
+
+    def generate_token(self):
+        """Generates a random token of some length
+
+        Returns:
+            String
+
+        Notes:
+            - Requires a default token length to be set
+            - Uses the os.urandom entropy source for maximal randomness
+
+        """
+        return DEFAULT_TOKEN_GENERATOR.generate(self.token_length)
+
+    def get_read_client(self, *tokens):
+        """Gets the client to read tokens from
+
+        Args:
+            tokens (str): tokens to be read
+
+        Returns:
+            the replica client, or the primary client if there is no replica or
+            one of the tokens was written recently by this process
+
+        """
+        if self.replica_client is None:
+            return self.redis_client
+
+        if any(self.get_token_key(token) in self.recent_writes for token in tokens):
+            return self.redis_client
+
+        return self.replica_client
+
+    def record_writes(self, *tokens):
+        """Records tokens written or expired so they are read from the primary"""
+        if self.recent_writes is not None:
+            for token in tokens:
+                self.recent_writes.add(self.get_token_key(token))
+
+    def get_mget(self, redis_client=None):
+        """Gets the command reading many keys, split by slot for cluster clients"""
+        redis_client = redis_client or self.redis_client
+        if self.cluster_mode:
+            return redis_client.mget_nonatomic
+
+        return redis_client.mget
+
+    def encode_fields(self, fields):
+        """Encodes each value of a mapping of hash fields with the codec"""
+        return {field: self.codec.encode(value) for field, value in fields.items()}
+
+    def flatten_fields(self, fields):
+        """Encodes hash fields into a flat field/value list for lua scripts"""
+        args = []
+        for field, value in self.encode_fields(fields).items():
+            args += [field, value]
+
+        return args
+
+    def get_refresh_args(self):
+        """Arguments of the read-and-refresh script"""
+        return [
+            self.token_expiration_sec,
+            self.refresh_policy.refresh_threshold_sec(self.token_expiration_sec),
+        ]
+
+    def get_expiration_sec(self, token, expiration_sec):
+        """Resolves a shared or per-token expiration time for a token"""
+        if expiration_sec is None:
+            return self.token_expiration_sec
+
+        if isinstance(expiration_sec, dict):
+            return expiration_sec.get(token, self.token_expiration_sec)
+
+        return expiration_sec
+
+    def parse_replica_read(self, string_value, hash_value, ttl):
+        """Converts a replica read into the result of the read-and-refresh script
+
+        Args:
+            string_value: result of GET, an exception for tokens stored as hashes
+            hash_value: result of HGETALL, an exception for tokens stored as
+                strings
+            ttl (int): remaining lifetime of the token read from the replica
+
+        Returns:
+            Tuple: raw string or flattened hash (None if missing) and whether the
+                expiration time must be reset on the primary
+
+        """
+        if isinstance(string_value, bytes):
+            value = string_value
+        elif isinstance(hash_value, dict) and hash_value:
+            value = [item for field_value in hash_value.items() for item in field_value]
+        else:
+            return None, False
+
+        threshold = self.refresh_policy.refresh_threshold_sec(self.token_expiration_sec)
+        return value, ttl < threshold
+
+    @staticmethod
+    def decode_fields(fields, values):
+        """Pairs requested hash fields with their decoded values"""
+        return {field: decode_token_data(value) for field, value in zip(fields, values)}
+
+    @classmethod
+    def decode_stored_value(cls, value):
+        """Decodes a raw string or flat field/value list read by a script"""
+        if isinstance(value, list):
+            return cls.decode_flat_fields(value)
+
+        return decode_token_data(value)
+
+    @staticmethod
+    def is_wrong_type_error(exc):
+        """Checks for an error reading a string as a hash or vice versa"""
+        return isinstance(exc, ResponseError) and str(exc).startswith("WRONGTYPE")
+
+    @staticmethod
+    def decode_flat_fields(flat_fields):
+        """Decodes a flat field/value list returned by a lua script"""
+        if flat_fields is None:
+            return None
+
+        return {
+            flat_fields[i].decode("utf8"): decode_token_data(flat_fields[i + 1])
+            for i in range(0, len(flat_fields), 2)
+        }
+
+    def does_token_exist_calls(self, token):
+        """Calls checking for a token, see BaseTokenManager.does_token_exist"""
+        key = self.get_token_key(token)
+        read_client = self.get_read_client(token)
+        try:
+            exists = yield functools.partial(read_client.exists, key)
+            if not exists and read_client is not self.redis_client:
+                exists = yield functools.partial(self.redis_client.exists, key)
+
+            return exists
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenReadException("Failed to access Token cache")
+
+    def expire_token_calls(self, token):
+        """Calls removing a token, see BaseTokenManager.expire_token"""
+        self.record_writes(token)
+        try:
+            yield functools.partial(self.redis_client.delete, self.get_token_key(token))
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenExpirationException("Could Not Expire Token")
+
+    def refresh_token_calls(self, token):
+        """Calls resetting the expiration of a token, see BaseTokenManager"""
+        try:
+            yield functools.partial(
+                self.redis_client.expire,
+                self.get_token_key(token),
+                self.token_expiration_sec,
+            )
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenRefreshException("Could not refresh Token")
+
+    def get_token_data_calls(self, token):
+        """Calls reading the data of a token, see BaseTokenManager.get_token_data"""
+        key = self.get_token_key(token)
+        read_client = self.get_read_client(token)
+        try:
+            value = yield functools.partial(read_client.get, key)
+            if value is None and read_client is not self.redis_client:
+                value = yield functools.partial(self.redis_client.get, key)
+
+            return decode_token_data(value)
+
+        except Exception as exc:
+            if self.is_wrong_type_error(exc):
+                raise TokenTypeException("Token data is stored as a hash")
+
+            self.log.error(exc)
+            raise TokenReadException("Failed to read Token Data")
+
+    def get_and_refresh_token_data_calls(self, token):
+        """Calls reading and refreshing a token, see BaseTokenManager"""
+        value = yield from self.read_and_refresh_calls(token)
+        return self.decode_stored_value(value)
+
+    def read_and_refresh_calls(self, token):
+        """Calls reading a raw string or flattened hash, applying the refresh policy
+
+        With a replica the token is read from the replica, and its expiration
+        time is reset on the primary only when the refresh policy requires it.
+        Tokens missing on the replica are read and refreshed on the primary
+        """
+        key = self.get_token_key(token)
+        read_client = self.get_read_client(token)
+        try:
+            if read_client is not self.redis_client:
+                # The command not matching the stored type fails on its own
+                pipe = read_client.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.hgetall(key)
+                pipe.ttl(key)
+                results = yield functools.partial(pipe.execute, raise_on_error=False)
+                value, needs_refresh = self.parse_replica_read(*results)
+                if value is not None:
+                    if needs_refresh:
+                        yield functools.partial(
+                            self.redis_client.expire, key, self.token_expiration_sec
+                        )
+
+                    return value
+
+            value = yield functools.partial(
+                self.get_script(READ_AND_REFRESH_SCRIPT),
+                keys=[key],
+                args=self.get_refresh_args(),
+            )
+            return value
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenReadException("Failed to read Token Data")
+
+    def set_token_data_calls(self, token, data, only_if_exists=False):
+        """Calls attaching data to a token, see BaseTokenManager.set_token_data"""
+        self.record_writes(token)
+        try:
+            written = yield functools.partial(
+                self.redis_client.set,
+                self.get_token_key(token),
+                self.codec.encode(data),
+                ex=self.token_expiration_sec,
+                xx=only_if_exists,
+            )
+            return bool(written)
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write token data to cache")
+
+    def get_token_fields_calls(self, token, fields):
+        """Calls reading hash fields of a token, see BaseTokenManager"""
+        fields = list(fields)
+        key = self.get_token_key(token)
+        read_client = self.get_read_client(token)
+        try:
+            values = yield functools.partial(read_client.hmget, key, fields)
+            if read_client is not self.redis_client and all(
+                value is None for value in values
+            ):
+                values = yield functools.partial(self.redis_client.hmget, key, fields)
+
+            return self.decode_fields(fields, values)
+
+        except Exception as exc:
+            if self.is_wrong_type_error(exc):
+                raise TokenTypeException("Token data is stored as a string")
+
+            self.log.error(exc)
+            raise TokenReadException("Failed to read Token Data")
+
+    def set_token_fields_calls(self, token, fields):
+        """Calls replacing the hash of a token, see BaseTokenManager"""
+        self.record_writes(token)
+        try:
+            yield functools.partial(
+                self.get_script(SET_TOKEN_FIELDS_SCRIPT),
+                keys=[self.get_token_key(token)],
+                args=[self.token_expiration_sec, *self.flatten_fields(fields)],
+            )
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write token data to cache")
+
+    def update_token_fields_calls(self, token, fields):
+        """Calls updating hash fields of a token, see BaseTokenManager"""
+        self.record_writes(token)
+        try:
+            updated = yield functools.partial(
+                self.get_script(UPDATE_TOKEN_FIELDS_SCRIPT),
+                keys=[self.get_token_key(token)],
+                args=self.flatten_fields(fields),
+            )
+            return bool(updated)
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write token data to cache")
+
+    def exists_many_calls(self, tokens):
+        """Calls checking for many tokens, see BaseTokenManager.exists_many"""
+        tokens = list(tokens)
+        read_client = self.get_read_client(*tokens)
+        try:
+            pipe = read_client.pipeline(transaction=False)
+            for token in tokens:
+                pipe.exists(self.get_token_key(token))
+
+            results = yield pipe.execute
+            found = {token: bool(exists) for token, exists in zip(tokens, results)}
+            missing = [token for token, exists in found.items() if not exists]
+            if missing and read_client is not self.redis_client:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for token in missing:
+                    pipe.exists(self.get_token_key(token))
+
+                results = yield pipe.execute
+                found.update(
+                    (token, bool(exists)) for token, exists in zip(missing, results)
+                )
+
+            return found
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenReadException("Failed to access Token cache")
+
+    def get_many_calls(self, tokens):
+        """Calls reading the data of many tokens, see BaseTokenManager.get_many"""
+        tokens = list(tokens)
+        if not tokens:
+            return {}
+
+        read_client = self.get_read_client(*tokens)
+        try:
+            values = yield functools.partial(
+                self.get_mget(read_client),
+                [self.get_token_key(token) for token in tokens],
+            )
+            found = dict(zip(tokens, values))
+            missing = [token for token, value in found.items() if value is None]
+            if missing and read_client is not self.redis_client:
+                values = yield functools.partial(
+                    self.get_mget(), [self.get_token_key(token) for token in missing]
+                )
+                found.update(zip(missing, values))
+
+            return self.decode_fields(tokens, list(found.values()))
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenReadException("Failed to read Token Data")
+
+    def set_many_calls(self, token_data, expiration_sec=None):
+        """Calls attaching data to many tokens, see BaseTokenManager.set_many"""
+        self.record_writes(*token_data)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for token, data in token_data.items():
+                pipe.set(
+                    self.get_token_key(token),
+                    self.codec.encode(data),
+                    ex=self.get_expiration_sec(token, expiration_sec),
+                )
+
+            yield pipe.execute
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenWriteException("Could not write token data to cache")
+
+    def expire_many_calls(self, tokens):
+        """Calls removing many tokens, see BaseTokenManager.expire_many"""
+        tokens = list(tokens)
+        keys = [self.get_token_key(token) for token in tokens]
+        if not keys:
+            return 0
+
+        self.record_writes(*tokens)
+        try:
+            removed = yield functools.partial(self.redis_client.delete, *keys)
+            return removed
+
+        except Exception as exc:
+            self.log.error(exc)
+            raise TokenExpirationException("Could Not Expire Token")
+
+
+class BaseTokenManager(TokenManagerCore):
+    """Base class for managers of tokens stored in redis"""
 
     def does_token_exist(self, token):
         """Checks for token in key-value store
@@ -53,12 +581,7 @@ class BaseTokenManager(LogMixin):
         Raises:
             TokenReadException: unable to reach key-value store
         """
-        try:
-            return self.redis_client.exists(f"{self.token_cache_prefix}:{token}")
-
-        except Exception as exc:
-            self.log.error(exc)
-            raise TokenReadException("Failed to access Token cache")
+        return run_calls(self.does_token_exist_calls(token))
 
     def expire_token(self, token):
         """Removes a token from the key-value store
@@ -70,12 +593,7 @@ class BaseTokenManager(LogMixin):
             TokenExpirationException: raised on failure to delete
 
         """
-        try:
-            self.redis_client.delete(f"{self.token_cache_prefix}:{token}")
-
-        except Exception as exc:
-            self.log.error(exc)
-            raise TokenExpirationException("Could Not Expire Token")
+        return run_calls(self.expire_token_calls(token))
 
     def refresh_token(self, token):
         """Resets the expiration time of a token
@@ -87,12 +605,7 @@ class BaseTokenManager(LogMixin):
             TokenRefreshException: raised on failure to edit
 
         """
-        try:
-            self.redis_client.expire(token, self.token_expiration_sec)
-
-        except Exception as exc:
-            self.log.error(exc)
-            raise TokenRefreshException("Could not refresh Token")
+        return run_calls(self.refresh_token_calls(token))
 
     def get_token_data(self, token):
         """Gets data attached to a token `key` in the key-value store
@@ -100,24 +613,49 @@ class BaseTokenManager(LogMixin):
         Args:
             token (str): key to get value for in key-value store
 
+        Returns:
+            decoded token data or None if the token does not exist
+
         Raises:
             TokenReadException: error reading key-value store
 
         """
-        try:
-            return self.redis_client.get(f"{self.token_cache_prefix}:{token}")
+        return run_calls(self.get_token_data_calls(token))
 
-        except Exception as exc:
-            self.log.error(exc)
-            raise TokenReadException("Failed to read Token Data")
+    def get_and_refresh_token_data(self, token):
+        """Gets data attached to a token and resets its expiration time
+
+        The read and the sliding expiration run in a single script call so they
+        cost one round trip to the key-value store. The expiration time is only
+        reset if the refresh policy requires it
+
+        Args:
+            token (str): key to get value for in key-value store
+
+        Returns:
+            decoded token data or None if the token does not exist. Tokens
+            stored as hashes are decoded into a Dict of their fields
+
+        Raises:
+            TokenReadException: error reading key-value store
+
+        """
+        return run_calls(self.get_and_refresh_token_data_calls(token))
+
+    # Reads whichever of a string or hash the token is stored as
+    get_and_refresh_token_fields = get_and_refresh_token_data
 
-    def set_token_data(self, token, data):
+    def set_token_data(self, token, data, only_if_exists=False):
         """Attaches data to the key (token) value in the key-value store
 
         Args:
             token (str):
-            data (<? encodable to json>): Some data that can be converted
-                to a json-formatted string
+            data (<? encodable by codec>): Some data that can be encoded
+                by the token manager codec
+            only_if_exists (bool): only overwrite data of an existing token
+
+        Returns:
+            bool: False if only_if_exists is set and the token does not exist
 
         Raises:
             TokenWriteException: error writing to key-value store
@@ -126,38 +664,122 @@ class BaseTokenManager(LogMixin):
             - Sets a default expiration time on this data
 
         """
-        try:
-            self.redis_client.set(
-                f"{self.token_cache_prefix}:{token}",
-                json.dumps(data, cls=UUIDEncoder),
-                ex=self.token_expiration_sec,
-            )
+        return run_calls(self.set_token_data_calls(token, data, only_if_exists))
 
-        except Exception as exc:
-            self.log.error(exc)
-            raise TokenWriteException("Could not write token data to cache")
+    def get_token_fields(self, token, fields):
+        """Gets some fields of the hash attached to a token
 
-    def generate_token(self):
-        """Generates a random token of some length
+        Args:
+            token (str): key of the hash in the key-value store
+            fields (List[str]): fields to read
 
         Returns:
-            String
+            Dict: decoded value per field, None for missing fields
+
+        Raises:
+            TokenReadException: error reading key-value store
+
+        """
+        return run_calls(self.get_token_fields_calls(token, fields))
+
+    def set_token_fields(self, token, fields):
+        """Replaces the hash attached to a token, encoding each field separately
+
+        Args:
+            token (str): key of the hash in the key-value store
+            fields (Dict[str, <? encodable by codec>]): field values to store
+
+        Raises:
+            TokenWriteException: error writing to key-value store
 
         Notes:
-            - Requires a default token length to be set
-            - Uses the system random generator for maximal randomness
+            - Sets a default expiration time on this data
 
         """
-        return "".join(
-            random.SystemRandom().choice(
-                string.ascii_lowercase + string.ascii_uppercase + string.digits
-            )
-            for _ in range(self.token_length)
-        )
+        return run_calls(self.set_token_fields_calls(token, fields))
+
+    def update_token_fields(self, token, fields):
+        """Updates some fields of an existing hash attached to a token
+
+        Args:
+            token (str): key of the hash in the key-value store
+            fields (Dict[str, <? encodable by codec>]): field values to update
+
+        Returns:
+            bool: False if the token does not exist
+
+        Raises:
+            TokenWriteException: error writing to key-value store
+
+        """
+        return run_calls(self.update_token_fields_calls(token, fields))
+
+    def exists_many(self, tokens):
+        """Checks for many tokens in the key-value store in one round trip
+
+        Args:
+            tokens (List[str]): tokens to check for
+
+        Returns:
+            Dict[str, bool]: whether each token exists
+
+        Raises:
+            TokenReadException: unable to reach key-value store
+
+        """
+        return run_calls(self.exists_many_calls(tokens))
+
+    def get_many(self, tokens):
+        """Gets the data attached to many tokens in one round trip
+
+        Args:
+            tokens (List[str]): tokens to get values for
+
+        Returns:
+            Dict: decoded token data, None for tokens that do not exist
+
+        Raises:
+            TokenReadException: error reading key-value store
+
+        """
+        return run_calls(self.get_many_calls(tokens))
+
+    def set_many(self, token_data, expiration_sec=None):
+        """Attaches data to many tokens in one round trip
+
+        Args:
+            token_data (Dict[str, <? encodable by codec>]): data to set per token
+            expiration_sec (int | Dict[str, int]): expiration time for all tokens
+                or per token. Defaults to the manager expiration time
+
+        Raises:
+            TokenWriteException: error writing to key-value store
+
+        """
+        return run_calls(self.set_many_calls(token_data, expiration_sec))
+
+    def expire_many(self, tokens):
+        """Removes many tokens from the key-value store in one round trip
+
+        Args:
+            tokens (List[str]): tokens to expire
+
+        Returns:
+            int: number of tokens that were removed
+
+        Raises:
+            TokenExpirationException: raised on failure to delete
+
+        """
+        return run_calls(self.expire_many_calls(tokens))
 
 
 class UUIDEncoder(json.JSONEncoder):
-    """UUID encoder to allow the writing of UUID's to json format"""
+    """UUID encoder to allow the writing of UUID's to json format
+
+    Note: Kept for compatibility, token data is now encoded by a TokenCodec
+
+    """
 
     def default(self, o):
         if isinstance(o, UUID):
@@ -6,8 +6,8 @@ Token manager class and associated settings and exceptions for
 managing Email validation tokens using Redis as the Backend data store
 
 """
-from bottle_utils.src.tokens.token_manager import BaseTokenManager
-import json
+from bottle_utils.src.tokens.calls import run_calls
+from bottle_utils.src.tokens.token_manager import BaseTokenManager, TokenManagerCore
 
 
 VERIFICATION_TOKEN_LENGTH = 20
@@ -19,24 +19,81 @@ class VerificationTokenInvalidException(Exception):
     """Invalid Email verification token"""
 
 
-class VerificationTokenManager(BaseTokenManager):
-    """Manager for email verification tokens stored redis key-value store"""
+class VerificationTokenManagerCore(TokenManagerCore):
+    """Key-value store independent logic of email verification token managers"""
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, codec=None, replica_client=None):
         super().__init__(
             VERIFICATION_TOKEN_LENGTH,
             VERIFICATION_TOKEN_EXPIRATION_SEC,
             VERIFICATION_KEY_PREFIX,
             redis_client,
+            codec,
+            replica_client=replica_client,
         )
 
+    @staticmethod
+    def build_verification_data(user):
+        """Data stored with the email verification token of a user"""
+        return {"user_id": user.uuid}
+
+    @staticmethod
+    def check_verification_data(token, data):
+        """Checks the data read for an email verification token
+
+        Args:
+            token (str): email verification token
+            data (Dict): user data or None if the token does not exist
+
+        Raises:
+            VerificationTokenInvalidException: bad email verification token
+
+        Returns:
+            Dict: user data
+
+        """
+        if token is None:
+            raise VerificationTokenInvalidException("No Email Validation Token")
+
+        if data is None:
+            raise VerificationTokenInvalidException("Invalid Email Validation Token")
+
+        return data
+
+    def is_valid_verification_token_calls(self, token):
+        """Calls checking for an email verification token"""
+        return (yield from self.does_token_exist_calls(token))
+
+    def expire_verification_token_calls(self, token):
+        """Calls expiring an email verification token"""
+        yield from self.expire_token_calls(token)
+
+    def get_verification_token_user_data_calls(self, token):
+        """Calls reading the user data of an email verification token"""
+        if token is None:
+            raise VerificationTokenInvalidException("No Email Validation Token")
+
+        data = yield from self.get_token_data_calls(token)
+        return self.check_verification_data(token, data)
+
+    def create_email_verification_token_calls(self, user):
+        """Calls creating an email verification token for a user"""
+        token = self.generate_token()
+        yield from self.set_token_data_calls(token, self.build_verification_data(user))
+
+        return token
+
+
+class VerificationTokenManager(VerificationTokenManagerCore, BaseTokenManager):
+    """Manager for email verification tokens stored redis key-value store"""
+
     def is_valid_verification_token(self, token):
         """Checks if token is in key-value store"""
-        return self.does_token_exist(token)
+        return run_calls(self.is_valid_verification_token_calls(token))
 
     def expire_verification_token(self, token):
         """Expires email verification token in key-value store"""
-        self.expire_token(token)
+        run_calls(self.expire_verification_token_calls(token))
 
     def get_verification_token_user_data(self, token):
         """Gets user associated with the email verification token
@@ -51,13 +108,7 @@ class VerificationTokenManager(BaseTokenManager):
             Dict: user data
 
         """
-        if token is None:
-            raise VerificationTokenInvalidException("No Email Validation Token")
-
-        if not self.is_valid_verification_token(token):
-            raise VerificationTokenInvalidException("Invalid Email Validation Token")
-
-        return json.loads(self.get_token_data(token))
+        return run_calls(self.get_verification_token_user_data_calls(token))
 
     def create_email_verification_token(self, user):
         """Generates a new email verification token for a user
@@ -70,8 +121,4 @@ class VerificationTokenManager(BaseTokenManager):
             String: verification token string
 
         """
-        token = self.generate_token()
-        data = {"user_id": user.uuid}
-        self.set_token_data(token, data)
-
-        return token
+        return run_calls(self.create_email_verification_token_calls(user))
@@ -6,11 +6,34 @@ Allows users to add csrf-enabled WTForms form to a route.
 
 """
 from bottle_utils.src.templating.flash import Flash, FlashLvl
+from bottle_utils.src.tokens.session import SESSION_COOKIE_NAME
 from bottle import request
 
 
-def csrf_form(form_class):
-    """Generate form with csrf for a route to return to a user"""
+def _get_form_meta(session, session_bound):
+    meta = {
+        # pylint: disable=no-member
+        "csrf_token_mgr": request.app.csrf_mgr,
+        "session": session,
+    }
+    if session is None and session_bound:
+        meta["session_token"] = request.get_cookie(SESSION_COOKIE_NAME, default=None)
+        # pylint: disable=no-member
+        meta["session_mgr"] = request.app.session_mgr
+
+    return meta
+
+
+def csrf_form(form_class, session_bound=False):
+    """Generate form with csrf for a route to return to a user
+
+    Args:
+        form_class (wtforms.Form): form using RedisCacheCSRF
+        session_bound (bool): bind the form to the session cookie of routes
+            without a loaded session. Only the csrf token of the session is
+            read, instead of the whole session
+
+    """
 
     def decorator(fxn):
         def wrapper(*args, **kwargs):
@@ -22,11 +45,7 @@ def csrf_form(form_class):
             if request.method == "POST":
                 form = form_class(
                     request.POST,
-                    meta={
-                        # pylint: disable=no-member
-                        "csrf_token_mgr": request.app.csrf_mgr,
-                        "session": kwargs.get("session", None),
-                    },
+                    meta=_get_form_meta(kwargs.get("session", None), session_bound),
                 )
 
                 if form.validate():
@@ -49,11 +68,7 @@ def csrf_form(form_class):
             # Form needs to be built for a get route
             if request.method == "GET":
                 form = form_class(
-                    meta={
-                        # pylint: disable=no-member
-                        "csrf_token_mgr": request.app.csrf_mgr,
-                        "session": kwargs.get("session", None),
-                    }
+                    meta=_get_form_meta(kwargs.get("session", None), session_bound)
                 )
                 return fxn(*args, form=form, **kwargs)
 
@@ -1,56 +1,289 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""
+"""Rate limiting plugin for bottle apps
+
+The plugin resolves the policy, key function and limiter of each route once,
+when bottle applies plugins to the route, so handling a request only costs
+building the counter key and a single limiter check. Responses carry the
+`RateLimit-Limit`, `RateLimit-Remaining` and `RateLimit-Reset` headers, and
+rejected requests get a 429 response with a `Retry-After` header.
+
+Example usage:
+```
+app = Bottle()
+app.rate_limit_mgr = RateLimitCounterManager(redis_client)
+app.install(RateLimitPlugin())
+
+@app.get("/login", rate_limit=RateLimitPolicy(5, period_sec=60))
+def login():
+    ...
 
+@app.get("/search")
+@rate_limit(RateLimitPolicy(10, burst=20, algorithm=RateLimitAlgorithm.GCRA))
+def search():
+    ...
+```
 
 """
-# pylint: skip-file
-# TODO: Implement and remove pylint suppression
-from bottle import request, redirect, abort, HTTPError
-from bottle_utils.src.tokens.session import InvalidSessionException, SESSION_COOKIE_NAME
-from bottle_utils.src.tokens.csrf import CSRF_FIELD_NAME
-from bottle_utils.src.templating.flash import Flash, FlashLvl
+import types
+import functools
+import math
+import structlog
+from bottle import response, abort, HTTPError, PluginError
+from bottle_utils.src.counters.local import HybridRateLimiter
+from bottle_utils.src.counters.policies import (
+    MultiWindowPolicy,
+    RateLimitAlgorithm,
+    RateLimitPolicy,
+)
+from bottle_utils.src.monitoring.logging import LogMixin
+
+
+# Requests per second per client and route of routes marked without a policy
+DEFAULT_MAX_RATE_PER_SECOND = 10
+
+RATE_LIMIT_CONFIG_KEY = "rate_limit"
+RATE_LIMIT_KEY_FUNC_CONFIG_KEY = "rate_limit_key_func"
+RATE_LIMIT_LIMIT_HEADER = "RateLimit-Limit"
+RATE_LIMIT_REMAINING_HEADER = "RateLimit-Remaining"
+RATE_LIMIT_RESET_HEADER = "RateLimit-Reset"
+RETRY_AFTER_HEADER = "Retry-After"
+
+log = structlog.get_logger(__name__)
+
+
+def rate_limit(*args, key_func=None):
+    """Marks a route as rate limited by the RateLimitPlugin
+
+    Can be used bare (`@rate_limit`) to apply the default policy of the plugin,
+    or `DEFAULT_MAX_RATE_PER_SECOND` if it has none, or with a maximum
+    number of requests per second (`@rate_limit(10)`), a RateLimitPolicy, or a
+    list of RateLimitPolicy windows checked together as a MultiWindowPolicy.
+    `@rate_limit(False)` excludes a route from the default policy of the plugin.
+    Equivalent to passing `rate_limit=policy` to the route decorator
+
+    Args:
+        key_func (Callable): key function for the route, overriding the key
+            function of the plugin
+
+    Notes:
+        - Limits are only enforced by an installed RateLimitPlugin. Marked
+          functions log an error when called on a route the plugin did not wrap
+
+    """
+
+    def _rate_limit(fxn, policy):
+        @functools.wraps(fxn)
+        def wrapper(*args, **kwargs):
+            if not wrapper.rate_limit_applied and not wrapper.rate_limit_warned:
+                wrapper.rate_limit_warned = True
+                log.error(
+                    "Rate limited function called without a RateLimitPlugin",
+                    function=fxn.__qualname__,
+                )
+
+            return fxn(*args, **kwargs)
+
+        wrapper.rate_limit_policy = policy
+        wrapper.rate_limit_key_func = key_func
+        wrapper.rate_limit_applied = False
+        wrapper.rate_limit_warned = False
+        return wrapper
+
+    if len(args) == 1 and callable(args[0]):
+        # if no arguments present use the defaults
+        return _rate_limit(args[0], True)
+
+    policy = args[0] if args else True
+    return lambda fxn: _rate_limit(fxn, policy)
+
+
+def _get_marked_callback(callback):
+    """Finds the outermost function marked by `rate_limit` in a decorator chain
+
+    Follows `__wrapped__` and functions held in closures, so markers are found
+    above decorators that do not use functools.wraps (e.g. `session_auth`)
+    """
+    seen = set()
+    pending = [callback]
+    while pending:
+        fxn = pending.pop(0)
+        if id(fxn) in seen:
+            continue
+
+        seen.add(id(fxn))
+        if hasattr(fxn, "rate_limit_policy"):
+            return fxn
+
+        fxn = getattr(fxn, "__func__", fxn)
+        wrapped = getattr(fxn, "__wrapped__", None)
+        if wrapped is not None:
+            pending.append(wrapped)
+
+        for cell in getattr(fxn, "__closure__", None) or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                continue
 
+            if isinstance(contents, (types.FunctionType, types.MethodType)):
+                pending.append(contents)
 
-# TODO: Update to somthing reasonable
-DEFAULT_MAX_RATE_PER_SECOND = 20122321321
+    return None
 
 
-def rate_limit(*args):
-    """Limits the number of requests to this API for a given API"""
+def _get_policy(policy):
+    if policy is None or isinstance(policy, (RateLimitPolicy, MultiWindowPolicy)):
+        return policy
 
-    def _rate_limit(fxn):
+    if isinstance(policy, (list, tuple)):
+        return MultiWindowPolicy(policy)
+
+    if policy is True:
+        return RateLimitPolicy(DEFAULT_MAX_RATE_PER_SECOND)
+
+    if policy is False:
+        return None
+
+    return RateLimitPolicy(policy)
+
+
+def _has_local_tier(policy):
+    """Whether a policy can be checked by a HybridRateLimiter"""
+    return (
+        isinstance(policy, RateLimitPolicy)
+        and policy.algorithm == RateLimitAlgorithm.FIXED_WINDOW
+    )
+
+
+class RateLimitPlugin(LogMixin):
+    """Bottle plugin rate limiting routes
+
+    Args:
+        counter_mgr (RateLimitCounterManager): manager checking counters.
+            Defaults to the `rate_limit_mgr` attribute of the app
+        default_policy (RateLimitPolicy): policy of routes without one, and of
+            routes marked with `rate_limit=True` or a bare `@rate_limit`. Routes
+            without a policy are not limited if not set, while marked routes get
+            `DEFAULT_MAX_RATE_PER_SECOND`
+        key_func (Callable): default key function. Defaults to the key function
+            of the counter manager
+        hybrid (bool): check a local HybridRateLimiter per route before redis,
+            synced from a background thread. Only fixed window policies have a
+            local tier, other routes are checked in redis and logged at install
+
+    Notes:
+        - Routes opt in or out with `rate_limit=policy|rate|True|False` route config
+          or the `rate_limit` decorator
+        - Whether requests are admitted while redis is unavailable is set by
+          `fail_open` of the counter manager. Other limiter failures get a 500
+
+    """
+
+    name = "rate_limit"
+    api = 2
+
+    def __init__(
+        self,
+        counter_mgr=None,
+        default_policy=None,
+        key_func=None,
+        hybrid=False,
+    ):
+        self.counter_mgr = counter_mgr
+        self.default_policy = _get_policy(default_policy)
+        self.key_func = key_func
+        self.hybrid = hybrid
+
+    def setup(self, app):
+        """Checks that no other rate limiting plugin is installed"""
+        for other in app.plugins:
+            if isinstance(other, RateLimitPlugin) and other is not self:
+                raise PluginError("Found another rate limit plugin")
+
+    def get_route_limit(self, route):
+        """Resolves the policy and key function of a route
+
+        Args:
+            route (bottle.Route): route being compiled
+
+        Returns:
+            Tuple: policy, or None if the route is not limited, and key function
+
+        """
+        callback = _get_marked_callback(route.callback)
+        if callback is not None:
+            callback.rate_limit_applied = True
+
+        policy = route.config.get(RATE_LIMIT_CONFIG_KEY)
+        if policy is None:
+            policy = getattr(callback, "rate_limit_policy", None)
+
+        if policy is True and self.default_policy is not None:
+            policy = self.default_policy
+
+        # Routes opt out of the default policy with `rate_limit=False` or
+        # `@rate_limit(False)`
+        excluded = policy is False
+        policy = _get_policy(policy)
+        if policy is None and not excluded:
+            policy = self.default_policy
+
+        key_func = route.config.get(RATE_LIMIT_KEY_FUNC_CONFIG_KEY) or getattr(
+            callback, "rate_limit_key_func", None
+        )
+        return policy, key_func or self.key_func
+
+    def apply(self, callback, route):
+        """Wraps a route callback with its rate limit check"""
+        policy, key_func = self.get_route_limit(route)
+        if policy is None:
+            return callback
+
+        counter_mgr = self.counter_mgr or route.app.rate_limit_mgr
+        if self.hybrid and _has_local_tier(policy):
+            check = HybridRateLimiter(counter_mgr, policy, background_sync=True).check
+        else:
+            if self.hybrid:
+                self.log.warning(
+                    "Local rate limit tier skipped, policy not fixed window",
+                    route=route.rule,
+                )
+            check = functools.partial(counter_mgr.check, policy)
+
+        get_counter_key = functools.partial(
+            counter_mgr.get_counter_key, key_func or counter_mgr.key_func
+        )
+        set_header = response.set_header
+        log = self.log
+
+        @functools.wraps(callback)
         def wrapper(*args, **kwargs):
-            log = structlog.get_logger(__name__)
             try:
-                counter = request.app.rate_limit_mgr.get_or_create_counter()
-
-                if counter.value > max_rate_per_second:
-                    log.error(
-                        f"Exceeded rate for ip: {request.remote_addr} with counter value: {counter.value}"
-                    )
-                    log.error(f"Rate Exceeded request data: {request}")
-                    return HTTPError(
-                        status=429, body="Too Many Requests. Wait before retrying"
-                    )
-                else:
-                    counter.increment()
-                    return fxn(*args, **kwargs)
+                result = check(get_counter_key())
 
             except Exception as exc:
                 log.error("Failed Rate Limit Check")
                 log.error(exc)
+                return abort(500, "Internal Service Error")
 
-                # TODO: Need to update this to have metrics emitted
+            limit = str(result.limit)
+            reset = str(math.ceil(result.reset_sec))
+            if not result.allowed:
+                raise HTTPError(
+                    status=429,
+                    body="Too Many Requests. Wait before retrying",
+                    headers={
+                        RATE_LIMIT_LIMIT_HEADER: limit,
+                        RATE_LIMIT_REMAINING_HEADER: "0",
+                        RATE_LIMIT_RESET_HEADER: reset,
+                        RETRY_AFTER_HEADER: str(math.ceil(result.retry_after_sec)),
+                    },
+                )
 
-                return abort(500, "Internal Service Error")
+            set_header(RATE_LIMIT_LIMIT_HEADER, limit)
+            set_header(RATE_LIMIT_REMAINING_HEADER, str(result.remaining))
+            set_header(RATE_LIMIT_RESET_HEADER, reset)
+            return callback(*args, **kwargs)
 
         return wrapper
-
-    if len(args) == 1 and callable(args[0]):
-        # if no arguments present use the defaults
-        max_rate_per_second = DEFAULT_MAX_RATE_PER_SECOND
-        return _rate_limit(args[0])
-    else:
-        max_rate_per_second = args[0]
-        return _rate_limit
@@ -6,8 +6,13 @@ Allows clean checking of authorization to be added to bottle routes using
 a decorator
 
 """
-from bottle_utils.src.tokens.session import SESSION_COOKIE_NAME, InvalidSessionException
-from bottle import request, redirect
+from bottle_utils.src.tokens.session import (
+    SESSION_COOKIE_NAME,
+    SESSION_ENVIRON_KEY,
+    InvalidSessionException,
+)
+from bottle_utils.src.tokens.token_manager import TokenException
+from bottle import request, redirect, abort
 
 
 def session_auth(fxn):
@@ -17,14 +22,24 @@ def session_auth(fxn):
         if "session" in kwargs:
             return fxn(*args, **kwargs)
 
+        # Reuses the session loaded by rate limit key functions
+        session = request.environ.get(SESSION_ENVIRON_KEY)
+        if session is not None:
+            return fxn(*args, session=session, **kwargs)
+
         try:
             token = request.get_cookie(SESSION_COOKIE_NAME, default=None)
             # pylint: disable=no-member
             session = request.app.session_mgr.get_session_from_token(token)
+            request.environ[SESSION_ENVIRON_KEY] = session
 
             return fxn(*args, session=session, **kwargs)
 
         except InvalidSessionException:
             return redirect("/login")
 
+        except TokenException:
+            # Session store unavailable, fail fast rather than wait on retries
+            return abort(503, "Service Unavailable")
+
     return wrapper
@@ -0,0 +1,120 @@
+import sys
+import pytest
+from redis import ConnectionPool, StrictRedis
+from redis import exceptions
+from bottle_utils.src.connectors.breaker import (
+    CircuitBreaker,
+    CircuitBreakerUnixDomainSocketConnection,
+    CircuitOpenException,
+    CircuitState,
+    get_circuit_breaker,
+)
+from bottle_utils.src.counters.policies import RateLimitPolicy
+from bottle_utils.src.counters.rate_limiting import (
+    RateLimitCounterManager,
+    RateLimitException,
+)
+from bottle_utils.tst.utils.local_dbs import redis_client
+from bottle_utils.tst.utils.clocks import FakeClock
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_client(path, circuit_breaker):
+    return StrictRedis(
+        connection_pool=ConnectionPool(
+            connection_class=CircuitBreakerUnixDomainSocketConnection,
+            circuit_breaker=circuit_breaker,
+            path=path,
+            socket_timeout=1,
+        )
+    )
+
+
+def test_when_failures_reach_threshold_then_circuit_opens(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=2, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+    assert breaker.stats() == {
+        "state": "OPEN",
+        "failures": 2,
+        "rejections": 1,
+        "trips": 1,
+    }
+
+
+def test_when_reset_timeout_passed_then_single_probe_allowed(clock):
+    breaker = CircuitBreaker(
+        "redis", failure_threshold=1, reset_timeout_sec=10, clock=clock
+    )
+    breaker.record_failure()
+
+    clock.now += 10
+    assert breaker.state == CircuitState.HALF_OPEN
+    probe = object()
+    assert breaker.allow_request(probe)
+    assert breaker.allow_request(probe)
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now += 10
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_when_redis_unreachable_then_calls_rejected_without_connecting(tmp_path, clock):
+    breaker = CircuitBreaker("redis", failure_threshold=2, clock=clock)
+    redis_client = make_client(str(tmp_path / "missing.sock"), breaker)
+
+    for _ in range(2):
+        with pytest.raises(exceptions.ConnectionError) as exc_info:
+            redis_client.get("key")
+        assert not isinstance(exc_info.value, CircuitOpenException)
+
+    with pytest.raises(CircuitOpenException):
+        redis_client.get("key")
+    assert get_circuit_breaker(redis_client) is breaker
+
+
+def test_when_probe_succeeds_then_circuit_closes(redis_client, clock):
+    breaker = CircuitBreaker(
+        "redis", failure_threshold=1, reset_timeout_sec=10, clock=clock
+    )
+    redis_client = make_client(redis_client.socket_file, breaker)
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenException):
+        redis_client.set("key", 1)
+
+    clock.now += 10
+    assert redis_client.set("key", 1)
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.parametrize("fail_open", [True, False])
+def test_when_counter_store_unreachable_then_breaker_policy_applied(
+    tmp_path, fail_open
+):
+    breaker = CircuitBreaker("redis", fail_open=fail_open)
+    mgr = RateLimitCounterManager(make_client(str(tmp_path / "missing.sock"), breaker))
+
+    if fail_open:
+        assert mgr.check(RateLimitPolicy(1), counter_key="client").allowed
+    else:
+        with pytest.raises(RateLimitException):
+            mgr.check(RateLimitPolicy(1), counter_key="client")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
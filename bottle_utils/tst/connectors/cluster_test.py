@@ -0,0 +1,43 @@
+import sys
+import pytest
+import redis.cluster
+from redis import StrictRedis
+from redis.crc import key_slot
+from redis.cluster import RedisCluster
+from bottle_utils.src.connectors.cluster import (
+    create_redis_cluster,
+    group_keys_by_slot,
+    is_cluster_client,
+)
+
+
+def test_when_client_checked_then_only_cluster_clients_detected():
+    assert not is_cluster_client(StrictRedis())
+    assert is_cluster_client(RedisCluster.__new__(RedisCluster))
+
+
+def test_when_keys_grouped_then_hash_tagged_keys_share_group():
+    keys = ["session:{abc}1", "other", "user_to_sess:{abc}2"]
+
+    groups = group_keys_by_slot(keys)
+
+    assert groups[key_slot(b"abc")] == [0, 2]
+    assert groups[key_slot(b"other")] == [1]
+
+
+def test_when_cluster_created_then_node_connections_health_checked(monkeypatch):
+    # Skip the discovery of the cluster, which needs running cluster nodes
+    monkeypatch.setattr(redis.cluster.NodesManager, "initialize", lambda self: None)
+    monkeypatch.setattr(redis.cluster, "CommandsParser", lambda client: None)
+    client = create_redis_cluster("localhost", health_check_interval_sec=7)
+
+    node_kwargs = client.nodes_manager.connection_kwargs
+    node = client.nodes_manager.create_redis_node("localhost", 6379, **node_kwargs)
+    connection = node.connection_pool.make_connection()
+    connection.redis_connect_func(connection)
+
+    assert connection.health_check_interval == 7
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,62 @@
+import os
+import sys
+import pytest
+import subprocess
+
+REPO_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+
+def get_import_times(module):
+    """Imports a module in a fresh interpreter with `python -X importtime`
+
+    Returns:
+        Dict[str, int]: cumulative import time in microseconds of each module
+            imported along the way
+
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        import_times[name.strip()] = int(cumulative_us)
+
+    return import_times
+
+
+@pytest.mark.parametrize(
+    "module, lazy_modules",
+    [
+        ("bottle_utils.src.connectors.redis", ["redislite", "redis.asyncio"]),
+        ("bottle_utils.src.tokens.session", ["redislite", "redis.asyncio"]),
+        ("bottle_utils.src.wrappers.rates", ["redislite", "redis.asyncio"]),
+    ],
+)
+def test_when_module_imported_then_optional_backends_not_loaded(module, lazy_modules):
+    import_times = get_import_times(module)
+
+    assert module in import_times
+    assert not set(lazy_modules) & set(import_times)
+
+
+def test_when_async_cluster_loaded_then_client_detected():
+    from redis.asyncio.cluster import RedisCluster
+    from bottle_utils.src.connectors.cluster import is_cluster_client
+
+    assert is_cluster_client(RedisCluster.__new__(RedisCluster))
+    assert not is_cluster_client(object())
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,80 @@
+import gc
+import os
+import sys
+import pytest
+from redis import StrictRedis
+from redis import exceptions
+from bottle_utils.src.connectors.breaker import CircuitBreakerUnixDomainSocketConnection
+from bottle_utils.src.connectors import pool as pool_module
+from bottle_utils.src.connectors.pool import create_redis_pool
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+def test_when_pool_created_then_connections_configured(redis_client):
+    pool = create_redis_pool(
+        unix_socket_path=redis_client.socket_file,
+        max_connections=4,
+        socket_timeout_sec=0.5,
+    )
+    redis_client = StrictRedis(connection_pool=pool)
+
+    assert redis_client.ping()
+    assert pool.connection_class is CircuitBreakerUnixDomainSocketConnection
+    assert pool.connection_kwargs["socket_timeout"] == 0.5
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["idle"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_when_pool_exhausted_then_wait_times_out(redis_client):
+    pool = create_redis_pool(
+        unix_socket_path=redis_client.socket_file,
+        max_connections=2,
+        pool_timeout_sec=0.05,
+    )
+    connections = [pool.get_connection("PING") for _ in range(2)]
+
+    with pytest.raises(exceptions.ConnectionError):
+        pool.get_connection("PING")
+
+    stats = pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["peak_in_use"] == 2
+    assert stats["waits"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["wait_time_sec"] >= 0.05
+
+    for connection in connections:
+        pool.release(connection)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_when_forked_then_child_pool_reset(redis_client):
+    pool = create_redis_pool(unix_socket_path=redis_client.socket_file)
+    redis_client = StrictRedis(connection_pool=pool)
+    redis_client.ping()
+
+    pid = os.fork()
+    if pid == 0:
+        created_before_use = pool.stats()["created"]
+        ok = created_before_use == 0 and redis_client.ping()
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert redis_client.ping()
+    assert pool.stats()["created"] == 1
+
+
+def test_when_pool_released_then_no_longer_reset_after_fork(redis_client):
+    pool = create_redis_pool(unix_socket_path=redis_client.socket_file)
+    assert pool in pool_module._pools
+
+    pool_count = len(pool_module._pools)
+    del pool
+    gc.collect()
+    assert len(pool_module._pools) == pool_count - 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
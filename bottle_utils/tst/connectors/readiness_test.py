@@ -0,0 +1,119 @@
+import sys
+import functools
+import pytest
+from redis import StrictRedis
+from bottle_utils.src.connectors.breaker import CircuitBreaker
+from bottle_utils.src.connectors.pool import create_redis_pool
+from bottle_utils.src.connectors.readiness import get_backoff_delay, wait_until_ready
+from bottle_utils.src.connectors.redis import connect_to_redis
+from bottle_utils.tst.utils.clocks import FakeClock
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+def flaky_backend(failures):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise ConnectionError("not ready")
+
+        return "client"
+
+    return connect, attempts
+
+
+def test_when_backend_starts_then_ready_after_short_retries():
+    clock = FakeClock()
+    connect, attempts = flaky_backend(3)
+
+    client = wait_until_ready(connect, sleep=clock.sleep, clock=clock)
+
+    assert client == "client"
+    assert len(attempts) == 4
+    assert sum(clock.sleeps) < 1
+    assert clock.sleeps[0] < clock.sleeps[-1]
+
+
+def test_when_ping_fails_then_retried():
+    clock = FakeClock()
+    pings = []
+
+    def ping(client):
+        pings.append(client)
+        if len(pings) == 1:
+            raise ConnectionError("loading")
+
+    wait_until_ready(lambda: "client", ping=ping, sleep=clock.sleep, clock=clock)
+    assert pings == ["client", "client"]
+
+
+def test_when_backend_never_ready_then_timeout():
+    clock = FakeClock()
+    connect, _ = flaky_backend(10**6)
+
+    with pytest.raises(TimeoutError):
+        wait_until_ready(connect, timeout_sec=30, sleep=clock.sleep, clock=clock)
+
+    assert clock.now == 30
+    assert max(clock.sleeps) <= 5
+
+
+def test_when_unexpected_error_then_not_retried():
+    connect, attempts = flaky_backend(1)
+
+    with pytest.raises(ConnectionError):
+        wait_until_ready(connect, retry_exceptions=(KeyError,))
+
+    assert len(attempts) == 1
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [get_backoff_delay(attempt) for attempt in range(1, 20)]
+
+    assert 0.025 <= delays[0] <= 0.05
+    assert all(2.5 <= delay <= 5 for delay in delays[-5:])
+
+
+def test_when_redis_unreachable_then_timeout(monkeypatch):
+    monkeypatch.setenv("SESSION_STORE_HOST", "127.0.0.1")
+    monkeypatch.setenv("SESSION_STORE_PORT", "1")
+    monkeypatch.setenv("SESSION_STORE_READY_TIMEOUT_SEC", "0.2")
+
+    with pytest.raises(TimeoutError):
+        connect_to_redis()
+
+
+def test_when_redis_ready_then_breaker_closed(monkeypatch, tmp_path, redis_client):
+    # Redis starts listening on the socket before the fourth ping
+    socket_path = tmp_path / "redis.sock"
+    attempts = []
+    ping = StrictRedis.ping
+
+    def ping_starting_redis(self):
+        attempts.append(self)
+        if len(attempts) == 4:
+            socket_path.symlink_to(redis_client.socket_file)
+        return ping(self)
+
+    monkeypatch.setattr(StrictRedis, "ping", ping_starting_redis)
+    monkeypatch.setattr(
+        "bottle_utils.src.connectors.redis.create_redis_pool",
+        functools.partial(create_redis_pool, unix_socket_path=str(socket_path)),
+    )
+    monkeypatch.setenv("SESSION_STORE_PORT", "0")
+    monkeypatch.setenv("SESSION_STORE_READY_TIMEOUT_SEC", "5")
+    breaker = CircuitBreaker("redis", failure_threshold=1)
+
+    assert connect_to_redis(circuit_breaker=breaker).set("key", 1)
+    assert len(attempts) == 4
+    assert breaker.stats() == {
+        "state": "CLOSED",
+        "failures": 0,
+        "rejections": 0,
+        "trips": 0,
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
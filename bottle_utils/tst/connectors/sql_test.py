@@ -0,0 +1,181 @@
+import io
+import sys
+import pytest
+import threading
+from bottle import Bottle
+from playhouse.pool import PooledPostgresqlDatabase, PooledSqliteDatabase
+from bottle_utils.src.connectors import sql
+from bottle_utils.src.connectors.sql import (
+    DatabaseConnectionPlugin,
+    connect_to_db,
+    connect_to_sqlite_local_db,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = PooledSqliteDatabase(
+        str(tmp_path / "pool.db"), max_connections=1, timeout=0.1
+    )
+    yield database
+    database.close_all()
+
+
+def call(app, path):
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": io.StringIO(),
+    }
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+
+    body = b"".join(app(environ, start_response))
+    return result["status"], body
+
+
+def make_app(database):
+    app = Bottle(catchall=False)
+    plugin = DatabaseConnectionPlugin(database)
+    app.install(plugin)
+
+    @app.get("/query")
+    def query():
+        return str(database.execute_sql("SELECT 1").fetchone()[0])
+
+    @app.get("/open-transaction")
+    def open_transaction():
+        database.atomic().__enter__()
+        database.execute_sql("INSERT INTO pending VALUES (1)")
+        raise ValueError("route error")
+
+    @app.get("/static", database=False)
+    def static():
+        return str(database.is_closed())
+
+    return app, plugin
+
+
+def test_when_request_served_then_connection_returned_to_pool(database):
+    app, plugin = make_app(database)
+
+    assert call(app, "/query") == (200, b"1")
+    assert call(app, "/query") == (200, b"1")
+
+    assert database.is_closed()
+    stats = plugin.stats()
+    assert stats["requests"] == 2
+    assert stats["in_use"] == 0
+    assert stats["peak_in_use"] == 1
+
+
+def test_when_route_opts_out_then_no_connection(database):
+    app, plugin = make_app(database)
+
+    assert call(app, "/static") == (200, b"True")
+    assert plugin.stats()["requests"] == 0
+
+
+def test_when_pool_exhausted_then_service_unavailable(database):
+    app, plugin = make_app(database)
+    connected, release = threading.Event(), threading.Event()
+
+    def hold_connection():
+        # Connections are per thread, so this thread holds the only connection
+        database.connect()
+        connected.set()
+        release.wait()
+        database.close()
+
+    holder = threading.Thread(target=hold_connection)
+    holder.start()
+    connected.wait()
+    try:
+        status, _ = call(app, "/query")
+    finally:
+        release.set()
+        holder.join()
+
+    assert status == 503
+    assert plugin.stats()["timeouts"] == 1
+
+
+def test_when_sqlite_tuned_then_wal_pragmas_applied(tmp_path):
+    database = connect_to_sqlite_local_db(str(tmp_path / "tuned.db"), tuned=True)
+
+    assert database.journal_mode == "wal"
+    assert database.synchronous == 1
+    assert database.mmap_size == 256 * 1024 * 1024
+    database.close()
+
+
+def test_when_sqlite_not_tuned_then_default_pragmas(tmp_path):
+    database = connect_to_sqlite_local_db(str(tmp_path / "default.db"), tuned=False)
+
+    assert database.journal_mode == "delete"
+    database.close()
+
+
+def test_when_shared_memory_then_visible_to_other_connections():
+    database = connect_to_sqlite_local_db(tuned=True, shared_memory_name="shared")
+    database.execute_sql("CREATE TABLE shared_test (id INTEGER)")
+    database.execute_sql("INSERT INTO shared_test VALUES (1)")
+
+    other = connect_to_sqlite_local_db(shared_memory_name="shared")
+    assert other.execute_sql("SELECT id FROM shared_test").fetchone() == (1,)
+    other.close()
+    database.close()
+
+
+def test_when_route_leaves_transaction_open_then_rolled_back(database):
+    database.execute_sql("CREATE TABLE pending (id INTEGER)")
+    database.close()
+    app, plugin = make_app(database)
+
+    with pytest.raises(ValueError):
+        call(app, "/open-transaction")
+
+    assert plugin.stats()["in_use"] == 0
+    assert database.is_closed()
+    assert not database.in_transaction()
+    assert call(app, "/query") == (200, b"1")
+    assert database.execute_sql("SELECT COUNT(*) FROM pending").fetchone() == (0,)
+    database.close()
+
+
+def test_when_pooled_then_postgres_pool_configured(monkeypatch):
+    for name, value in {
+        "DB_USER": "user",
+        "DB_PASS": "pass",
+        "DB_HOST": "localhost",
+        "DB_PORT": "5432",
+        "DB_NAME": "db",
+        "DB_MAX_CONNECTIONS": "7",
+        "DB_STALE_TIMEOUT_SEC": "60",
+        "DB_WAIT_TIMEOUT_SEC": "2",
+    }.items():
+        monkeypatch.setenv(name, value)
+    pinged = []
+    # No postgres server to wait for
+    monkeypatch.setattr(
+        sql, "wait_until_ready", lambda connect, **kwargs: pinged.append(connect())
+    )
+
+    database = connect_to_db(pooled=True)
+
+    assert isinstance(database, PooledPostgresqlDatabase)
+    assert pinged == [database]
+    assert database.database == "db"
+    assert database._max_connections == 7
+    assert database._stale_timeout == 60
+    assert database._wait_timeout == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
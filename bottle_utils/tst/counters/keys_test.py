@@ -0,0 +1,121 @@
+import sys
+import bottle
+import pytest
+from types import SimpleNamespace
+from bottle import Bottle, LocalRequest
+from bottle_utils.src.counters.keys import (
+    DEFAULT_KEY_FUNC,
+    combine_keys,
+    key_by_api_key,
+    key_by_ip,
+    key_by_route,
+    key_by_session_user,
+    key_by_subnet,
+)
+from bottle_utils.src.tokens.session import InvalidSessionException
+from bottle_utils.src.wrappers.session import session_auth
+
+
+def make_request(path="/users/42", query="", remote_addr="10.0.0.1", **environ):
+    app = Bottle()
+
+    @app.get("/users/<user_id>")
+    def user(user_id):
+        return user_id
+
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "REMOTE_ADDR": remote_addr,
+        "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http",
+        "bottle.app": app,
+        **environ,
+    }
+    route, _ = app.router.match(environ)
+    environ["bottle.route"] = route
+    return LocalRequest(environ)
+
+
+def test_when_query_string_differs_then_default_key_unchanged():
+    assert DEFAULT_KEY_FUNC(make_request(query="a=1")) == DEFAULT_KEY_FUNC(
+        make_request(query="a=2")
+    )
+    assert DEFAULT_KEY_FUNC(make_request()) == "10.0.0.1|GET /users/<user_id>"
+
+
+def test_when_keyed_by_route_then_path_parameters_share_key():
+    assert key_by_route(make_request("/users/1")) == key_by_route(
+        make_request("/users/2")
+    )
+
+
+def test_when_keyed_by_subnet_then_addresses_in_subnet_share_key():
+    key_func = key_by_subnet(ipv4_prefix=24, ipv6_prefix=48)
+
+    assert key_func(make_request(remote_addr="10.0.0.1")) == "10.0.0.0/24"
+    assert key_func(make_request(remote_addr="10.0.0.200")) == "10.0.0.0/24"
+    assert key_func(make_request(remote_addr="2001:db8:1:2::1")) == "2001:db8:1::/48"
+
+
+def test_when_keyed_by_api_key_then_key_hashed():
+    key_func = key_by_api_key()
+    request = make_request(HTTP_X_API_KEY="secret-key")
+
+    assert key_func(request).startswith("api:")
+    assert "secret-key" not in key_func(request)
+    assert key_func(make_request()) == key_by_ip(make_request())
+
+
+def test_when_api_key_unknown_then_keyed_by_address():
+    key_func = key_by_api_key(is_known_key=lambda api_key: api_key == "known-key")
+
+    assert key_func(make_request(HTTP_X_API_KEY="known-key")).startswith("api:")
+    assert key_func(make_request(HTTP_X_API_KEY="made-up-key")) == "10.0.0.1"
+
+
+class FakeSessionManager:
+    def __init__(self):
+        self.reads = 0
+
+    def get_session_from_token(self, token):
+        self.reads += 1
+        if token != "valid":
+            raise InvalidSessionException("Invalid Session")
+
+        return SimpleNamespace(user_uuid="user-uuid")
+
+
+@pytest.mark.parametrize(
+    "cookie, expected", [("valid", "user:user-uuid"), ("invalid", "10.0.0.1")]
+)
+def test_when_keyed_by_session_user_then_user_uuid_or_address(cookie, expected):
+    request = make_request(HTTP_COOKIE=f"SESSIONID={cookie}")
+    request.app.session_mgr = FakeSessionManager()
+
+    assert key_by_session_user(request) == expected
+
+
+def test_when_session_loaded_then_reused_by_session_auth():
+    request = make_request(HTTP_COOKIE="SESSIONID=valid")
+    request.app.session_mgr = session_mgr = FakeSessionManager()
+
+    @session_auth
+    def route(session):
+        return session.user_uuid
+
+    assert key_by_session_user(request) == "user:user-uuid"
+    bottle.request.bind(request.environ)
+    assert route() == "user-uuid"
+    assert session_mgr.reads == 1
+
+
+def test_when_keys_combined_then_joined():
+    key_func = combine_keys(key_by_ip, key_by_subnet())
+
+    assert key_func(make_request()) == "10.0.0.1|10.0.0.0/24"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,126 @@
+import sys
+import time
+import pytest
+from bottle_utils.src.counters.local import HybridRateLimiter
+from bottle_utils.src.counters.policies import RateLimitAlgorithm, RateLimitPolicy
+from bottle_utils.src.counters.rate_limiting import RateLimitCounterManager
+from bottle_utils.tst.utils.local_dbs import redis_client
+from bottle_utils.tst.utils.clocks import FakeClock
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(redis_client, clock, policy, **kwargs):
+    limiter = HybridRateLimiter(
+        RateLimitCounterManager(redis_client), policy, clock=clock, **kwargs
+    )
+    redis_client.delete(limiter.get_global_key("client"))
+    return limiter
+
+
+def test_when_local_bucket_empty_then_rejected_without_redis(redis_client, clock):
+    limiter = make_limiter(
+        redis_client, clock, RateLimitPolicy(2, period_sec=10), max_unsynced=100
+    )
+
+    results = [limiter.check("client") for _ in range(3)]
+
+    assert [result.allowed for result in results] == [True, True, False]
+    assert results[-1].retry_after_sec == pytest.approx(5)
+    assert limiter.stats()["local_rejections"] == 1
+    assert limiter.stats()["syncs"] == 0
+    assert redis_client.get(limiter.get_global_key("client")) is None
+
+
+def test_when_bucket_refilled_then_admitted_again(redis_client, clock):
+    limiter = make_limiter(
+        redis_client, clock, RateLimitPolicy(1, period_sec=1), max_unsynced=100
+    )
+    assert limiter.check("client").allowed
+    assert not limiter.check("client").allowed
+
+    clock.now += 1
+    assert limiter.check("client").allowed
+
+
+def test_when_max_unsynced_reached_then_counts_synced_in_batch(redis_client, clock):
+    limiter = make_limiter(
+        redis_client, clock, RateLimitPolicy(100, period_sec=60), max_unsynced=5
+    )
+
+    for _ in range(4):
+        limiter.check("client")
+    assert redis_client.get(limiter.get_global_key("client")) is None
+
+    limiter.check("client")
+    assert int(redis_client.get(limiter.get_global_key("client"))) == 5
+    assert limiter.stats()["syncs"] == 1
+
+
+def test_when_global_limit_reached_by_other_workers_then_rejected(redis_client, clock):
+    policy = RateLimitPolicy(10, period_sec=60)
+    limiter = make_limiter(redis_client, clock, policy, max_unsynced=1)
+    other_worker = HybridRateLimiter(
+        RateLimitCounterManager(redis_client), policy, clock=clock, max_unsynced=1
+    )
+
+    for _ in range(10):
+        assert other_worker.check("client").allowed
+
+    assert limiter.check("client").allowed
+    result = limiter.check("client")
+    assert not result.allowed
+    assert 0 < result.retry_after_sec <= 60
+    assert limiter.stats()["global_rejections"] == 1
+
+
+def test_when_sync_fails_then_counts_kept_for_next_sync(redis_client, clock):
+    limiter = make_limiter(
+        redis_client, clock, RateLimitPolicy(100, period_sec=60), max_unsynced=2
+    )
+    sync_script = limiter._sync_script
+
+    def failing_script(**kwargs):
+        raise ConnectionError("redis unavailable")
+
+    limiter._sync_script = failing_script
+    assert limiter.check("client").allowed
+    assert limiter.check("client").allowed
+
+    limiter._sync_script = sync_script
+    limiter.sync()
+    assert int(redis_client.get(limiter.get_global_key("client"))) == 2
+
+
+def test_when_background_sync_then_counts_synced_by_thread(redis_client, clock):
+    limiter = make_limiter(
+        redis_client,
+        clock,
+        RateLimitPolicy(100, period_sec=60),
+        max_unsynced=1,
+        background_sync=True,
+    )
+    assert limiter.check("client").allowed
+
+    deadline = time.monotonic() + 5
+    while limiter.stats()["syncs"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert int(redis_client.get(limiter.get_global_key("client"))) == 1
+
+
+@pytest.mark.parametrize(
+    "algorithm", [RateLimitAlgorithm.SLIDING_WINDOW, RateLimitAlgorithm.GCRA]
+)
+def test_when_policy_not_fixed_window_then_exception(redis_client, algorithm):
+    with pytest.raises(ValueError):
+        HybridRateLimiter(
+            RateLimitCounterManager(redis_client),
+            RateLimitPolicy(10, period_sec=60, algorithm=algorithm),
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,194 @@
+"""Benchmark and accuracy simulation for rate limiting
+
+Drives RateLimitCounterManager (or the RateLimitPlugin through a bottle app)
+against redislite from many concurrent simulated clients, each hammering its
+own key for a fixed duration, and reports for each algorithm:
+    - throughput of checks across all clients
+    - p50 and p99 latency of a check (or overhead over an unlimited route when
+      going through the plugin)
+    - redis commands processed per request, including commands run by scripts
+    - requests admitted versus the number an ideal limiter of the same kind
+      would allow per client (`limit` per window started for window limiters,
+      `limit + rate * elapsed / period` for GCRA) and the relative error
+
+Usage (from the repository root):
+    PYTHONPATH=. python bottle_utils/tst/counters/rate_limiting_bench.py \
+        [--clients 20] [--duration 2] [--rate 50] [--period 1] [--plugin]
+
+"""
+import io
+import sys
+import math
+import time
+import argparse
+import threading
+from bottle import Bottle
+from bottle_utils.src.counters.local import HybridRateLimiter
+from bottle_utils.src.counters.policies import RateLimitAlgorithm, RateLimitPolicy
+from bottle_utils.src.counters.rate_limiting import RateLimitCounterManager
+from bottle_utils.src.counters.keys import key_by_ip
+from bottle_utils.src.wrappers.rates import RateLimitPlugin
+from bottle_utils.tst.utils.local_dbs import get_test_redis
+
+LIMITERS = ["fixed_window", "sliding_window", "gcra", "hybrid"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+def get_policy(name, rate, period_sec):
+    algorithm = {
+        "sliding_window": RateLimitAlgorithm.SLIDING_WINDOW,
+        "gcra": RateLimitAlgorithm.GCRA,
+    }.get(name, RateLimitAlgorithm.FIXED_WINDOW)
+    return RateLimitPolicy(rate, period_sec=period_sec, algorithm=algorithm)
+
+
+def get_ideal_admitted(policy, elapsed_sec):
+    """Requests an ideal limiter enforcing a policy admits from one client"""
+    if policy.algorithm == RateLimitAlgorithm.GCRA:
+        # Token bucket: a full burst, then refills at the policy rate
+        return policy.limit + policy.rate * elapsed_sec / policy.period_sec
+
+    # No more than `limit` requests in any window
+    return policy.limit * math.ceil(elapsed_sec / policy.period_sec)
+
+
+def get_manager_check(redis_client, name, policy):
+    mgr = RateLimitCounterManager(redis_client)
+    if name == "hybrid":
+        limiter = HybridRateLimiter(mgr, policy)
+        return lambda client: limiter.check(f"bench:{client}").allowed
+
+    return lambda client: mgr.check(policy, counter_key=f"bench:{client}").allowed
+
+
+def get_plugin_check(redis_client, name, policy):
+    app = Bottle()
+    app.install(
+        RateLimitPlugin(
+            RateLimitCounterManager(redis_client, key_func=key_by_ip),
+            hybrid=name == "hybrid",
+        )
+    )
+
+    @app.get("/limited", rate_limit=policy)
+    def limited():
+        return "ok"
+
+    @app.get("/unlimited")
+    def unlimited():
+        return "ok"
+
+    def call(path, client):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "REMOTE_ADDR": f"10.0.{client // 256}.{client % 256}",
+            "HTTP_HOST": "localhost",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": io.StringIO(),
+        }
+        statuses = []
+        b"".join(app(environ, lambda status, *args: statuses.append(status)))
+        return statuses[0].startswith("200")
+
+    return lambda client: call("/limited", client), lambda client: call(
+        "/unlimited", client
+    )
+
+
+def simulate(check, clients, duration_sec):
+    """Runs one thread per client calling check until the duration elapses"""
+    latencies = [[] for _ in range(clients)]
+    admitted = [0] * clients
+    start = threading.Barrier(clients + 1)
+
+    def run_client(client):
+        start.wait()
+        deadline = time.perf_counter() + duration_sec
+        client_latencies = latencies[client]
+        while True:
+            before = time.perf_counter()
+            if before >= deadline:
+                break
+
+            allowed = check(client)
+            client_latencies.append(time.perf_counter() - before)
+            admitted[client] += allowed
+
+    threads = [
+        threading.Thread(target=run_client, args=(client,), daemon=True)
+        for client in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+
+    start.wait()
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - started_at
+    return sorted(sum(latencies, [])), admitted, elapsed
+
+
+def get_commands_processed(redis_client):
+    # The INFO call itself is counted as one command
+    return redis_client.info("stats")["total_commands_processed"] + 1
+
+
+def main(clients=20, duration_sec=2, rate=50, period_sec=1, plugin=False):
+    redis_client = get_test_redis()
+    print(
+        f"{clients} clients for {duration_sec}s, limit {rate} per {period_sec}s, "
+        f"through {'plugin' if plugin else 'manager'}"
+    )
+    print(
+        f"{'limiter':>15} {'checks/s':>10} {'p50 us':>9} {'p99 us':>9} "
+        f"{'cmds/req':>8} {'admitted':>9} {'allowed':>9} {'error':>8}"
+    )
+
+    for name in LIMITERS:
+        redis_client.flushdb()
+        policy = get_policy(name, rate, period_sec)
+        baseline = []
+        if plugin:
+            check, unlimited_check = get_plugin_check(redis_client, name, policy)
+            baseline, _, _ = simulate(unlimited_check, clients, duration_sec)
+        else:
+            check = get_manager_check(redis_client, name, policy)
+
+        commands_before = get_commands_processed(redis_client)
+        latencies, admitted, elapsed = simulate(check, clients, duration_sec)
+        commands = redis_client.info("stats")["total_commands_processed"]
+        commands -= commands_before
+
+        allowed = clients * get_ideal_admitted(policy, elapsed)
+        p50 = percentile(latencies, 0.5) - percentile(baseline, 0.5)
+        p99 = percentile(latencies, 0.99) - percentile(baseline, 0.99)
+        print(
+            f"{name:>15} {len(latencies) / elapsed:10.0f} {p50 * 1e6:9.1f} "
+            f"{p99 * 1e6:9.1f} {commands / max(len(latencies), 1):8.3f} "
+            f"{sum(admitted):9d} {allowed:9.0f} "
+            f"{(sum(admitted) - allowed) / allowed:+8.1%}"
+        )
+
+    redis_client.flushdb()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=2)
+    parser.add_argument("--rate", type=int, default=50)
+    parser.add_argument("--period", type=float, default=1)
+    parser.add_argument("--plugin", action="store_true")
+    args = parser.parse_args()
+    sys.exit(main(args.clients, args.duration, args.rate, args.period, args.plugin))
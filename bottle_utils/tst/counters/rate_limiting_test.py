@@ -0,0 +1,178 @@
+import sys
+import pytest
+from bottle import request
+from bottle_utils.src.counters.policies import (
+    MultiWindowPolicy,
+    RateLimitAlgorithm,
+    RateLimitPolicy,
+)
+from bottle_utils.src.counters.rate_limiting import RateLimitCounterManager
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+@pytest.fixture
+def client_request():
+    request.bind(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": "/test",
+            "QUERY_STRING": "",
+            "REMOTE_ADDR": "10.0.0.1",
+            "HTTP_HOST": "localhost",
+            "wsgi.url_scheme": "http",
+        }
+    )
+    return request
+
+
+def test_when_counter_incremented_then_post_increment_count(
+    redis_client, client_request
+):
+    mgr = RateLimitCounterManager(redis_client)
+    redis_client.delete(mgr.get_counter_key())
+
+    assert [mgr.increment_counter().value for _ in range(3)] == [1, 2, 3]
+    assert redis_client.ttl(mgr.get_counter_key()) == 1
+
+
+def test_when_existing_counter_read_then_request_counted(redis_client, client_request):
+    mgr = RateLimitCounterManager(redis_client)
+    redis_client.delete(mgr.get_counter_key())
+    mgr.get_or_create_counter()
+
+    counter = mgr.get_or_create_counter()
+    assert counter.value == 2
+    counter.increment()
+    assert counter.value == 3
+    assert redis_client.ttl(mgr.get_counter_key()) == 1
+
+
+@pytest.mark.parametrize("algorithm", list(RateLimitAlgorithm))
+def test_when_limit_exceeded_then_request_rejected(
+    redis_client, client_request, algorithm
+):
+    mgr = RateLimitCounterManager(redis_client)
+    policy = RateLimitPolicy(3, period_sec=60, algorithm=algorithm)
+    redis_client.delete(f"{mgr.get_counter_key()}:{algorithm.name.lower()}")
+
+    results = [mgr.check(policy) for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results] == [2, 1, 0, 0]
+    assert all(result.limit == 3 for result in results)
+    assert 0 < results[-1].retry_after_sec <= 60
+
+
+def test_when_gcra_burst_used_then_rate_limits_afterwards(redis_client, client_request):
+    mgr = RateLimitCounterManager(redis_client)
+    policy = RateLimitPolicy(
+        1, period_sec=10, burst=2, algorithm=RateLimitAlgorithm.GCRA
+    )
+    redis_client.delete(f"{mgr.get_counter_key()}:gcra")
+
+    results = [mgr.check(policy) for _ in range(3)]
+
+    assert [result.allowed for result in results] == [True, True, False]
+    assert 9 < results[-1].retry_after_sec <= 10
+    assert 19 < results[-1].reset_sec <= 20
+
+
+def test_when_previous_window_full_then_sliding_window_rejects(
+    redis_client, client_request
+):
+    mgr = RateLimitCounterManager(redis_client)
+    policy = RateLimitPolicy(
+        2, period_sec=3600, algorithm=RateLimitAlgorithm.SLIDING_WINDOW
+    )
+    counter_key = f"{mgr.get_counter_key()}:sliding_window"
+    seconds, _ = redis_client.time()
+    redis_client.delete(counter_key)
+    redis_client.hset(
+        counter_key,
+        mapping={"window": seconds // 3600 - 1, "current": 10**6, "previous": 0},
+    )
+
+    # A fixed window would admit the request as soon as the window rolled over
+    result = mgr.check(policy)
+    assert not result.allowed
+    assert 0 < result.retry_after_sec <= result.reset_sec <= 3600
+
+
+@pytest.mark.parametrize(
+    "algorithm", [RateLimitAlgorithm.FIXED_WINDOW, RateLimitAlgorithm.SLIDING_WINDOW]
+)
+def test_when_multi_window_exceeded_then_tripped_window_reported(
+    redis_client, client_request, algorithm
+):
+    mgr = RateLimitCounterManager(redis_client)
+    per_minute = RateLimitPolicy(3, period_sec=60, algorithm=algorithm)
+    per_day = RateLimitPolicy(4, period_sec=86400, algorithm=algorithm)
+    policy = MultiWindowPolicy([per_minute, per_day])
+    for key in redis_client.keys(f"*{mgr.get_counter_key()}:*"):
+        redis_client.delete(key)
+
+    results = [mgr.check(policy) for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results[:3]] == [2, 1, 0]
+    assert results[0].window is per_minute
+    assert results[-1].window is per_minute
+    assert results[-1].limit == 3
+    assert 0 < results[-1].retry_after_sec <= 60
+
+
+def test_when_longer_window_exceeded_then_shorter_windows_not_counted(
+    redis_client, client_request
+):
+    mgr = RateLimitCounterManager(redis_client)
+    per_second = RateLimitPolicy(10, period_sec=1)
+    per_day = RateLimitPolicy(1, period_sec=86400)
+    policy = MultiWindowPolicy([per_second, per_day])
+    for key in redis_client.keys(f"*{mgr.get_counter_key()}:*"):
+        redis_client.delete(key)
+
+    assert mgr.check(policy).allowed
+    result = mgr.check(policy)
+
+    assert not result.allowed
+    assert result.window is per_day
+    assert 86399 < result.reset_sec <= 86400
+    counter_key = f"{{{mgr.get_counter_key()}:fixed_window}}:{per_second.period_ms}"
+    assert int(redis_client.get(counter_key)) == 1
+
+
+def test_when_limit_peeked_then_request_not_counted(redis_client, client_request):
+    mgr = RateLimitCounterManager(redis_client)
+    policy = RateLimitPolicy(2, period_sec=60)
+    redis_client.delete(f"{mgr.get_counter_key()}:fixed_window")
+
+    assert mgr.peek(policy).remaining == 2
+    mgr.check(policy)
+    mgr.check(policy)
+
+    result = mgr.peek(policy)
+    assert not result.allowed
+    assert 0 < result.retry_after_sec <= 60
+
+    with pytest.raises(ValueError):
+        mgr.peek(RateLimitPolicy(2, algorithm=RateLimitAlgorithm.GCRA))
+
+
+def test_when_policy_invalid_then_value_error():
+    with pytest.raises(ValueError):
+        RateLimitPolicy(0)
+
+    with pytest.raises(ValueError):
+        RateLimitPolicy(1, algorithm="gcra")
+
+    with pytest.raises(ValueError):
+        MultiWindowPolicy(
+            [
+                RateLimitPolicy(1, period_sec=1),
+                RateLimitPolicy(1, period_sec=60, algorithm=RateLimitAlgorithm.GCRA),
+            ]
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
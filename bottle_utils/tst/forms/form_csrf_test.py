@@ -0,0 +1,75 @@
+import sys
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from wtforms import Form
+from bottle_utils.src.forms.csrf import RedisCacheCSRF
+from bottle_utils.src.tokens.csrf import CSRFTokenManager
+from bottle_utils.src.tokens.session import SessionTokenManager
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+class PostData(dict):
+    def getlist(self, key):
+        return [self[key]] if key in self else []
+
+
+class CSRFForm(Form):
+    class Meta:
+        csrf = True
+        csrf_class = RedisCacheCSRF
+
+
+def make_form(csrf_mgr, formdata=None, **meta):
+    return CSRFForm(
+        formdata, meta={"csrf_token_mgr": csrf_mgr, "session": None, **meta}
+    )
+
+
+@pytest.fixture
+def managers(redis_client):
+    csrf_mgr = CSRFTokenManager(redis_client)
+    return csrf_mgr, SessionTokenManager(csrf_mgr, redis_client, hash_storage=True)
+
+
+def test_when_bound_to_session_token_then_only_csrf_field_read(
+    redis_client, managers, monkeypatch
+):
+    csrf_mgr, session_mgr = managers
+    user = SimpleNamespace(uuid=uuid4(), username="test", email="test@test.com")
+    session = session_mgr.create_session(user)
+    meta = {"session_token": session.session_id, "session_mgr": session_mgr}
+
+    assert make_form(csrf_mgr, **meta).csrf_token.current_token == session.csrf_token
+
+    reads = []
+    monkeypatch.setattr(
+        session_mgr,
+        "get_session_from_token",
+        lambda token: reads.append(token),
+    )
+    form = make_form(csrf_mgr, PostData(csrf_token=session.csrf_token), **meta)
+    assert form.validate()
+    assert reads == []
+
+    form = make_form(csrf_mgr, PostData(csrf_token="forged"), **meta)
+    assert not form.validate()
+
+
+def test_when_session_token_invalid_then_form_invalid(managers):
+    csrf_mgr, session_mgr = managers
+    meta = {"session_token": "expired", "session_mgr": session_mgr}
+
+    form = make_form(csrf_mgr, PostData(csrf_token="token"), **meta)
+    assert not form.validate()
+
+
+def test_when_sessionless_then_stored_csrf_token_validated(managers):
+    csrf_mgr, _ = managers
+    token = make_form(csrf_mgr).csrf_token.current_token
+
+    assert make_form(csrf_mgr, PostData(csrf_token=token)).validate()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
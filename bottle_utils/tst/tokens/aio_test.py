@@ -0,0 +1,154 @@
+import sys
+import time
+import asyncio
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from redis.asyncio import StrictRedis
+from bottle_utils.src.tokens.aio import (
+    AsyncCSRFTokenManager,
+    AsyncSessionTokenManager,
+    AsyncSignedCSRFTokenManager,
+    AsyncVerificationTokenManager,
+)
+from bottle_utils.src.tokens.cache import SessionCache
+from bottle_utils.src.tokens.csrf import CSRFInvalidException, CSRFTokenManager
+from bottle_utils.src.tokens.session import (
+    InvalidSessionException,
+    SessionTokenManager,
+)
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+@pytest.fixture
+def user():
+    return SimpleNamespace(uuid=uuid4(), username="test", email="test@test.com")
+
+
+def run(redis_client, test):
+    async def run_test():
+        async_client = StrictRedis(unix_socket_path=redis_client.socket_file)
+        try:
+            await test(async_client)
+        finally:
+            await async_client.close()
+
+    asyncio.run(run_test())
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_session_replaced_then_old_session_invalid(
+    redis_client, user, hash_storage
+):
+    async def test(async_client):
+        mgr = AsyncSessionTokenManager(
+            AsyncCSRFTokenManager(async_client), async_client, hash_storage=hash_storage
+        )
+        old_session = await mgr.replace_user_session(user)
+        new_session = await mgr.replace_user_session(user)
+
+        with pytest.raises(InvalidSessionException):
+            await mgr.get_session_from_token(old_session.session_id)
+
+        session = await mgr.get_session_from_token(new_session.session_id)
+        assert session.username == user.username
+        assert await mgr.get_session_csrf_token(session.session_id) == (
+            new_session.csrf_token
+        )
+
+        await mgr.expire_session(session)
+        with pytest.raises(InvalidSessionException):
+            await mgr.get_session_from_token(new_session.session_id)
+
+    run(redis_client, test)
+
+
+def test_when_sessionless_csrf_token_expired_then_invalid(redis_client):
+    async def test(async_client):
+        mgr = AsyncCSRFTokenManager(async_client)
+        token = await mgr.create_sessionless_csrf_token()
+        await mgr.validate_sessionless_csrf(token)
+
+        await mgr.expire_sessionless_csrf_token(token)
+        with pytest.raises(CSRFInvalidException):
+            await mgr.validate_sessionless_csrf(token)
+
+    run(redis_client, test)
+
+
+def test_when_verification_token_created_then_user_data_readable(redis_client, user):
+    async def test(async_client):
+        mgr = AsyncVerificationTokenManager(async_client)
+        token = await mgr.create_email_verification_token(user)
+
+        assert await mgr.get_verification_token_user_data(token) == {
+            "user_id": user.uuid.hex
+        }
+        assert await mgr.get_many([token]) == {token: {"user_id": user.uuid.hex}}
+
+    run(redis_client, test)
+
+
+def test_when_user_session_mapped_then_readable_and_expirable(redis_client, user):
+    async def test(async_client):
+        mgr = AsyncSessionTokenManager(
+            AsyncCSRFTokenManager(async_client), async_client
+        )
+        mapper = mgr.user_to_session_mapper
+        session = await mgr.create_session(user)
+
+        assert not await mapper.does_user_session_exist(user)
+        await mapper.create_user_to_session_entry(user, session)
+        assert await mapper.does_user_session_exist(user)
+        assert await mapper.get_user_session(user) == session.session_id
+
+        await mapper.expire_user_session_entry(user)
+        assert not await mapper.does_user_session_exist(user)
+
+    run(redis_client, test)
+
+
+def test_when_session_expired_then_other_workers_invalidated(redis_client, user):
+    cache = SessionCache(ttl_sec=60)
+    cache.listen(redis_client)
+    cached_mgr = SessionTokenManager(
+        CSRFTokenManager(redis_client), redis_client, session_cache=cache
+    )
+
+    async def test(async_client):
+        mgr = AsyncSessionTokenManager(
+            AsyncCSRFTokenManager(async_client), async_client
+        )
+        session = await mgr.create_session(user)
+        cached_mgr.get_session_from_token(session.session_id)
+
+        assert await mgr.expire_many([session.session_id]) == 1
+        deadline = time.monotonic() + 5
+        while cache.stats()["size"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        with pytest.raises(InvalidSessionException):
+            cached_mgr.get_session_from_token(session.session_id)
+
+    try:
+        run(redis_client, test)
+    finally:
+        cache.stop()
+
+
+def test_when_single_use_signed_csrf_token_reused_then_invalid(redis_client):
+    async def test(async_client):
+        mgr = AsyncSignedCSRFTokenManager(
+            async_client, {"key": "secret"}, single_use=True
+        )
+        token = await mgr.create_sessionless_csrf_token()
+        await mgr.validate_sessionless_csrf(token)
+
+        with pytest.raises(CSRFInvalidException):
+            await mgr.validate_sessionless_csrf(token)
+
+    run(redis_client, test)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,47 @@
+import sys
+import pytest
+from bottle_utils.src.tokens.cache import SessionCache
+from bottle_utils.tst.utils.clocks import FakeClock
+
+
+def test_when_token_cached_then_hit():
+    cache = SessionCache(max_size=2, ttl_sec=5)
+    cache.set("a", "session-a")
+
+    assert cache.get("a") == "session-a"
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_when_ttl_elapsed_then_miss():
+    clock = FakeClock()
+    cache = SessionCache(max_size=2, ttl_sec=5, clock=clock)
+    cache.set("a", "session-a")
+    clock.now = 5
+
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_when_full_then_least_recently_used_evicted():
+    cache = SessionCache(max_size=2, ttl_sec=5)
+    cache.set("a", "session-a")
+    cache.set("b", "session-b")
+    cache.get("a")
+    cache.set("c", "session-c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "session-a"
+    assert cache.evictions == 1
+
+
+def test_when_invalidation_message_then_entry_removed():
+    cache = SessionCache()
+    cache.set("a", "session-a")
+    cache._handle_invalidation({"data": b"a"})
+
+    assert cache.get("a") is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,52 @@
+import sys
+import asyncio
+import pytest
+from bottle_utils.src.tokens.calls import run_calls, run_calls_async
+
+
+def failing_call():
+    raise ConnectionError("redis unavailable")
+
+
+async def async_value(value):
+    return value
+
+
+def operation(calls):
+    """Sums the results of calls, counting failed calls as -1"""
+    total = 0
+    for call in calls:
+        try:
+            total += yield call
+
+        except ConnectionError:
+            total -= 1
+
+    return total
+
+
+def test_when_calls_run_then_results_sent_back():
+    assert run_calls(operation([lambda: 1, lambda: 2])) == 3
+    assert run_calls(operation([])) == 0
+
+
+def test_when_call_fails_then_exception_raised_in_operation():
+    assert run_calls(operation([lambda: 5, failing_call])) == 4
+
+
+def test_when_exception_not_handled_then_raised():
+    def unhandled():
+        yield failing_call
+
+    with pytest.raises(ConnectionError):
+        run_calls(unhandled())
+
+
+def test_when_calls_run_async_then_awaited():
+    calls = [lambda: async_value(1), lambda: async_value(2)]
+
+    assert asyncio.run(run_calls_async(operation(calls))) == 3
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
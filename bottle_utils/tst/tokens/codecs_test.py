@@ -0,0 +1,37 @@
+import sys
+import pytest
+from uuid import uuid4
+from bottle_utils.src.tokens.codecs import (
+    JSON_CODEC,
+    MSGPACK_CODEC,
+    decode_token_data,
+)
+
+TEST_UUID = uuid4()
+TEST_DATA = {"user_uuidd": TEST_UUID, "username": "test", "settings": {"a": [1, 2]}}
+EXPECTED_DATA = dict(TEST_DATA, user_uuidd=TEST_UUID.hex)
+
+
+@pytest.mark.parametrize("codec", [JSON_CODEC, MSGPACK_CODEC])
+def test_when_encoded_then_decodes_to_same_data(codec):
+    assert decode_token_data(codec.encode(TEST_DATA)) == EXPECTED_DATA
+
+
+def test_when_msgpack_then_smaller_than_json():
+    assert len(MSGPACK_CODEC.encode(TEST_DATA)) < len(JSON_CODEC.encode(TEST_DATA))
+
+
+def test_when_legacy_json_then_decodes():
+    legacy = b'{"user_uuidd": "%s", "username": "test"}' % TEST_UUID.hex.encode()
+    assert decode_token_data(legacy) == {
+        "user_uuidd": TEST_UUID.hex,
+        "username": "test",
+    }
+
+
+def test_when_missing_then_none():
+    assert decode_token_data(None) is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
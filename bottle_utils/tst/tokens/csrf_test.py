@@ -0,0 +1,106 @@
+import sys
+import pytest
+from bottle_utils.src.tokens.csrf import (
+    USED_CSRF_KEY_PREFIX,
+    SignedCSRFTokenManager,
+    CSRFInvalidException,
+)
+from bottle_utils.tst.utils.clocks import FakeClock
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+SIGNING_KEYS = {"new": "new-secret", "old": b"old-secret"}
+
+
+def test_when_signed_token_valid_then_ok():
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS)
+    mgr.validate_sessionless_csrf(mgr.create_sessionless_csrf_token())
+
+
+def test_when_signed_with_rotated_key_then_ok():
+    old_mgr = SignedCSRFTokenManager(None, SIGNING_KEYS, active_key_id="old")
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS)
+    mgr.validate_sessionless_csrf(old_mgr.create_sessionless_csrf_token())
+
+
+def test_when_signed_with_unknown_key_then_exception():
+    other_mgr = SignedCSRFTokenManager(None, {"other": "other-secret"})
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS)
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(other_mgr.create_sessionless_csrf_token())
+
+
+@pytest.mark.parametrize(
+    "token", [None, "", "garbage", "new.1000.abc.def", "new.1000.abc.dé"]
+)
+def test_when_malformed_token_then_exception(token):
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS)
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(token)
+
+
+def test_when_token_tampered_then_exception():
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS)
+    key_id, timestamp, nonce, signature = mgr.create_sessionless_csrf_token().split(".")
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(f"{key_id}.{timestamp}.{nonce}x.{signature}")
+
+
+def test_when_token_expired_then_exception():
+    clock = FakeClock(now=1000)
+    mgr = SignedCSRFTokenManager(None, SIGNING_KEYS, clock=clock)
+    token = mgr.create_sessionless_csrf_token()
+    clock.now += mgr.token_expiration_sec
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(token)
+
+
+def test_when_active_key_unknown_then_exception():
+    with pytest.raises(ValueError):
+        SignedCSRFTokenManager(None, SIGNING_KEYS, active_key_id="missing")
+
+
+def test_when_single_use_token_reused_then_exception(redis_client):
+    mgr = SignedCSRFTokenManager(redis_client, SIGNING_KEYS, single_use=True)
+    token = mgr.create_sessionless_csrf_token()
+    mgr.validate_sessionless_csrf(token)
+
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(token)
+
+
+def test_when_single_use_token_expired_then_exception(redis_client):
+    mgr = SignedCSRFTokenManager(redis_client, SIGNING_KEYS, single_use=True)
+    token = mgr.create_sessionless_csrf_token()
+    mgr.expire_sessionless_csrf_token(token)
+
+    with pytest.raises(CSRFInvalidException):
+        mgr.validate_sessionless_csrf(token)
+
+
+def test_when_not_single_use_then_token_reusable(redis_client):
+    mgr = SignedCSRFTokenManager(redis_client, SIGNING_KEYS)
+    token = mgr.create_sessionless_csrf_token()
+    mgr.validate_sessionless_csrf(token)
+    mgr.expire_sessionless_csrf_token(token)
+
+    mgr.validate_sessionless_csrf(token)
+
+
+def test_when_single_use_token_used_then_denylisted_for_remaining_lifetime(
+    redis_client,
+):
+    clock = FakeClock(now=1000)
+    mgr = SignedCSRFTokenManager(
+        redis_client, SIGNING_KEYS, single_use=True, clock=clock
+    )
+    token = mgr.create_sessionless_csrf_token()
+    clock.now += 100
+
+    mgr.validate_sessionless_csrf(token)
+    nonce = token.split(".")[2]
+    ttl = redis_client.ttl(f"{USED_CSRF_KEY_PREFIX}:{nonce}")
+    assert ttl == mgr.token_expiration_sec - 100
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,47 @@
+"""Microbenchmark for token generation
+
+Compares the previous per-character SystemRandom implementation of
+`BaseTokenManager.generate_token` against the buffered TokenGenerator with and
+without a per-thread pool.
+
+Usage:
+    python bottle_utils/tst/tokens/generator_bench.py [token_length] [iterations]
+
+"""
+import sys
+import random
+import string
+import timeit
+from bottle_utils.src.tokens.generator import TokenGenerator
+
+DEFAULT_LENGTH = 36
+DEFAULT_ITERATIONS = 100000
+
+
+def system_random_token(length):
+    return "".join(
+        random.SystemRandom().choice(
+            string.ascii_lowercase + string.ascii_uppercase + string.digits
+        )
+        for _ in range(length)
+    )
+
+
+def main(length=DEFAULT_LENGTH, iterations=DEFAULT_ITERATIONS):
+    candidates = {
+        "system_random": lambda: system_random_token(length),
+        "urandom_unpooled": lambda g=TokenGenerator(pool_size=0): g.generate(length),
+        "urandom_pooled": lambda g=TokenGenerator(): g.generate(length),
+    }
+
+    print(f"Generating {iterations} tokens of length {length}")
+    for name, fxn in candidates.items():
+        elapsed = min(timeit.repeat(fxn, number=iterations, repeat=3))
+        print(
+            f"{name:>18}: {elapsed / iterations * 1e6:8.2f} us/token "
+            f"{iterations / elapsed:12.0f} tokens/s"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
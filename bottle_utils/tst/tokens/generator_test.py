@@ -0,0 +1,34 @@
+import sys
+import pytest
+from collections import Counter
+from bottle_utils.src.tokens.generator import TokenGenerator, DEFAULT_TOKEN_ALPHABET
+
+
+@pytest.mark.parametrize("pool_size", [0, 64])
+def test_when_generated_then_length_and_alphabet_match(pool_size):
+    generator = TokenGenerator(pool_size=pool_size)
+    for length in (1, 20, 36, 200):
+        token = generator.generate(length)
+        assert len(token) == length
+        assert set(token) <= set(DEFAULT_TOKEN_ALPHABET)
+
+
+def test_when_generated_then_tokens_differ():
+    generator = TokenGenerator()
+    assert len({generator.generate(36) for _ in range(1000)}) == 1000
+
+
+def test_when_many_generated_then_characters_uniform():
+    generator = TokenGenerator(alphabet="abc")
+    counts = Counter(generator.generate(30000))
+    assert all(9000 < count < 11000 for count in counts.values())
+
+
+@pytest.mark.parametrize("alphabet", ["a", "aab", "αβγ"])
+def test_when_bad_alphabet_then_exception(alphabet):
+    with pytest.raises(ValueError):
+        TokenGenerator(alphabet=alphabet)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
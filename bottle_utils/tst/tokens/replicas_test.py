@@ -0,0 +1,166 @@
+import sys
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from redislite import Redis
+from bottle_utils.src.tokens.csrf import CSRFTokenManager
+from bottle_utils.src.tokens.replicas import RecentWrites
+from bottle_utils.src.tokens.session import SessionTokenManager
+from bottle_utils.src.tokens.verification import VerificationTokenManager
+from bottle_utils.tst.utils.local_dbs import redis_client
+from bottle_utils.tst.utils.clocks import FakeClock
+
+
+@pytest.fixture(scope="module")
+def replica_client(tmp_path_factory):
+    # A separate server that is never written to by the managers stands in for
+    # a replica lagging behind the primary
+    replica_client = Redis(str(tmp_path_factory.mktemp("replica") / "replica.db"))
+    yield replica_client
+    replica_client.shutdown()
+
+
+@pytest.fixture
+def user():
+    return SimpleNamespace(uuid=uuid4(), username="test", email="test@test.com")
+
+
+def test_when_window_elapsed_then_write_forgotten():
+    clock = FakeClock()
+    recent_writes = RecentWrites(window_sec=5, clock=clock)
+    recent_writes.add("token")
+    assert "token" in recent_writes
+
+    clock.now = 5
+    assert "token" not in recent_writes
+
+
+def test_when_full_then_oldest_write_forgotten():
+    recent_writes = RecentWrites(max_size=2)
+    for token in ("a", "b", "c"):
+        recent_writes.add(token)
+
+    assert "a" not in recent_writes
+    assert "b" in recent_writes and "c" in recent_writes
+
+
+def test_when_no_replica_then_reads_from_primary(redis_client):
+    mgr = CSRFTokenManager(redis_client)
+    assert mgr.get_read_client("token") is redis_client
+
+
+def test_when_token_not_written_recently_then_read_from_replica(
+    redis_client, replica_client
+):
+    mgr = VerificationTokenManager(redis_client, replica_client=replica_client)
+    token = mgr.generate_token()
+    replica_client.set(mgr.get_token_key(token), b'{"user_id":"replica"}')
+
+    assert mgr.does_token_exist(token)
+    assert mgr.get_token_data(token) == {"user_id": "replica"}
+    assert mgr.get_many([token]) == {token: {"user_id": "replica"}}
+    assert not redis_client.exists(mgr.get_token_key(token))
+
+
+def test_when_csrf_token_created_then_validated_against_primary(
+    redis_client, replica_client
+):
+    mgr = CSRFTokenManager(redis_client, replica_client=replica_client)
+    token = mgr.create_sessionless_csrf_token()
+
+    mgr.validate_sessionless_csrf(token)
+    assert not replica_client.exists(mgr.get_token_key(token))
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_session_created_then_read_your_writes(
+    redis_client, replica_client, user, hash_storage
+):
+    mgr = SessionTokenManager(
+        CSRFTokenManager(redis_client, replica_client=replica_client),
+        redis_client,
+        hash_storage=hash_storage,
+        replica_client=replica_client,
+    )
+    session = mgr.replace_user_session(user)
+
+    assert mgr.get_session_from_token(session.session_id).username == user.username
+    assert mgr.user_to_session_mapper.get_user_session(user) == session.session_id
+
+
+def test_when_session_expired_then_not_read_from_replica(
+    redis_client, replica_client, user
+):
+    mgr = SessionTokenManager(
+        CSRFTokenManager(redis_client), redis_client, replica_client=replica_client
+    )
+    session = mgr.create_session(user)
+    replica_client.set(
+        mgr.get_token_key(session.session_id), mgr.codec.encode(session.to_dict())
+    )
+
+    mgr.expire_token(session.session_id)
+    assert mgr.get_token_data(session.session_id) is None
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_replica_lags_other_worker_then_read_from_primary(
+    redis_client, replica_client, user, hash_storage
+):
+    def worker():
+        return SessionTokenManager(
+            CSRFTokenManager(redis_client, replica_client=replica_client),
+            redis_client,
+            hash_storage=hash_storage,
+            replica_client=replica_client,
+        )
+
+    # Logged in on one worker, redirected to another reading a lagging replica
+    session = worker().replace_user_session(user)
+    other = worker()
+    assert not replica_client.exists(other.get_token_key(session.session_id))
+
+    assert other.get_session_from_token(session.session_id).username == user.username
+    assert other.get_session_csrf_token(session.session_id) == session.csrf_token
+
+
+def test_when_replica_lacks_some_tokens_then_missing_read_from_primary(
+    redis_client, replica_client
+):
+    writer = CSRFTokenManager(redis_client, replica_client=replica_client)
+    reader = CSRFTokenManager(redis_client, replica_client=replica_client)
+    on_primary = writer.create_sessionless_csrf_token()
+    on_replica = reader.generate_token()
+    replica_client.set(reader.get_token_key(on_replica), b'""')
+
+    reader.validate_sessionless_csrf(on_primary)
+    assert reader.exists_many([on_primary, on_replica, "missing"]) == {
+        on_primary: True,
+        on_replica: True,
+        "missing": False,
+    }
+    assert reader.get_many([on_primary, on_replica, "missing"]) == {
+        on_primary: "",
+        on_replica: "",
+        "missing": None,
+    }
+
+
+def test_when_replica_read_near_expiry_then_primary_refreshed(
+    redis_client, replica_client, user
+):
+    mgr = SessionTokenManager(
+        CSRFTokenManager(redis_client), redis_client, replica_client=replica_client
+    )
+    session = mgr.build_session(user)
+    key = mgr.get_token_key(session.session_id)
+    data = mgr.codec.encode(session.to_dict())
+    redis_client.set(key, data, ex=10)
+    replica_client.set(key, data, ex=10)
+
+    assert mgr.get_session_from_token(session.session_id).username == user.username
+    assert redis_client.ttl(key) > 10
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -1,9 +1,212 @@
 import sys
+import time
 import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from redis.crc import key_slot
+from bottle_utils.src.tokens.cache import SessionCache
+from bottle_utils.src.tokens.codecs import JSON_CODEC, MSGPACK_CODEC
+from bottle_utils.src.tokens.csrf import CSRFTokenManager, CSRF_FIELD_NAME
+from bottle_utils.src.tokens.session import (
+    SESSION_HASH_TAG_LENGTH,
+    SESSION_TOKEN_LENGTH,
+    get_user_hash_tag,
+    InvalidSessionException,
+    SessionTokenManager,
+)
+from bottle_utils.tst.utils.local_dbs import redis_client
 
 
-def test_aws_login_without_aws_profile():
-    assert True
+@pytest.fixture
+def user():
+    return SimpleNamespace(uuid=uuid4(), username="test", email="test@test.com")
+
+
+def session_mgr(redis_client, **kwargs):
+    return SessionTokenManager(CSRFTokenManager(redis_client), redis_client, **kwargs)
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+@pytest.mark.parametrize("codec", [JSON_CODEC, MSGPACK_CODEC])
+def test_when_session_created_then_readable(redis_client, user, codec, hash_storage):
+    mgr = session_mgr(redis_client, codec=codec, hash_storage=hash_storage)
+    mgr.create_and_set_session(user)
+    session_id = mgr.user_to_session_mapper.get_user_session(user)
+
+    session = mgr.get_session_from_token(session_id)
+    assert session.username == user.username
+    assert session.user_uuid == user.uuid.hex
+
+
+def test_when_session_read_then_expiration_refreshed(redis_client, user):
+    mgr = session_mgr(redis_client)
+    session = mgr.create_session(user)
+    redis_client.expire(mgr.get_token_key(session.session_id), 10)
+
+    mgr.get_session_from_token(session.session_id)
+    assert redis_client.ttl(mgr.get_token_key(session.session_id)) > 10
+
+
+@pytest.mark.parametrize("old_codec", [JSON_CODEC, MSGPACK_CODEC])
+def test_when_session_replaced_then_old_session_invalid(redis_client, user, old_codec):
+    session_mgr(redis_client, codec=old_codec).create_and_set_session(user)
+    mgr = session_mgr(redis_client, session_cache=SessionCache())
+    old_session_id = mgr.user_to_session_mapper.get_user_session(user)
+    mgr.get_session_from_token(old_session_id)
+
+    mgr.create_and_set_session(user)
+    with pytest.raises(InvalidSessionException):
+        mgr.get_session_from_token(old_session_id)
+
+    new_session_id = mgr.user_to_session_mapper.get_user_session(user)
+    assert mgr.get_session_from_token(new_session_id).username == user.username
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_cluster_mode_then_user_session_keys_share_slot(
+    redis_client, user, hash_storage
+):
+    mgr = session_mgr(redis_client, hash_storage=hash_storage, hash_tag_key="secret")
+    mgr.cluster_mode = mgr.user_to_session_mapper.cluster_mode = True
+    old_session = mgr.replace_user_session(user)
+
+    session = mgr.replace_user_session(user)
+
+    session_key = mgr.get_token_key(session.session_id)
+    mapping_key = mgr.user_to_session_mapper.get_token_key(user.uuid)
+    assert "{" in session_key and "{" in mapping_key
+    assert key_slot(session_key.encode()) == key_slot(mapping_key.encode())
+    assert len(session.session_id) == SESSION_TOKEN_LENGTH
+    assert not redis_client.exists(mgr.get_token_key(old_session.session_id))
+    assert mgr.get_session_from_token(session.session_id).username == user.username
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_csrf_token_read_then_matches_session(redis_client, user, hash_storage):
+    mgr = session_mgr(redis_client, hash_storage=hash_storage)
+    session = mgr.create_session(user)
+
+    assert mgr.get_session_csrf_token(session.session_id) == session.csrf_token
+    with pytest.raises(InvalidSessionException):
+        mgr.get_session_fields("missing", [CSRF_FIELD_NAME])
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_settings_updated_then_persisted(redis_client, user, hash_storage):
+    mgr = session_mgr(redis_client, hash_storage=hash_storage)
+    session = mgr.create_session(user)
+
+    mgr.update_user_settings(session, {"theme": "dark"})
+    session = mgr.get_session_from_token(session.session_id)
+    assert session.user_settings == {"theme": "dark"}
+
+    mgr.expire_session(session)
+    with pytest.raises(InvalidSessionException):
+        mgr.update_user_settings(session, {"theme": "light"})
+    assert not redis_client.exists(mgr.get_token_key(session.session_id))
+
+
+@pytest.mark.parametrize("hash_storage", [False, True])
+def test_when_loaded_session_expired_then_user_mapping_removed(
+    redis_client, user, hash_storage
+):
+    mgr = session_mgr(redis_client, hash_storage=hash_storage)
+    session = mgr.replace_user_session(user)
+    mapping_key = mgr.user_to_session_mapper.get_token_key(user.uuid)
+    assert redis_client.exists(mapping_key)
+
+    # Loaded sessions hold the user uuid as a hex string
+    loaded = mgr.get_session_from_token(session.session_id)
+    assert loaded.user_uuid == user.uuid.hex
+    assert mgr.user_to_session_mapper.get_token_key(loaded.user_uuid) == mapping_key
+
+    mgr.expire_session(loaded)
+    assert not redis_client.exists(mapping_key)
+    assert not redis_client.exists(mgr.get_token_key(session.session_id))
+
+
+@pytest.mark.parametrize("written_as_hash", [False, True])
+def test_when_storage_mode_switched_then_existing_sessions_usable(
+    redis_client, user, written_as_hash
+):
+    writer = session_mgr(redis_client, hash_storage=written_as_hash)
+    reader = session_mgr(redis_client, hash_storage=not written_as_hash)
+    session = writer.create_session(user)
+
+    assert reader.get_session_from_token(session.session_id).email == user.email
+    assert reader.get_session_csrf_token(session.session_id) == session.csrf_token
+
+    reader.update_user_settings(session, {"theme": "dark"})
+    loaded = reader.get_session_from_token(session.session_id)
+    assert loaded.user_settings == {"theme": "dark"}
+
+    reader.expire_session(loaded)
+    with pytest.raises(InvalidSessionException):
+        reader.update_user_settings(session, {})
+
+
+def test_user_hash_tag_does_not_depend_on_uuid_form(user):
+    tag = get_user_hash_tag(user.uuid, "secret")
+    assert get_user_hash_tag(user.uuid.hex, "secret") == tag
+    assert get_user_hash_tag(str(user.uuid), b"secret") == tag
+
+
+def test_user_hash_tag_depends_on_key(user):
+    tag = get_user_hash_tag(user.uuid, "secret")
+
+    assert len(tag) == SESSION_HASH_TAG_LENGTH
+    assert get_user_hash_tag(user.uuid, "other secret") != tag
+
+
+def test_when_cluster_mode_without_hash_tag_key_then_exception(
+    redis_client, monkeypatch
+):
+    monkeypatch.setattr(
+        "bottle_utils.src.tokens.token_manager.is_cluster_client", lambda client: True
+    )
+    with pytest.raises(ValueError):
+        session_mgr(redis_client)
+
+
+def test_when_session_expired_then_invalid(redis_client, user):
+    mgr = session_mgr(redis_client)
+    session = mgr.create_session(user)
+
+    mgr.expire_session(session)
+    with pytest.raises(InvalidSessionException):
+        mgr.get_session_from_token(session.session_id)
+
+
+@pytest.mark.parametrize(
+    "expire",
+    [
+        lambda mgr, session: mgr.expire_session(session),
+        lambda mgr, session: mgr.expire_token(session.session_id),
+        lambda mgr, session: mgr.expire_many([session.session_id]),
+    ],
+)
+def test_when_session_expired_by_other_worker_then_cached_copy_invalidated(
+    redis_client, user, expire
+):
+    cache = SessionCache(ttl_sec=60)
+    cache.listen(redis_client)
+    try:
+        cached_mgr = session_mgr(redis_client, session_cache=cache)
+        other_mgr = session_mgr(redis_client)
+        session = other_mgr.create_session(user)
+        cached_mgr.get_session_from_token(session.session_id)
+        assert cache.get(session.session_id) is not None
+
+        expire(other_mgr, session)
+        deadline = time.monotonic() + 5
+        while cache.stats()["size"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with pytest.raises(InvalidSessionException):
+            cached_mgr.get_session_from_token(session.session_id)
+
+    finally:
+        cache.stop()
 
 
 if __name__ == "__main__":
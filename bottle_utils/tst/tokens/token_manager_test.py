@@ -1,9 +1,112 @@
 import sys
 import pytest
+from bottle_utils.src.tokens.refresh import ThresholdRefreshPolicy
+from bottle_utils.src.tokens.token_manager import BaseTokenManager
+from bottle_utils.tst.utils.local_dbs import redis_client
 
+TEST_EXPIRATION_SEC = 1000
 
-def test_aws_login_without_aws_profile():
-    assert True
+
+def token_mgr(redis_client, **kwargs):
+    return BaseTokenManager(20, TEST_EXPIRATION_SEC, "test", redis_client, **kwargs)
+
+
+def test_when_token_read_then_expiration_refreshed(redis_client):
+    mgr = token_mgr(redis_client)
+    mgr.set_token_data("refreshed", {"a": 1})
+    redis_client.expire(mgr.get_token_key("refreshed"), 900)
+
+    assert mgr.get_and_refresh_token_data("refreshed") == {"a": 1}
+    assert redis_client.ttl(mgr.get_token_key("refreshed")) == TEST_EXPIRATION_SEC
+
+
+@pytest.mark.parametrize("remaining_sec, refreshed", [(900, False), (400, True)])
+def test_when_threshold_policy_then_refreshed_below_threshold(
+    redis_client, remaining_sec, refreshed
+):
+    mgr = token_mgr(redis_client, refresh_policy=ThresholdRefreshPolicy(0.5))
+    mgr.set_token_fields("threshold", {"a": 1})
+    redis_client.expire(mgr.get_token_key("threshold"), remaining_sec)
+
+    assert mgr.get_and_refresh_token_fields("threshold") == {"a": 1}
+    ttl = redis_client.ttl(mgr.get_token_key("threshold"))
+    assert (ttl == TEST_EXPIRATION_SEC) == refreshed
+
+
+def test_when_token_missing_then_none(redis_client):
+    mgr = token_mgr(redis_client)
+    assert mgr.get_and_refresh_token_data("missing") is None
+    assert mgr.get_and_refresh_token_fields("missing") is None
+
+
+def test_when_token_refreshed_then_prefixed_key_expiration_reset(redis_client):
+    mgr = token_mgr(redis_client)
+    mgr.set_token_data("prefixed", {"a": 1})
+    redis_client.expire(mgr.get_token_key("prefixed"), 900)
+
+    mgr.refresh_token("prefixed")
+    assert redis_client.ttl(mgr.get_token_key("prefixed")) == TEST_EXPIRATION_SEC
+    assert not redis_client.exists("prefixed")
+
+
+def test_when_token_read_and_refreshed_then_single_round_trip(
+    redis_client, monkeypatch
+):
+    mgr = token_mgr(redis_client)
+    mgr.set_token_data("round-trip", {"a": 1})
+    mgr.get_and_refresh_token_data("round-trip")
+
+    commands = []
+    execute_command = redis_client.execute_command
+
+    def record_command(*args, **kwargs):
+        commands.append(args[0])
+        return execute_command(*args, **kwargs)
+
+    monkeypatch.setattr(redis_client, "execute_command", record_command)
+    assert mgr.get_and_refresh_token_data("round-trip") == {"a": 1}
+    assert len(commands) == 1
+
+
+def test_when_tokens_set_in_bulk_then_per_token_ttls(redis_client):
+    mgr = token_mgr(redis_client)
+    mgr.set_many({"bulk-a": "a", "bulk-b": "b"}, {"bulk-a": 10})
+
+    assert redis_client.ttl(mgr.get_token_key("bulk-a")) == 10
+    assert redis_client.ttl(mgr.get_token_key("bulk-b")) == TEST_EXPIRATION_SEC
+
+    mgr.set_many({"bulk-a": "a", "bulk-b": "b"}, 20)
+    assert redis_client.ttl(mgr.get_token_key("bulk-a")) == 20
+    assert redis_client.ttl(mgr.get_token_key("bulk-b")) == 20
+
+
+def test_when_bulk_operations_then_all_tokens_affected(redis_client):
+    mgr = token_mgr(redis_client)
+    mgr.set_many({"bulk-a": "a", "bulk-b": "b"})
+
+    assert mgr.get_many(["bulk-a", "bulk-b", "bulk-c"]) == {
+        "bulk-a": "a",
+        "bulk-b": "b",
+        "bulk-c": None,
+    }
+    assert mgr.exists_many(["bulk-a", "bulk-c"]) == {"bulk-a": True, "bulk-c": False}
+    assert mgr.expire_many(["bulk-a", "bulk-b", "bulk-c"]) == 2
+    assert mgr.exists_many(["bulk-a", "bulk-b"]) == {"bulk-a": False, "bulk-b": False}
+
+
+def test_when_bulk_operations_empty_then_no_op(redis_client):
+    mgr = token_mgr(redis_client)
+
+    assert mgr.get_many([]) == {}
+    assert mgr.exists_many([]) == {}
+    assert mgr.expire_many([]) == 0
+    mgr.set_many({})
+
+
+@pytest.mark.parametrize("fraction", [0, 1.5])
+def test_when_bad_refresh_fraction_then_exception(fraction):
+    with pytest.raises(ValueError):
+        ThresholdRefreshPolicy(fraction)
 
 
 if __name__ == "__main__":
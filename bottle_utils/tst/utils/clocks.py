@@ -0,0 +1,11 @@
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
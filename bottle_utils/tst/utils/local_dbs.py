@@ -1,3 +1,4 @@
+import pytest
 from redislite import Redis
 
 TEST_REDIS_FILENAME = "test_redis.db"
@@ -5,3 +6,10 @@ TEST_REDIS_FILENAME = "test_redis.db"
 
 def get_test_redis():
     return Redis(TEST_REDIS_FILENAME)
+
+
+@pytest.fixture(scope="module")
+def redis_client():
+    redis_client = get_test_redis()
+    yield redis_client
+    redis_client.flushdb()
@@ -0,0 +1,222 @@
+import io
+import sys
+import pytest
+from bottle import Bottle
+from redis import StrictRedis
+from structlog.testing import capture_logs
+from bottle_utils.src.counters.policies import RateLimitAlgorithm, RateLimitPolicy
+from bottle_utils.src.counters.rate_limiting import RateLimitCounterManager
+from bottle_utils.src.wrappers.rates import (
+    DEFAULT_MAX_RATE_PER_SECOND,
+    RateLimitPlugin,
+    _get_marked_callback,
+    rate_limit,
+)
+from bottle_utils.tst.utils.local_dbs import redis_client
+
+
+def call(app, path, remote_addr="10.0.0.1"):
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "REMOTE_ADDR": remote_addr,
+        "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": io.StringIO(),
+    }
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+        result["headers"] = {name.lower(): value for name, value in headers}
+
+    b"".join(app(environ, start_response))
+    return result["status"], result["headers"]
+
+
+def unwrapped_decorator(fxn):
+    # Like session_auth, does not use functools.wraps
+    def wrapper(*args, **kwargs):
+        return fxn(*args, **kwargs)
+
+    return wrapper
+
+
+def make_app(redis_client, **plugin_kwargs):
+    redis_client.flushdb()
+    app = Bottle()
+    app.rate_limit_mgr = RateLimitCounterManager(redis_client)
+    app.install(RateLimitPlugin(**plugin_kwargs))
+
+    @app.get("/config", rate_limit=RateLimitPolicy(2, period_sec=60))
+    def config_limited():
+        return "ok"
+
+    @app.get("/decorated")
+    @rate_limit(RateLimitPolicy(1, period_sec=60, algorithm=RateLimitAlgorithm.GCRA))
+    def decorated():
+        return "ok"
+
+    @app.get(
+        "/multi",
+        rate_limit=[
+            RateLimitPolicy(5, period_sec=1),
+            RateLimitPolicy(2, period_sec=60),
+        ],
+    )
+    def multi_window():
+        return "ok"
+
+    @app.get("/stacked")
+    @rate_limit(RateLimitPolicy(1, period_sec=60))
+    @unwrapped_decorator
+    def stacked():
+        return "ok"
+
+    @app.get("/default")
+    @rate_limit
+    def default():
+        return "ok"
+
+    @app.get("/unlimited")
+    def unlimited():
+        return "ok"
+
+    @app.get("/excluded", rate_limit=False)
+    def excluded():
+        return "ok"
+
+    @app.get("/marked-excluded")
+    @rate_limit(False)
+    def marked_excluded():
+        return "ok"
+
+    return app
+
+
+def test_when_limit_exceeded_then_429_with_headers(redis_client):
+    app = make_app(redis_client)
+
+    first = call(app, "/config")
+    call(app, "/config")
+    status, headers = call(app, "/config")
+
+    assert first[0] == 200
+    assert first[1]["ratelimit-limit"] == "2"
+    assert first[1]["ratelimit-remaining"] == "1"
+    assert 0 < int(first[1]["ratelimit-reset"]) <= 60
+    assert status == 429
+    assert headers["ratelimit-remaining"] == "0"
+    assert 0 < int(headers["retry-after"]) <= 60
+
+
+def test_when_route_decorated_then_decorator_policy_applied(redis_client):
+    app = make_app(redis_client)
+
+    assert call(app, "/decorated")[0] == 200
+    assert call(app, "/decorated")[0] == 429
+    assert call(app, "/decorated", remote_addr="10.0.0.2")[0] == 200
+
+
+def test_when_marker_above_unwrapped_decorator_then_policy_applied(redis_client):
+    app = make_app(redis_client)
+
+    assert [call(app, "/stacked")[0] for _ in range(2)] == [200, 429]
+
+
+def test_when_marker_below_unwrapped_decorator_then_found():
+    @unwrapped_decorator
+    @rate_limit(3)
+    def handler():
+        return "ok"
+
+    assert _get_marked_callback(handler).rate_limit_policy == 3
+
+
+def test_when_marked_without_plugin_then_error_logged_once(monkeypatch):
+    errors = []
+    monkeypatch.setattr(
+        "bottle_utils.src.wrappers.rates.log.error",
+        lambda *args, **kwargs: errors.append(args),
+    )
+    app = Bottle()
+
+    @app.get("/marked")
+    @rate_limit(1)
+    def marked():
+        return "ok"
+
+    assert [call(app, "/marked")[0] for _ in range(2)] == [200, 200]
+    assert len(errors) == 1
+
+
+def test_when_multi_window_exceeded_then_tripped_window_headers(redis_client):
+    app = make_app(redis_client)
+
+    call(app, "/multi")
+    call(app, "/multi")
+    status, headers = call(app, "/multi")
+
+    assert status == 429
+    assert headers["ratelimit-limit"] == "2"
+    assert 58 < int(headers["retry-after"]) <= 60
+
+
+def test_when_no_policy_then_default_policy_unless_excluded(redis_client):
+    app = make_app(redis_client)
+    status, headers = call(app, "/unlimited")
+    assert status == 200
+    assert "ratelimit-limit" not in headers
+
+    app = make_app(redis_client, default_policy=1)
+    assert [call(app, "/unlimited")[0] for _ in range(2)] == [200, 429]
+    assert [call(app, "/excluded")[0] for _ in range(2)] == [200, 200]
+    assert [call(app, "/marked-excluded")[0] for _ in range(2)] == [200, 200]
+
+
+def test_when_route_marked_without_policy_then_default_limit(redis_client):
+    app = make_app(redis_client)
+    statuses = [
+        call(app, "/default")[0] for _ in range(DEFAULT_MAX_RATE_PER_SECOND + 1)
+    ]
+    assert statuses == [200] * DEFAULT_MAX_RATE_PER_SECOND + [429]
+
+    app = make_app(redis_client, default_policy=1)
+    assert [call(app, "/default")[0] for _ in range(2)] == [200, 429]
+
+
+@pytest.mark.parametrize("fail_open, expected_status", [(True, 200), (False, 500)])
+def test_when_counter_store_unavailable_then_manager_policy_applied(
+    redis_client, tmp_path, fail_open, expected_status
+):
+    app = make_app(redis_client)
+    app.rate_limit_mgr = RateLimitCounterManager(
+        StrictRedis(unix_socket_path=str(tmp_path / "missing.sock")),
+        fail_open=fail_open,
+    )
+
+    assert call(app, "/config")[0] == expected_status
+
+
+def test_when_hybrid_then_rejected_locally(redis_client):
+    app = make_app(redis_client, hybrid=True)
+
+    assert [call(app, "/config")[0] for _ in range(3)] == [200, 200, 429]
+
+
+def test_when_hybrid_and_not_fixed_window_then_checked_in_redis(redis_client):
+    app = make_app(redis_client, hybrid=True)
+
+    with capture_logs() as logs:
+        assert call(app, "/decorated")[0] == 200
+        assert call(app, "/decorated")[0] == 429
+
+    assert [log["route"] for log in logs if log["log_level"] == "warning"] == [
+        "/decorated"
+    ]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))